@@ -40,7 +40,10 @@ from functions import (
     login_form, signup_form,
     save_user_data, get_timestamp, load_user_data
 )
-from app import load_embedding_model, load_mistral_model, generate_response
+from app import (
+    load_answer_cache, load_embedding_model, load_generation_scheduler, load_lexical_index, load_mistral_model,
+    load_prompt_prefix_cache, load_source_router, load_speculative_decoding, generate_response, StreamingResponse
+)
 
 # Rest of your code remains the same
 
@@ -59,6 +62,58 @@ def init_models():
         st.error(f"Model initialization failed: {e}")
         return None, None, None
 
+@st.cache_resource(show_spinner="Loading lexical index...")
+def init_lexical_index():
+    """
+    Initialize and cache the BM25 index used for hybrid retrieval.
+    Returns:
+        BM25Index or None: Lexical index, or None when it has not been built.
+    """
+    try:
+        return load_lexical_index()
+    except (OSError, ValueError) as e:
+        print(f"⚠ Lexical index unavailable: {e}")
+        return None
+
+@st.cache_resource(show_spinner="Loading answer cache...")
+def init_answer_cache():
+    """
+    Initialize and cache the semantic answer cache.
+    Returns:
+        SemanticAnswerCache or None: Answer cache, or None when it cannot be opened.
+    """
+    try:
+        return load_answer_cache()
+    except (OSError, ValueError) as e:
+        print(f"⚠ Answer cache unavailable: {e}")
+        return None
+
+@st.cache_resource(show_spinner="Loading source router...")
+def init_source_router():
+    """
+    Initialize and cache the router that scopes retrieval to the relevant manuals.
+    Returns:
+        SourceRouter or None: Router, or None when the indexed sources are unknown.
+    """
+    try:
+        return load_source_router()
+    except (OSError, ValueError) as e:
+        print(f"⚠ Source routing unavailable: {e}")
+        return None
+
+@st.cache_resource(show_spinner="Starting generation scheduler...")
+def init_generation_scheduler():
+    """
+    Initialize and cache the scheduler that batches generation across all sessions.
+    Returns:
+        GenerationScheduler or None: Scheduler, or None when the model failed to load.
+    """
+    model_pipeline = init_models()[2]
+    if model_pipeline is None:
+        return None
+    return load_generation_scheduler(model_pipeline, prefix_cache=load_prompt_prefix_cache(model_pipeline),
+                                     speculative=load_speculative_decoding(model_pipeline))
+
 # ------------- CONFIG & CONSTANTS ------------- 
 USER_DB_PATH = "user_data.json"
 
@@ -66,6 +121,8 @@ USER_DB_PATH = "user_data.json"
 def initialize_app():
     """Initialize the application configuration and session state."""
     st.session_state.use_web = True
+    if 'use_answer_cache' not in st.session_state:
+        st.session_state.use_answer_cache = True
     # Initialize models_loaded flag
     if 'models_loaded' not in st.session_state:
         st.session_state.models_loaded = False
@@ -123,9 +180,13 @@ def initialize_app():
     apply_matlab_theme(st.session_state.theme)
 
 def get_bot_response(user_input):
-    """Generate a response from the bot based on user input."""
+    """
+    Generate a response from the bot based on user input.
+    Returns:
+        tuple: StreamingResponse (or an error message string) and the metadata of the sources used.
+    """
     if not user_input:
-        return "Please provide a question or input."
+        return "Please provide a question or input.", []
         
     # Check for model initialization
     if 'embedding_model' not in st.session_state or 'vectorstore' not in st.session_state or 'model_pipeline' not in st.session_state:
@@ -134,10 +195,10 @@ def get_bot_response(user_input):
             st.session_state.models_loaded = all([st.session_state.embedding_model, st.session_state.vectorstore, st.session_state.model_pipeline])
         except RuntimeError as e:
             st.error(f"Error initializing models: {e}")
-            return f"I encountered an error initializing the models: {e}"
+            return f"I encountered an error initializing the models: {e}", []
     
     if not st.session_state.models_loaded:
-        return "Models failed to load. Please check the logs and try again."
+        return "Models failed to load. Please check the logs and try again.", []
         
     try:
          # Adding the NLP processing for the User input
@@ -153,13 +214,19 @@ def get_bot_response(user_input):
             embedding_model=st.session_state.embedding_model,
             vectorstore=st.session_state.vectorstore,
             model_pipeline=st.session_state.model_pipeline,
-            use_web_search=st.session_state.use_web
+            use_web_search=st.session_state.use_web,
+            lexical_index=init_lexical_index(),
+            answer_cache=init_answer_cache(),
+            bypass_cache=not st.session_state.use_answer_cache,
+            source_router=init_source_router(),
+            stream=True,
+            scheduler=init_generation_scheduler()
         )
         print(metaData) #debug
         return response,metaData
     except Exception as e:
         st.error(f"Error generating response: {str(e)}")
-        return f"I encountered an error: {str(e)}"
+        return f"I encountered an error: {str(e)}", []
 
 # ------------- UI COMPONENTS ------------- 
 def render_sidebar():
@@ -536,6 +603,32 @@ def render_auth_interface():
 
 # =========================================================================
 
+def user_message_html(content, timestamp):
+    """HTML of a user chat bubble."""
+    return f"""
+    <div class="chat-message user-message">
+        <div class="avatar user-avatar">U</div>
+        <div class="message-content">
+            <p>{content}</p>
+            <div class="chat-timestamp">{timestamp}</div>
+        </div>
+    </div>
+    """
+
+def bot_message_html(formatted_content, timestamp, metadata_html=""):
+    """HTML of a MatBot chat bubble."""
+    return f"""
+    <div class="chat-message bot-message">
+        <div class="avatar bot-avatar">M</div>
+        <div class="message-content">
+            <div class="response-header" style="font-weight: bold; color: {'#0076A8' if st.session_state.theme == 'light' else '#0097E6'};">🤖 MatBot:</div>
+            <div class="response-content">{formatted_content}
+            {metadata_html}</div>
+            <div class="chat-timestamp">{timestamp}</div>
+        </div>
+    </div>
+    """
+
 def render_chat_history():
     """Render messages for the currently selected chat only, with special formatting for MATLAB code."""
     current_session = st.session_state.current_session
@@ -623,15 +716,7 @@ def render_chat_history():
         for message in messages:
             if message['role'] == 'user':
                 # User message
-                st.markdown(f"""
-                <div class="chat-message user-message">
-                    <div class="avatar user-avatar">U</div>
-                    <div class="message-content">
-                        <p>{message['content']}</p>
-                        <div class="chat-timestamp">{message['timestamp']}</div>
-                    </div>
-                </div>
-                """, unsafe_allow_html=True)
+                st.markdown(user_message_html(message['content'], message['timestamp']), unsafe_allow_html=True)
             else:
                 # Format the bot response content
                 content = message['content']
@@ -721,17 +806,8 @@ def render_chat_history():
                         metadata_html = ""
 
                 # Render the complete bot message with cleaner HTML structure
-                st.markdown(f"""
-                <div class="chat-message bot-message">
-                    <div class="avatar bot-avatar">M</div>
-                    <div class="message-content">
-                        <div class="response-header" style="font-weight: bold; color: {'#0076A8' if st.session_state.theme == 'light' else '#0097E6'};">🤖 MatBot:</div>
-                        <div class="response-content">{formatted_content}
-                        {metadata_html}</div>
-                        <div class="chat-timestamp">{message['timestamp']}</div>
-                    </div>
-                </div>
-                """, unsafe_allow_html=True)
+                st.markdown(bot_message_html(formatted_content, message['timestamp'], metadata_html),
+                            unsafe_allow_html=True)
 
         # Close the chat container
         st.markdown('</div>', unsafe_allow_html=True)
@@ -784,6 +860,8 @@ def render_chat_input():
 
     # Web Search toggle (moved outside the form)
     st.session_state.use_web = st.toggle("🌐 Web Search", value=st.session_state.use_web)
+    st.session_state.use_answer_cache = st.toggle("♻️ Reuse Cached Answers", value=st.session_state.use_answer_cache,
+                                                  help="Turn off to always generate a fresh answer")
     
     # Add border to toggle
     st.markdown(f"""
@@ -1346,17 +1424,30 @@ def process_user_input(user_input):
         'timestamp': get_timestamp()
     })
     
-    # Generate bot response with the full context
+    # Show the question right away; the history is redrawn on the next run
+    st.markdown(user_message_html(display_input, get_timestamp()), unsafe_allow_html=True)
+
+    # Retrieval runs under the spinner, then the answer is rendered as it is generated
     with st.spinner("MATBOT is thinking..."):
         bot_response, metadata = get_bot_response(user_input)
-        
-        # Add bot response with metadata
-        st.session_state.sessions[current_session].append({
-            'role': 'assistant',
-            'content': bot_response,
-            'timestamp': get_timestamp(),
-            'metadata': metadata
-        })
+    if isinstance(bot_response, StreamingResponse):
+        placeholder = st.empty()
+        try:
+            for _ in bot_response:
+                placeholder.markdown(bot_message_html(bot_response.text + "▌", get_timestamp()),
+                                     unsafe_allow_html=True)
+            bot_response = bot_response.response
+        except Exception as e:
+            st.error(f"Error generating response: {str(e)}")
+            bot_response = bot_response.text or f"I encountered an error: {str(e)}"
+
+    # Add bot response with metadata
+    st.session_state.sessions[current_session].append({
+        'role': 'assistant',
+        'content': bot_response,
+        'timestamp': get_timestamp(),
+        'metadata': metadata
+    })
     
     # Save user data if logged in
     if st.session_state.logged_in:
@@ -0,0 +1,201 @@
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import resource
+import tempfile
+import subprocess
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from ingest import UPSERT_BATCH_SIZE, StageTimer, build_index, list_input_files
+
+# -------------------- Sample Corpus --------------------
+def make_sample(input_dir: str, sample_dir: str, files: int, pages: Optional[int],
+                extensions: Tuple[str, ...]) -> List[str]:
+    """
+    Builds a small corpus for quick runs from the smallest input files.
+    Args:
+        input_dir (str): Full documentation directory.
+        sample_dir (str): Directory the sample is written to.
+        files (int): Number of files to keep.
+        pages (Optional[int]): Keep only the first pages of every PDF; None keeps all pages.
+        extensions (Tuple[str, ...]): Accepted file extensions.
+    Returns:
+        List[str]: Sampled file names.
+    """
+    import fitz  # PyMuPDF
+
+    candidates = sorted(list_input_files(input_dir, extensions),
+                        key=lambda file: os.path.getsize(os.path.join(input_dir, file)))[:files]
+    os.makedirs(sample_dir, exist_ok=True)
+    for file in candidates:
+        source, target = os.path.join(input_dir, file), os.path.join(sample_dir, file)
+        if pages and file.endswith(".pdf"):
+            with fitz.open(source) as pdf, fitz.open() as sample:
+                sample.insert_pdf(pdf, to_page=min(pages, pdf.page_count) - 1)
+                sample.save(target)
+        else:
+            shutil.copyfile(source, target)
+    return candidates
+
+# -------------------- Measurements --------------------
+def dir_size(path: str) -> int:
+    """Total size in bytes of the files under a directory."""
+    total = 0
+    for root, _, files in os.walk(path):
+        total += sum(os.path.getsize(os.path.join(root, file)) for file in files)
+    return total
+
+def peak_rss_mb() -> Dict[str, float]:
+    """
+    Peak resident memory of this process and of its finished extraction workers (Linux reports KiB).
+    The peak covers the whole process, so compare settings in separate invocations when memory matters.
+    """
+    scale = 1 / (1024 * 1024) if sys.platform == "darwin" else 1 / 1024
+    return {
+        "self": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * scale,
+        "workers": resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss * scale,
+    }
+
+def git_commit() -> Optional[str]:
+    """Current commit of the repository, so results can be compared between commits."""
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True, text=True, check=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def summarize_batches(batches: List[Tuple[int, float]]) -> Dict:
+    """Throughput statistics of the embedding batches."""
+    if not batches:
+        return {"batches": 0}
+    sizes = np.array([size for size, _ in batches], dtype=np.float64)
+    seconds = np.array([elapsed for _, elapsed in batches], dtype=np.float64)
+    per_batch = sizes / np.maximum(seconds, 1e-9)
+    return {
+        "batches": len(batches),
+        "mean_batch_size": float(sizes.mean()),
+        "chunks_per_s": float(sizes.sum() / max(seconds.sum(), 1e-9)),
+        "batch_chunks_per_s_p50": float(np.percentile(per_batch, 50)),
+        "batch_chunks_per_s_p5": float(np.percentile(per_batch, 5)),
+        "batch_seconds_p95": float(np.percentile(seconds, 95)),
+    }
+
+def run_benchmark(input_dir: str, output_dir: str, chunk_size: int, chunk_overlap: int,
+                  extensions: Tuple[str, ...], **build_kwargs) -> Dict:
+    """
+    Runs one full rebuild and reports where the time went.
+    Args:
+        input_dir (str): Corpus to index.
+        output_dir (str): Fresh output directory for this run.
+        chunk_size (int): Splitter chunk size.
+        chunk_overlap (int): Splitter chunk overlap.
+        extensions (Tuple[str, ...]): Accepted file extensions.
+        **build_kwargs: Remaining build_index arguments (workers, batch_size, splitter, ...).
+    Returns:
+        Dict: Per-stage wall times, throughput, peak memory and index size.
+    """
+    timer = StageTimer()
+    started = time.perf_counter()
+    manifest = build_index(input_dir, output_dir, chunk_size, chunk_overlap, extensions=extensions,
+                           full_rebuild=True, timer=timer, **build_kwargs)
+    wall = time.perf_counter() - started
+    chunks = sum(len(entry["chunk_ids"]) for entry in manifest["files"].values())
+    return {
+        "chunk_size": chunk_size,
+        "chunk_overlap": chunk_overlap,
+        "settings": {key: value for key, value in build_kwargs.items() if key != "embedding_cache_dir"},
+        "files": len(manifest["files"]),
+        "chunks": chunks,
+        "wall_seconds": wall,
+        "chunks_per_s": chunks / wall if wall > 0 else 0.0,
+        "stages": {name: {"seconds": seconds, "calls": timer.calls[name]} for name, seconds in timer.seconds.items()},
+        "embedding": summarize_batches(timer.embed_batches),
+        "peak_rss_mb": peak_rss_mb(),
+        "index_bytes": {
+            name: dir_size(os.path.join(output_dir, name))
+            for name in ("chroma_index", "chunk_store") if os.path.exists(os.path.join(output_dir, name))
+        },
+    }
+
+def print_report(result: Dict) -> None:
+    """Prints a human-readable summary of one run."""
+    print(f"\n📊 chunk {result['chunk_size']}/{result['chunk_overlap']}: {result['chunks']} chunks from "
+          f"{result['files']} files in {result['wall_seconds']:.1f}s ({result['chunks_per_s']:.1f} chunks/s)")
+    for name, stage in sorted(result["stages"].items(), key=lambda item: -item[1]["seconds"]):
+        share = 100 * stage["seconds"] / result["wall_seconds"] if result["wall_seconds"] else 0.0
+        print(f"   {name:<11} {stage['seconds']:8.2f}s  {share:5.1f}%")
+    embedding = result["embedding"]
+    if embedding["batches"]:
+        print(f"   🧠 {embedding['batches']} embedding batches, {embedding['chunks_per_s']:.1f} chunks/s "
+              f"(p50 batch {embedding['batch_chunks_per_s_p50']:.1f} chunks/s)")
+    print(f"   💾 peak RSS {result['peak_rss_mb']['self']:.0f} MB (workers {result['peak_rss_mb']['workers']:.0f} MB), "
+          + ", ".join(f"{name} {size / 1e6:.1f} MB" for name, size in result["index_bytes"].items()))
+
+def parse_chunk_settings(value: str) -> List[Tuple[int, int]]:
+    """Parses "512:64,1024:192" into [(512, 64), (1024, 192)]."""
+    settings = []
+    for item in value.split(","):
+        size, _, overlap = item.partition(":")
+        settings.append((int(size), int(overlap or 0)))
+    return settings
+
+# Guarded so spawned extraction workers do not re-run the benchmark
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the ingestion pipeline stage by stage.")
+    parser.add_argument("--input", default="data/DatasetMatlab", help="Directory containing the PDFs and TXT files")
+    parser.add_argument("--chunks", type=parse_chunk_settings, default=[(1024, 192)],
+                        help="Chunk size:overlap settings to compare, e.g. 512:64,1024:192")
+    parser.add_argument("--extensions", default=".pdf,.txt", help="Comma-separated file extensions to index")
+    parser.add_argument("--sample", type=int, default=None,
+                        help="Quick run over the N smallest files instead of the whole corpus")
+    parser.add_argument("--sample-pages", type=int, default=50,
+                        help="Pages kept per PDF in sample mode (0 keeps every page)")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="Number of PDF extraction processes")
+    parser.add_argument("--batch-size", type=int, default=UPSERT_BATCH_SIZE, help="Chunks embedded per batch")
+    parser.add_argument("--splitter", choices=("recursive", "matlab"), default="recursive")
+    parser.add_argument("--dedup-threshold", type=float, default=None, help="Benchmark with deduplication enabled")
+    parser.add_argument("--embedding-cache", default=None,
+                        help="Embedding cache directory (default: none, so every run embeds from scratch)")
+    parser.add_argument("--json", default=None, help="Write the results to this JSON file")
+    parser.add_argument("--keep-output", action="store_true", help="Keep the indexes built by each run")
+    args = parser.parse_args()
+
+    extensions = tuple(extension.strip() for extension in args.extensions.split(","))
+    work_dir = tempfile.mkdtemp(prefix="matbot-ingest-bench-")
+    input_dir = args.input
+    if args.sample:
+        input_dir = os.path.join(work_dir, "sample")
+        sampled = make_sample(args.input, input_dir, args.sample, args.sample_pages or None, extensions)
+        print(f"🧪 Sample mode: {', '.join(sampled)}")
+
+    results = []
+    try:
+        for chunk_size, chunk_overlap in args.chunks:
+            output_dir = os.path.join(work_dir, f"output-{chunk_size}-{chunk_overlap}")
+            result = run_benchmark(input_dir, output_dir, chunk_size, chunk_overlap, extensions,
+                                   workers=args.workers, batch_size=args.batch_size, splitter=args.splitter,
+                                   dedup_threshold=args.dedup_threshold, embedding_cache_dir=args.embedding_cache)
+            results.append(result)
+            print_report(result)
+    finally:
+        if args.keep_output:
+            print(f"📁 Indexes kept in: {work_dir}")
+        else:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+    report = {
+        "commit": git_commit(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "input": args.input,
+        "sample": {"files": args.sample, "pages": args.sample_pages} if args.sample else None,
+        "runs": results,
+    }
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+        print(f"✅ Results written to: {args.json}")
@@ -0,0 +1,141 @@
+import os
+import re
+import hashlib
+from typing import Dict, Iterable, List, Optional, Set
+
+import numpy as np
+
+MERSENNE_PRIME = np.uint64((1 << 61) - 1)
+MAX_HASH = np.uint64((1 << 32) - 1)
+NUM_PERM = 64
+BANDS = 8  # 8 bands of 8 rows: candidate pairs start around Jaccard 0.77
+SHINGLE_SIZE = 4
+DEFAULT_THRESHOLD = 0.8
+
+# -------------------- MinHash --------------------
+def shingles(text: str, size: int = SHINGLE_SIZE) -> List[str]:
+    """
+    Splits text into overlapping word n-grams after lowercasing and dropping punctuation.
+    Args:
+        text (str): Chunk text.
+        size (int): Words per shingle.
+    Returns:
+        List[str]: Shingles (the whole text as one shingle if it is shorter than `size`).
+    """
+    words = re.findall(r"\w+", text.lower())
+    if len(words) < size:
+        return [" ".join(words)]
+    return [" ".join(words[i:i + size]) for i in range(len(words) - size + 1)]
+
+class MinHasher:
+    """Computes MinHash signatures with `num_perm` universal hash permutations."""
+
+    def __init__(self, num_perm: int = NUM_PERM, seed: int = 1):
+        rng = np.random.RandomState(seed)
+        self.num_perm = num_perm
+        self.a = rng.randint(1, 1 << 31, size=num_perm, dtype=np.uint64)
+        self.b = rng.randint(0, 1 << 31, size=num_perm, dtype=np.uint64)
+
+    def signature(self, text: str) -> np.ndarray:
+        """
+        Computes the MinHash signature of a text.
+        Args:
+            text (str): Chunk text.
+        Returns:
+            np.ndarray: uint32 signature of length num_perm.
+        """
+        hashes = np.fromiter(
+            (int.from_bytes(hashlib.blake2b(s.encode("utf-8"), digest_size=4).digest(), "little")
+             for s in set(shingles(text))),
+            dtype=np.uint64
+        )
+        permuted = ((hashes[:, None] * self.a + self.b) % MERSENNE_PRIME) & MAX_HASH
+        return permuted.min(axis=0).astype(np.uint32)
+
+# -------------------- LSH Deduplication --------------------
+class NearDuplicateFilter:
+    """
+    Finds near-duplicate chunks with MinHash signatures and banded LSH.
+
+    Every chunk that is not a duplicate becomes a representative. A new chunk
+    is a duplicate when it shares an LSH band with a representative and their
+    estimated Jaccard similarity is at least `threshold`.
+    """
+
+    def __init__(self, threshold: float = DEFAULT_THRESHOLD, num_perm: int = NUM_PERM, bands: int = BANDS):
+        if num_perm % bands:
+            raise ValueError("num_perm must be a multiple of bands")
+        self.threshold = threshold
+        self.bands = bands
+        self.rows = num_perm // bands
+        self.hasher = MinHasher(num_perm)
+        self.signatures: Dict[str, np.ndarray] = {}
+        self._tables: List[Dict[bytes, List[str]]] = [{} for _ in range(bands)]
+        self.duplicates_found = 0
+
+    def __len__(self) -> int:
+        return len(self.signatures)
+
+    def _band_keys(self, signature: np.ndarray) -> List[bytes]:
+        return [signature[i * self.rows:(i + 1) * self.rows].tobytes() for i in range(self.bands)]
+
+    def add(self, chunk_id: str, signature: np.ndarray) -> None:
+        """Registers a representative chunk."""
+        self.signatures[chunk_id] = signature
+        for table, key in zip(self._tables, self._band_keys(signature)):
+            table.setdefault(key, []).append(chunk_id)
+
+    def discard(self, chunk_ids: Iterable[str]) -> None:
+        """Forgets representatives; stale LSH entries are skipped on lookup."""
+        for chunk_id in chunk_ids:
+            self.signatures.pop(chunk_id, None)
+
+    def find_duplicate(self, signature: np.ndarray) -> Optional[str]:
+        """
+        Looks for a representative the signature is a near duplicate of.
+        Args:
+            signature (np.ndarray): MinHash signature of the new chunk.
+        Returns:
+            Optional[str]: ID of the most similar representative, or None.
+        """
+        best_id, best_score = None, self.threshold
+        seen = set()
+        for table, key in zip(self._tables, self._band_keys(signature)):
+            for candidate in table.get(key, ()):
+                if candidate in seen or candidate not in self.signatures:
+                    continue
+                seen.add(candidate)
+                score = float(np.mean(self.signatures[candidate] == signature))
+                if score >= best_score:
+                    best_id, best_score = candidate, score
+        if best_id is not None:
+            self.duplicates_found += 1
+        return best_id
+
+    def save(self, path: str) -> None:
+        """Saves the representative signatures so incremental runs can keep deduplicating."""
+        ids = list(self.signatures)
+        matrix = np.stack([self.signatures[i] for i in ids]) if ids else np.zeros((0, self.hasher.num_perm), np.uint32)
+        tmp_path = path + ".tmp.npz"
+        np.savez(tmp_path, ids=np.array(ids, dtype=str), signatures=matrix)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path: str, threshold: float = DEFAULT_THRESHOLD,
+             keep_ids: Optional[Set[str]] = None) -> "NearDuplicateFilter":
+        """
+        Loads saved signatures, or returns an empty filter when there are none.
+        Args:
+            path (str): File written by save.
+            threshold (float): Jaccard threshold.
+            keep_ids (Optional[Set[str]]): Only load these representatives (those still indexed).
+        Returns:
+            NearDuplicateFilter: The filter.
+        """
+        dedup = cls(threshold)
+        if os.path.exists(path):
+            data = np.load(path)
+            for chunk_id, signature in zip(data["ids"].tolist(), data["signatures"]):
+                if keep_ids is None or chunk_id in keep_ids:
+                    dedup.add(chunk_id, signature)
+        return dedup
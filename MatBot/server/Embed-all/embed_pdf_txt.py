@@ -1,65 +1,48 @@
 import os
-import torch
-import pickle
-from langchain.document_loaders import PyMuPDFLoader, TextLoader
-from langchain.text_splitter import RecursiveCharacterTextSplitter
-from langchain.embeddings import HuggingFaceEmbeddings
-from langchain.vectorstores import Chroma
-
-# Step 1: Load all PDFs and TXT files from input directory
-pdf_dir = "data/DatasetMatlab"
-all_docs = []
-
-for file in os.listdir(pdf_dir):
-    full_path = os.path.join(pdf_dir, file)
-
-    if file.endswith(".pdf"):
-        loader = PyMuPDFLoader(full_path)
-    elif file.endswith(".txt"):
-        loader = TextLoader(full_path, encoding="utf-8")
-    else:
-        continue  # Skip unsupported files
-
-    docs = loader.load()
-    if not docs:
-        print(f"⚠️ No text extracted from: {file}")
-    else:
-        print(f"✅ Extracted {len(docs)} document(s) from {file}")
-
-    for doc in docs:
-        doc.metadata["source"] = file  # Add filename as metadata
-    all_docs.extend(docs)
-
-print(f"✅ Loaded {len(all_docs)} total documents from {len(os.listdir(pdf_dir))} files.")
-
-# Step 2: Split documents into chunks
-splitter = RecursiveCharacterTextSplitter(chunk_size=1024, chunk_overlap=192)
-chunks = splitter.split_documents(all_docs)
-
-print(f"✅ Split into {len(chunks)} total chunks.")
-
-# Step 3: Set up HuggingFace embedding model (BGE base)
-embedding_model = HuggingFaceEmbeddings(
-    model_name="BAAI/bge-base-en-v1.5",
-    model_kwargs={"device": "cuda" if torch.cuda.is_available() else "cpu"}
-)
-
-# Step 4: Create Chroma vectorstore and persist it
-persist_dir = "output/chroma_index"
-vectorstore = Chroma.from_documents(
-    documents=chunks,
-    embedding=embedding_model,
-    persist_directory=persist_dir
-)
-vectorstore.persist()
-
-print(f"✅ Embeddings saved to Chroma DB at: {persist_dir}")
-
-# Step 5 (Optional): Save text and metadata separately for later reference
-os.makedirs("output", exist_ok=True)
-with open("output/chunks.pkl", "wb") as f:
-    pickle.dump([chunk.page_content for chunk in chunks], f)
-with open("output/metadata.pkl", "wb") as f:
-    pickle.dump([chunk.metadata for chunk in chunks], f)
-
-print("✅ Chunk data and metadata saved.")
+import argparse
+from ingest import UPSERT_BATCH_SIZE, build_index
+from dedup import DEFAULT_THRESHOLD
+from embedding_cache import DEFAULT_CACHE_DIR
+
+# Guarded so spawned extraction workers do not re-run the script
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Embed the MATLAB PDFs and TXT files into a Chroma index.")
+    parser.add_argument("--input", default="data/DatasetMatlab", help="Directory containing the PDFs and TXT files")
+    parser.add_argument("--output", default="output", help="Directory for chroma_index, manifest and chunk store")
+    parser.add_argument("--full", action="store_true",
+                        help="Rebuild the index from scratch instead of updating changed files only")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1,
+                        help="Number of PDF extraction processes (1 extracts serially)")
+    parser.add_argument("--batch-size", type=int, default=UPSERT_BATCH_SIZE,
+                        help="Number of chunks embedded and written to Chroma per batch")
+    parser.add_argument("--embedding-cache", default=DEFAULT_CACHE_DIR,
+                        help="Embedding cache directory shared across index builds")
+    parser.add_argument("--no-embedding-cache", action="store_true", help="Always re-run the embedding model")
+    parser.add_argument("--dedup", action="store_true",
+                        help="Collapse near-duplicate chunks (MinHash/LSH) into one vector listing every source")
+    parser.add_argument("--dedup-threshold", type=float, default=DEFAULT_THRESHOLD,
+                        help="Estimated Jaccard similarity above which chunks count as duplicates")
+    parser.add_argument("--resume", action="store_true",
+                        help="Continue an interrupted run from its last file/batch checkpoint")
+    parser.add_argument("--splitter", choices=("recursive", "matlab"), default="recursive",
+                        help="'matlab' chunks reference pages per function and Syntax/Description/Examples section")
+    parser.add_argument("--embedding-backend", choices=("huggingface", "onnx"), default="huggingface",
+                        help="'onnx' embeds with an int8 ONNX Runtime export of the model (faster on CPU)")
+    args = parser.parse_args()
+
+    # Stream, split (1024/192) and embed every new or changed file, then persist to Chroma
+    build_index(
+        input_dir=args.input,
+        output_dir=args.output,
+        chunk_size=1024,
+        chunk_overlap=192,
+        extensions=(".pdf", ".txt"),
+        full_rebuild=args.full,
+        workers=args.workers,
+        batch_size=args.batch_size,
+        embedding_cache_dir=None if args.no_embedding_cache else args.embedding_cache,
+        dedup_threshold=args.dedup_threshold if args.dedup else None,
+        resume=args.resume,
+        splitter=args.splitter,
+        embedding_backend=args.embedding_backend
+    )
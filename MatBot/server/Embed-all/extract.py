@@ -0,0 +1,115 @@
+import os
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import get_context
+from typing import Iterator, List, Optional, Tuple
+
+import fitz  # PyMuPDF
+from langchain.schema import Document
+
+# Large manuals such as matlab_ref.pdf are split into page ranges of this size
+PAGES_PER_TASK = 200
+
+# -------------------- Extraction Workers --------------------
+# Kept in a module of its own. Spawned workers also re-import the entry script (embed_pdf.py, ...) and
+# through it ingest, which therefore defers torch, chromadb and the embedding models to the functions using them.
+
+def page_ranges(full_path: str, pages_per_task: int = PAGES_PER_TASK) -> List[Tuple[int, int]]:
+    """
+    Splits a file into extraction tasks.
+    Args:
+        full_path (str): File to split.
+        pages_per_task (int): Maximum number of PDF pages per task.
+    Returns:
+        List[Tuple[int, int]]: Half-open page ranges; a single (0, 1) range for text files.
+    """
+    if not full_path.endswith(".pdf"):
+        return [(0, 1)]
+    with fitz.open(full_path) as pdf:
+        page_count = pdf.page_count
+    return [(start, min(start + pages_per_task, page_count))
+            for start in range(0, page_count, pages_per_task)]
+
+def extract_range(full_path: str, start: int, end: int) -> List[Document]:
+    """
+    Extracts one page range of a PDF, or a whole text file, tagged with its file name.
+    The PDF metadata mirrors what PyMuPDFLoader attaches to each page.
+    Args:
+        full_path (str): File to extract.
+        start (int): First page (inclusive).
+        end (int): Last page (exclusive).
+    Returns:
+        List[Document]: One document per PDF page, or one for a text file.
+    """
+    file = os.path.basename(full_path)
+    if not full_path.endswith(".pdf"):
+        from langchain.document_loaders import TextLoader  # Only text files need the loaders package
+
+        docs = TextLoader(full_path, encoding="utf-8").load()
+    else:
+        docs = []
+        with fitz.open(full_path) as pdf:
+            pdf_metadata = {k: v for k, v in pdf.metadata.items() if isinstance(v, (str, int))}
+            for page_number in range(start, end):
+                page = pdf[page_number]
+                docs.append(Document(
+                    page_content=page.get_text(),
+                    metadata=dict(
+                        pdf_metadata,
+                        file_path=full_path,
+                        page=page_number,
+                        total_pages=pdf.page_count
+                    )
+                ))
+
+    for doc in docs:
+        doc.metadata["source"] = file  # Add filename as metadata
+    return docs
+
+# -------------------- Parallel Extraction --------------------
+def _extraction_tasks(input_dir: str, files: List[str], pages_per_task: int) -> Iterator[Tuple]:
+    """Yields (file, full_path, start, end, last_range) for every page range of every file."""
+    for file in files:
+        full_path = os.path.join(input_dir, file)
+        ranges = page_ranges(full_path, pages_per_task) or [(0, 0)]  # Empty PDFs still get closed
+        for i, (start, end) in enumerate(ranges):
+            yield file, full_path, start, end, i == len(ranges) - 1
+
+def extract_files(input_dir: str, files: List[str], workers: int = 1, pages_per_task: int = PAGES_PER_TASK,
+                  max_pending: Optional[int] = None) -> Iterator[Tuple[str, List[Document], bool]]:
+    """
+    Extracts files across a pool of worker processes.
+
+    Each file is split into page ranges so a single huge manual is spread over
+    several workers. Ranges are yielded in order as they complete, and at most
+    `max_pending` ranges are in flight so extraction never runs far ahead of
+    the consumer.
+
+    Args:
+        input_dir (str): Directory containing the files.
+        files (List[str]): File names to extract.
+        workers (int): Number of worker processes; 1 extracts in-process.
+        pages_per_task (int): Maximum number of PDF pages per task.
+        max_pending (Optional[int]): Ranges in flight (defaults to twice the workers).
+    Yields:
+        Tuple[str, List[Document], bool]: File name, documents of one page range,
+        and whether it is the last range of that file.
+    """
+    tasks = _extraction_tasks(input_dir, files, pages_per_task)
+    if workers <= 1:
+        for file, full_path, start, end, last_range in tasks:
+            yield file, extract_range(full_path, start, end), last_range
+        return
+
+    max_pending = max_pending or 2 * workers
+    # Spawn rather than fork: the parent may already hold torch/tokenizer threads
+    with ProcessPoolExecutor(max_workers=workers, mp_context=get_context("spawn")) as pool:
+        pending = deque()
+        for file, full_path, start, end, last_range in tasks:
+            pending.append((file, last_range, pool.submit(extract_range, full_path, start, end)))
+            if len(pending) >= max_pending:
+                done_file, done_last, future = pending.popleft()
+                yield done_file, future.result(), done_last
+        while pending:
+            done_file, done_last, future = pending.popleft()
+            yield done_file, future.result(), done_last
@@ -0,0 +1,812 @@
+import os
+import sys
+import json
+import time
+import shutil
+import hashlib
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Set, Tuple
+
+from langchain.text_splitter import RecursiveCharacterTextSplitter
+from langchain.schema import Document
+
+from dedup import NearDuplicateFilter
+from extract import extract_files
+from matlab_splitter import MatlabDocSplitter
+
+# Share the embedding cache and chunk store modules with the app
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from bm25_index import build_bm25_index
+from chunk_store import ChunkStoreWriter, open_chunk_store
+from quantized_index import CONFIG_FILE as QUANTIZED_CONFIG_FILE, build_quantized_index
+from embedding_cache import DEFAULT_MAX_BYTES, CachedEmbeddings, EmbeddingCache
+from onnx_embeddings import ONNXEmbeddings
+
+# torch, chromadb and langchain's HuggingFaceEmbeddings are imported where they are used: spawned
+# extraction workers re-import the entry script, and with it this module, in every process.
+
+EMBEDDING_MODEL_NAME = "BAAI/bge-base-en-v1.5"
+COLLECTION_NAME = "langchain"  # Default collection name used by langchain's Chroma wrapper
+MANIFEST_FILE = "manifest.json"
+MINHASH_FILE = "minhash.npz"
+CHECKPOINT_FILE = "checkpoint.json"
+MANIFEST_VERSION = 1
+UPSERT_BATCH_SIZE = 512
+
+# -------------------- Stage Timing --------------------
+class StageTimer:
+    """
+    Accumulates wall time per ingestion stage (extract, split, embed, write, ...)
+    and the size and duration of every embedding batch, for benchmarking.
+    """
+
+    def __init__(self):
+        self.seconds: Dict[str, float] = {}
+        self.calls: Dict[str, int] = {}
+        self.embed_batches: List[Tuple[int, float]] = []
+
+    @contextmanager
+    def stage(self, name: str):
+        """Adds the time spent inside the block to stage `name`."""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.seconds[name] = self.seconds.get(name, 0.0) + time.perf_counter() - started
+            self.calls[name] = self.calls.get(name, 0) + 1
+
+    def iterate(self, iterable: Iterable, name: str) -> Iterator:
+        """Yields from `iterable`, charging the time spent waiting for each item to stage `name`."""
+        iterator = iter(iterable)
+        while True:
+            with self.stage(name):
+                try:
+                    item = next(iterator)
+                except StopIteration:
+                    return
+            yield item
+
+    def record_batch(self, size: int, seconds: float) -> None:
+        """Records one embedding batch."""
+        self.embed_batches.append((size, seconds))
+
+# -------------------- Hashing & Manifest --------------------
+def file_sha256(path: str, block_size: int = 1 << 20) -> str:
+    """
+    Computes the SHA-256 digest of a file without reading it into memory at once.
+    Args:
+        path (str): File to hash.
+        block_size (int): Number of bytes read per iteration.
+    Returns:
+        str: Hex digest of the file contents.
+    """
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(block_size), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+def new_manifest(chunk_size: int, chunk_overlap: int, model_name: str = EMBEDDING_MODEL_NAME,
+                 dedup_threshold: Optional[float] = None, splitter: str = "recursive",
+                 embedding_backend: str = "huggingface") -> Dict:
+    """
+    Creates an empty manifest for the given index settings.
+    Args:
+        chunk_size (int): Splitter chunk size.
+        chunk_overlap (int): Splitter chunk overlap.
+        model_name (str): Embedding model identifier.
+        dedup_threshold (Optional[float]): Near-duplicate threshold, None when dedup is off.
+        splitter (str): Splitter name ("recursive" or "matlab").
+        embedding_backend (str): "huggingface" or "onnx"; their vectors differ, so they never share a collection.
+    Returns:
+        Dict: Empty manifest.
+    """
+    return {
+        "version": MANIFEST_VERSION,
+        "chunk_size": chunk_size,
+        "chunk_overlap": chunk_overlap,
+        "embedding_model": model_name,
+        "embedding_backend": embedding_backend,
+        "dedup_threshold": dedup_threshold,
+        "splitter": splitter,
+        "files": {}
+    }
+
+def load_manifest(output_dir: str) -> Optional[Dict]:
+    """
+    Loads the manifest of a previous ingestion run.
+    Args:
+        output_dir (str): Ingestion output directory.
+    Returns:
+        Optional[Dict]: Manifest, or None if there is no usable manifest.
+    """
+    path = os.path.join(output_dir, MANIFEST_FILE)
+    if not os.path.exists(path):
+        return None
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            manifest = json.load(f)
+    except (OSError, ValueError) as e:
+        print(f"⚠️ Ignoring unreadable manifest {path}: {e}")
+        return None
+    if manifest.get("version") != MANIFEST_VERSION:
+        return None
+    return manifest
+
+def write_json_atomic(data: Dict, path: str) -> None:
+    """
+    Writes JSON through a synced temporary file so a crash never leaves a truncated file.
+    Args:
+        data (Dict): Data to write.
+        path (str): Destination file.
+    """
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(data, f, indent=2)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+def save_manifest(manifest: Dict, output_dir: str) -> None:
+    """
+    Atomically writes the manifest; it doubles as the per-file checkpoint of a run.
+    Args:
+        manifest (Dict): Manifest to write.
+        output_dir (str): Ingestion output directory.
+    """
+    write_json_atomic(manifest, os.path.join(output_dir, MANIFEST_FILE))
+
+def load_checkpoint(output_dir: str) -> Optional[Dict]:
+    """
+    Loads the batch checkpoint left behind by an interrupted run.
+    Args:
+        output_dir (str): Ingestion output directory.
+    Returns:
+        Optional[Dict]: Checkpoint, or None if the last run finished cleanly.
+    """
+    path = os.path.join(output_dir, CHECKPOINT_FILE)
+    if not os.path.exists(path):
+        return None
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError) as e:
+        print(f"⚠️ Ignoring unreadable checkpoint {path}: {e}")
+        return None
+
+def save_checkpoint(in_progress: Optional[Dict], output_dir: str) -> None:
+    """
+    Records how far the file currently being indexed has been written.
+    Args:
+        in_progress (Optional[Dict]): File, sha256, chunks_done, chunk_ids and merged_into
+            of the partially written file, or None between files.
+        output_dir (str): Ingestion output directory.
+    """
+    write_json_atomic({"in_progress": in_progress}, os.path.join(output_dir, CHECKPOINT_FILE))
+
+def clear_checkpoint(output_dir: str) -> None:
+    """Removes the batch checkpoint once a run has finished."""
+    path = os.path.join(output_dir, CHECKPOINT_FILE)
+    if os.path.exists(path):
+        os.remove(path)
+
+def fingerprint_file(full_path: str, previous: Optional[Dict] = None) -> Dict:
+    """
+    Fingerprints a file, reusing the previous hash when size and mtime are unchanged.
+    Args:
+        full_path (str): File to fingerprint.
+        previous (Optional[Dict]): Manifest entry from the last run.
+    Returns:
+        Dict: Entry with sha256, size and mtime_ns.
+    """
+    stat = os.stat(full_path)
+    if previous and previous.get("size") == stat.st_size and previous.get("mtime_ns") == stat.st_mtime_ns:
+        sha256 = previous["sha256"]
+    else:
+        sha256 = file_sha256(full_path)
+    return {"sha256": sha256, "size": stat.st_size, "mtime_ns": stat.st_mtime_ns}
+
+def plan_update(manifest: Dict, fingerprints: Dict[str, Dict]) -> Tuple[List[str], List[str], List[str]]:
+    """
+    Compares the current files against the manifest.
+    Args:
+        manifest (Dict): Manifest of the last run.
+        fingerprints (Dict[str, Dict]): Current fingerprint per file name.
+    Returns:
+        tuple: Files to (re)index, files to remove and unchanged files.
+    """
+    indexed = manifest["files"]
+    to_index, unchanged = [], []
+    for file, fingerprint in fingerprints.items():
+        if file in indexed and indexed[file]["sha256"] == fingerprint["sha256"]:
+            unchanged.append(file)
+        else:
+            to_index.append(file)
+    removed = [file for file in indexed if file not in fingerprints]
+    return to_index, removed, unchanged
+
+def find_dependents(manifest: Dict, dropped: List[str]) -> List[str]:
+    """
+    Finds files whose duplicate chunks were merged into representatives of dropped files.
+    They must be re-indexed too, otherwise their text would vanish with the representative.
+    Args:
+        manifest (Dict): Manifest of the last run.
+        dropped (List[str]): Files being removed or re-indexed.
+    Returns:
+        List[str]: Dependent files, including transitive ones.
+    """
+    dropped = set(dropped)
+    dependents = []
+    found = True
+    while found:
+        found = False
+        for file, entry in manifest["files"].items():
+            if file not in dropped and any(chunk_id_file(rep_id) in dropped for rep_id in entry.get("merged_into", {})):
+                dropped.add(file)
+                dependents.append(file)
+                found = True
+    return dependents
+
+# -------------------- Loading & Splitting --------------------
+def list_input_files(input_dir: str, extensions: Tuple[str, ...]) -> List[str]:
+    """
+    Lists the supported files of the input directory in a stable order.
+    Args:
+        input_dir (str): Directory containing the documentation files.
+        extensions (Tuple[str, ...]): Accepted file extensions.
+    Returns:
+        List[str]: File names.
+    """
+    return sorted(file for file in os.listdir(input_dir) if file.endswith(extensions))
+
+def make_splitter(name: str, chunk_size: int, chunk_overlap: int):
+    """
+    Creates the text splitter used to chunk pages.
+    Args:
+        name (str): "recursive" for fixed-size character chunks, "matlab" for function-page chunks.
+        chunk_size (int): Chunk size (the fallback size for the MATLAB splitter).
+        chunk_overlap (int): Chunk overlap (the fallback overlap for the MATLAB splitter).
+    Returns:
+        RecursiveCharacterTextSplitter or MatlabDocSplitter: Splitter.
+    """
+    if name == "matlab":
+        return MatlabDocSplitter(fallback_chunk_size=chunk_size, fallback_chunk_overlap=chunk_overlap)
+    if name == "recursive":
+        return RecursiveCharacterTextSplitter(chunk_size=chunk_size, chunk_overlap=chunk_overlap)
+    raise ValueError(f"Unknown splitter: {name}")
+
+def split_range(splitter, docs: List[Document], last_range: bool) -> List[Document]:
+    """Splits one extracted page range; stateful splitters are closed on the file's last range."""
+    if isinstance(splitter, MatlabDocSplitter):
+        return splitter.feed(docs) + (splitter.finish() if last_range else [])
+    return splitter.split_documents(docs)
+
+def make_chunk_id(file: str, sha256: str, index: int) -> str:
+    """
+    Builds a deterministic chunk ID so a file's vectors can be found again later.
+    Args:
+        file (str): Source file name.
+        sha256 (str): Content hash of the file.
+        index (int): Position of the chunk within the file.
+    Returns:
+        str: Chunk ID.
+    """
+    return f"{file}:{sha256[:16]}:{index}"
+
+def chunk_id_file(chunk_id: str) -> str:
+    """Returns the source file name encoded in a chunk ID."""
+    return chunk_id.rsplit(":", 2)[0]
+
+def clean_metadata(metadata: Dict) -> Dict:
+    """Drops values Chroma cannot store (it only accepts str, int, float and bool)."""
+    return {k: v for k, v in metadata.items() if isinstance(v, (str, int, float, bool))}
+
+# -------------------- Vector Store --------------------
+def get_embedding_model(model_name: str = EMBEDDING_MODEL_NAME, cache_dir: Optional[str] = None,
+                        cache_max_bytes: int = DEFAULT_MAX_BYTES, backend: str = "huggingface"):
+    """
+    Loads the HuggingFace embedding model (BGE base by default).
+    Args:
+        model_name (str): Embedding model identifier.
+        cache_dir (Optional[str]): Embedding cache directory; None disables the cache.
+        cache_max_bytes (int): Size limit of the embedding cache.
+        backend (str): "huggingface" (PyTorch) or "onnx" (ONNX Runtime int8 on CPU).
+    Returns:
+        HuggingFaceEmbeddings, ONNXEmbeddings or CachedEmbeddings: Embedding model.
+    """
+    if backend == "onnx":
+        embedding_model = ONNXEmbeddings(model_name)
+        cache_name = embedding_model.cache_name
+    else:
+        import torch
+        from langchain.embeddings import HuggingFaceEmbeddings
+
+        embedding_model = HuggingFaceEmbeddings(
+            model_name=model_name,
+            model_kwargs={"device": "cuda" if torch.cuda.is_available() else "cpu"}
+        )
+        cache_name = model_name
+    if cache_dir:
+        embedding_model = CachedEmbeddings(embedding_model, EmbeddingCache(cache_dir, cache_name, cache_max_bytes))
+    return embedding_model
+
+def open_collection(persist_dir: str, reset: bool = False):
+    """
+    Opens the persisted Chroma collection read by app.load_embedding_model.
+    Args:
+        persist_dir (str): Chroma persist directory.
+        reset (bool): Drop the existing collection first.
+    Returns:
+        chromadb.Collection: Collection handle.
+    """
+    import chromadb
+
+    client = chromadb.PersistentClient(path=persist_dir)
+    if reset:
+        try:
+            client.delete_collection(COLLECTION_NAME)
+        except ValueError:
+            pass  # Nothing to drop yet
+    return client.get_or_create_collection(COLLECTION_NAME)
+
+def delete_chunks(collection, ids: List[str], batch_size: int = UPSERT_BATCH_SIZE) -> None:
+    """
+    Deletes vectors from the collection in batches.
+    Args:
+        collection: Chroma collection.
+        ids (List[str]): Chunk IDs to delete.
+        batch_size (int): Number of IDs per delete call.
+    """
+    for start in range(0, len(ids), batch_size):
+        collection.delete(ids=ids[start:start + batch_size])
+
+def source_ref(metadata: Dict) -> str:
+    """Formats a chunk's source reference as file#page (or just the file)."""
+    page = metadata.get("page")
+    return f"{metadata['source']}#{page}" if page is not None else metadata["source"]
+
+def add_sources(collection, refs_by_id: Dict[str, List[str]]) -> None:
+    """
+    Records merged duplicates on their representatives: `sources` lists every
+    reference separated by ';' and `duplicates` counts the merged chunks.
+    Args:
+        collection: Chroma collection.
+        refs_by_id (Dict[str, List[str]]): New source references per representative ID.
+    """
+    records = collection.get(ids=list(refs_by_id), include=["metadatas"])
+    metadatas = []
+    for chunk_id, metadata in zip(records["ids"], records["metadatas"]):
+        sources = metadata.get("sources") or source_ref(metadata)
+        metadata["sources"] = ";".join([sources] + refs_by_id[chunk_id])
+        metadata["duplicates"] = metadata.get("duplicates", 0) + len(refs_by_id[chunk_id])
+        metadatas.append(metadata)
+    if metadatas:
+        collection.update(ids=records["ids"], metadatas=metadatas)
+
+def remove_sources(collection, rep_ids: List[str], file: str) -> None:
+    """
+    Drops a file's references from the representatives its duplicates were merged into.
+    Args:
+        collection: Chroma collection.
+        rep_ids (List[str]): Representative IDs.
+        file (str): File whose references are removed.
+    """
+    records = collection.get(ids=rep_ids, include=["metadatas"])
+    metadatas = []
+    for metadata in records["metadatas"]:
+        kept = [ref for ref in metadata.get("sources", "").split(";")
+                if ref and ref != file and not ref.startswith(file + "#")]
+        metadata["duplicates"] = max(len(kept) - 1, 0)
+        metadata["sources"] = ";".join(kept)
+        metadatas.append(metadata)
+    if metadatas:
+        collection.update(ids=records["ids"], metadatas=metadatas)
+
+class StreamingIndexWriter:
+    """
+    Embeds chunks in fixed-size batches and upserts them into Chroma as they arrive.
+
+    Only one batch is held in memory at a time. Files are reported as done
+    through `on_file_done` once every one of their chunks has been written.
+    Near duplicates queued with `merge` are recorded on their representative
+    after the batch holding it has been upserted, and `on_flush` runs last so
+    it can checkpoint everything written so far.
+    """
+
+    def __init__(self, collection, embedding_model, batch_size: int = UPSERT_BATCH_SIZE,
+                 on_file_done: Optional[Callable[[str, List[str], Dict[str, int]], None]] = None,
+                 on_flush: Optional[Callable[[], None]] = None, timer: Optional[StageTimer] = None):
+        self.collection = collection
+        self.embedding_model = embedding_model
+        self.batch_size = batch_size
+        self.on_file_done = on_file_done
+        self.on_flush = on_flush
+        self.timer = timer or StageTimer()
+        self.chunks_written = 0
+        self.batches_written = 0
+        self.started = time.perf_counter()
+        self._ids: List[str] = []
+        self._texts: List[str] = []
+        self._metadatas: List[Dict] = []
+        self._merges: Dict[str, List[str]] = {}
+        self._closed_files: List[Tuple[str, List[str], Dict[str, int]]] = []
+
+    def add(self, chunk: Document, chunk_id: str) -> None:
+        """Queues one chunk, writing the batch once it is full."""
+        self._ids.append(chunk_id)
+        self._texts.append(chunk.page_content)
+        self._metadatas.append(clean_metadata(chunk.metadata))
+        if len(self._ids) >= self.batch_size:
+            self.flush()
+
+    def merge(self, rep_id: str, ref: str) -> None:
+        """Queues a near-duplicate source reference for a representative chunk."""
+        self._merges.setdefault(rep_id, []).append(ref)
+
+    def close_file(self, file: str, ids: List[str], merged_into: Optional[Dict[str, int]] = None) -> None:
+        """Marks a file as fully queued; it is reported done after the next flush."""
+        self._closed_files.append((file, ids, merged_into or {}))
+
+    def flush(self) -> None:
+        """Embeds and upserts the pending batch, then reports completed files."""
+        if self._ids:
+            started = time.perf_counter()
+            with self.timer.stage("embed"):
+                embeddings = self.embedding_model.embed_documents(self._texts)
+            self.timer.record_batch(len(self._texts), time.perf_counter() - started)
+            with self.timer.stage("write"):
+                self.collection.upsert(
+                    ids=self._ids,
+                    embeddings=embeddings,
+                    documents=self._texts,
+                    metadatas=self._metadatas
+                )
+            self.chunks_written += len(self._ids)
+            self.batches_written += 1
+            self._ids, self._texts, self._metadatas = [], [], []
+            print(f"📈 {self.chunks_written} chunks written ({self.throughput:.1f} chunks/s)")
+
+        if self._merges:
+            with self.timer.stage("write"):
+                add_sources(self.collection, self._merges)
+            self._merges = {}
+
+        closed, self._closed_files = self._closed_files, []
+        with self.timer.stage("checkpoint"):
+            if self.on_file_done:
+                for file, ids, merged_into in closed:
+                    self.on_file_done(file, ids, merged_into)
+            if self.on_flush:
+                self.on_flush()
+
+    @property
+    def throughput(self) -> float:
+        """Chunks written per second since the writer was created."""
+        elapsed = time.perf_counter() - self.started
+        return self.chunks_written / elapsed if elapsed > 0 else 0.0
+
+def manifest_chunk_ids(manifest: Dict) -> List[str]:
+    """Chunk IDs in chunk store order: by file, then by position in the file."""
+    return [chunk_id for file in sorted(manifest["files"]) for chunk_id in manifest["files"][file]["chunk_ids"]]
+
+def chunk_store_current(manifest: Dict, output_dir: str) -> bool:
+    """Whether output_dir/chunk_store was exported from this manifest's chunks (same IDs, same order)."""
+    if not manifest.get("chunk_store_exported"):
+        return False
+    store = open_chunk_store(os.path.join(output_dir, "chunk_store"))
+    if store is None:
+        return not manifest_chunk_ids(manifest)  # An empty index has no store
+    return store.table.column("id").to_pylist() == manifest_chunk_ids(manifest)
+
+def export_chunk_store(collection, manifest: Dict, output_dir: str, page_size: int = UPSERT_BATCH_SIZE,
+                       refresh: Optional[Set[str]] = None) -> int:
+    """
+    Writes the text, metadata and embeddings of every indexed chunk to a memory-mappable
+    chunk store (output_dir/chunk_store). Rows are ordered by file, then by position in the file.
+    With `refresh`, rows of the previous store are copied for every other chunk ID, so only
+    new or modified chunks are fetched from Chroma; without it every chunk is fetched.
+    Without any chunk the previous store is removed, so no backend serves deleted chunks.
+    Args:
+        collection: Chroma collection.
+        manifest (Dict): Manifest listing the chunk IDs of every file.
+        output_dir (str): Ingestion output directory.
+        page_size (int): Number of records fetched from Chroma per query.
+        refresh (Optional[Set[str]]): Chunks added or modified (e.g. merged sources) since the previous
+            export; None when the previous store cannot be trusted (first run or rebuild).
+    Returns:
+        int: Number of rows written.
+    """
+    ids = manifest_chunk_ids(manifest)
+    previous = open_chunk_store(os.path.join(output_dir, "chunk_store")) if refresh is not None else None
+    writer, fetched = None, 0
+    for start in range(0, len(ids), page_size):
+        page_ids = ids[start:start + page_size]
+        rows = {chunk_id: previous.row_for_id(chunk_id) for chunk_id in page_ids} if previous is not None else {}
+        fetch = [chunk_id for chunk_id in page_ids if chunk_id in refresh or rows.get(chunk_id) is None] \
+            if previous is not None else page_ids
+        records = collection.get(ids=fetch, include=["documents", "metadatas", "embeddings"]) if fetch else None
+        fetched += len(fetch)
+        found = {chunk_id: i for i, chunk_id in enumerate(records["ids"])} if records else {}
+
+        texts, metadatas, embeddings = [], [], []
+        for chunk_id in page_ids:
+            if chunk_id in found:
+                i = found[chunk_id]
+                texts.append(records["documents"][i])
+                metadatas.append(records["metadatas"][i])
+                embeddings.append(records["embeddings"][i])
+            else:
+                row = rows[chunk_id]
+                texts.append(previous.text(row))
+                metadatas.append(previous.metadata(row))
+                embeddings.append(previous.embeddings[row])
+        if writer is None:
+            writer = ChunkStoreWriter(os.path.join(output_dir, "chunk_store"), len(ids), len(embeddings[0]))
+        writer.write(page_ids, texts, metadatas, embeddings)
+    previous = None  # Unmap the old store before it is replaced
+    if writer is not None:
+        writer.close()
+    else:
+        shutil.rmtree(os.path.join(output_dir, "chunk_store"), ignore_errors=True)
+    if ids and fetched < len(ids):
+        print(f"♻️ Reused {len(ids) - fetched} rows of the previous chunk store, fetched {fetched} from Chroma")
+    return len(ids)
+
+def refresh_quantized_index(output_dir: str) -> None:
+    """Rebuilds an existing quantized index with its settings so it matches the new chunk store."""
+    index_dir = os.path.join(output_dir, "quantized_index")
+    config_path = os.path.join(index_dir, QUANTIZED_CONFIG_FILE)
+    if not os.path.exists(config_path) or not os.path.exists(os.path.join(output_dir, "chunk_store")):
+        return
+    with open(config_path, "r", encoding="utf-8") as f:
+        config = json.load(f)
+    build_quantized_index(os.path.join(output_dir, "chunk_store"), index_dir, mode=config["mode"],
+                          dims=config["dims"] if config["reduction"] else None,
+                          reduction=config["reduction"] or "pca")
+    print(f"✅ Rebuilt {config['mode']} quantized index at: {index_dir}")
+
+# -------------------- Pipeline --------------------
+def build_index(input_dir: str, output_dir: str, chunk_size: int, chunk_overlap: int,
+                extensions: Tuple[str, ...] = (".pdf",), full_rebuild: bool = False,
+                workers: int = 1, batch_size: int = UPSERT_BATCH_SIZE,
+                embedding_cache_dir: Optional[str] = None,
+                embedding_cache_max_bytes: int = DEFAULT_MAX_BYTES,
+                dedup_threshold: Optional[float] = None, resume: bool = False,
+                splitter: str = "recursive", timer: Optional[StageTimer] = None,
+                embedding_backend: str = "huggingface") -> Dict:
+    """
+    Builds or incrementally updates the Chroma index of a documentation directory.
+
+    Only files whose content hash changed since the last run are re-split and
+    re-embedded; vectors of changed and removed files are deleted by chunk ID.
+    A full rebuild happens when requested, when there is no manifest, or when the
+    splitter settings, embedding model or embedding backend differ from the ones in
+    the manifest.
+    Pages are streamed through splitting and embedding, so memory use depends on
+    the batch size rather than on the size of the corpus. With a dedup threshold,
+    near-duplicate chunks are collapsed into one vector that lists every source.
+
+    The manifest is saved after every file and a checkpoint after every batch.
+    With `resume`, an interrupted run (even a full rebuild) continues where it
+    stopped: finished files are skipped and the partially written file is
+    re-extracted but only its unwritten chunks are embedded.
+
+    Args:
+        input_dir (str): Directory containing the documentation files.
+        output_dir (str): Directory holding chroma_index, the manifest and the chunk store.
+        chunk_size (int): Splitter chunk size.
+        chunk_overlap (int): Splitter chunk overlap.
+        extensions (Tuple[str, ...]): Accepted file extensions.
+        full_rebuild (bool): Ignore the manifest and rebuild from scratch.
+        workers (int): Number of PDF extraction processes.
+        batch_size (int): Number of chunks embedded and upserted per batch.
+        embedding_cache_dir (Optional[str]): Embedding cache shared across index builds.
+        embedding_cache_max_bytes (int): Size limit of the embedding cache.
+        dedup_threshold (Optional[float]): MinHash Jaccard threshold for near-duplicate
+            chunks; None disables deduplication.
+        resume (bool): Continue an interrupted run from its checkpoint.
+        splitter (str): "recursive" for fixed-size chunks, "matlab" for function-page chunks.
+        timer (Optional[StageTimer]): Collects per-stage wall times when given.
+        embedding_backend (str): "huggingface" or "onnx" (int8 ONNX Runtime, for CPU-only machines).
+    Returns:
+        Dict: The updated manifest.
+    """
+    timer = timer or StageTimer()
+    os.makedirs(output_dir, exist_ok=True)
+    persist_dir = os.path.join(output_dir, "chroma_index")
+
+    checkpoint = load_checkpoint(output_dir)
+    if resume and checkpoint is None:
+        print("ℹ️ No checkpoint to resume from, starting a regular run.")
+    resuming = resume and checkpoint is not None
+    # A resumed full rebuild already reset the collection; its manifest lists the files done since
+    manifest = None if full_rebuild and not resuming else load_manifest(output_dir)
+    settings = new_manifest(chunk_size, chunk_overlap, dedup_threshold=dedup_threshold, splitter=splitter,
+                            embedding_backend=embedding_backend)
+    if manifest is not None and any(manifest.get(key, default) != settings[key] for key, default in (
+            ("chunk_size", None), ("chunk_overlap", None), ("embedding_model", None),
+            ("embedding_backend", "huggingface"), ("dedup_threshold", None), ("splitter", "recursive"))):
+        print("⚠️ Splitter, embedding or dedup settings changed since the last run, rebuilding from scratch.")
+        manifest = None
+    elif manifest is not None:
+        manifest["embedding_backend"] = embedding_backend  # Manifests written before it was recorded
+
+    # Without a trustworthy manifest we cannot tell which vectors belong to which file
+    collection = open_collection(persist_dir, reset=manifest is None)
+    minhash_path = os.path.join(output_dir, MINHASH_FILE)
+    dedup = None
+    if dedup_threshold is not None:
+        # Signatures are saved per finished file; only trust those of indexed representatives
+        dedup = (NearDuplicateFilter(dedup_threshold) if manifest is None else NearDuplicateFilter.load(
+            minhash_path, dedup_threshold,
+            keep_ids={chunk_id for entry in manifest["files"].values() for chunk_id in entry["chunk_ids"]}
+        ))
+    if manifest is None:
+        manifest = settings
+        save_manifest(manifest, output_dir)  # The manifest must match the reset collection right away
+        checkpoint = None
+    # Rows of the previous chunk store can be reused only if it was exported from this collection
+    store_exported = manifest.get("chunk_store_exported", False)
+
+    files = list_input_files(input_dir, extensions)
+    with timer.stage("hash"):
+        fingerprints = {
+            file: fingerprint_file(os.path.join(input_dir, file), manifest["files"].get(file))
+            for file in files
+        }
+    to_index, removed, unchanged = plan_update(manifest, fingerprints)
+    dependents = find_dependents(manifest, to_index + removed)
+    if dependents:
+        print(f"🔗 Re-indexing {len(dependents)} file(s) whose duplicates point into changed files.")
+        unchanged = [file for file in unchanged if file not in dependents]
+        to_index += dependents
+    print(f"🔍 {len(to_index)} file(s) to index, {len(removed)} removed, {len(unchanged)} unchanged.")
+
+    # A partially written file is only resumed if it has not changed since
+    in_progress = (checkpoint or {}).get("in_progress")
+    changed = bool(to_index or removed or in_progress)
+    # Representatives whose source lists change; new chunk IDs are missing from the old store anyway
+    touched: Set[str] = set()
+    if changed:
+        manifest["chunk_store_exported"] = False  # Until the export below succeeds
+        save_manifest(manifest, output_dir)
+    if in_progress and not (resuming and in_progress["file"] in to_index
+                            and fingerprints[in_progress["file"]]["sha256"] == in_progress["sha256"]):
+        delete_chunks(collection, in_progress["chunk_ids"])
+        if in_progress["merged_into"]:
+            remove_sources(collection, list(in_progress["merged_into"]), in_progress["file"])
+            touched.update(in_progress["merged_into"])
+        in_progress = None
+    if in_progress:
+        print(f"⏩ Resuming {in_progress['file']} after {in_progress['chunks_done']} chunks")
+    save_checkpoint(in_progress, output_dir)
+
+    # Step 1: Drop vectors of removed and changed files before any new chunk is deduplicated
+    for file in removed + [file for file in to_index if file in manifest["files"]]:
+        entry = manifest["files"].pop(file)
+        delete_chunks(collection, entry["chunk_ids"])
+        if dedup is not None:
+            dedup.discard(entry["chunk_ids"])
+        if entry.get("merged_into"):
+            remove_sources(collection, list(entry["merged_into"]), file)
+            touched.update(entry["merged_into"])
+        save_manifest(manifest, output_dir)
+        if file in removed:
+            print(f"🗑️ Removed {file} from the index")
+
+    # Unchanged files only need their stat info refreshed
+    for file in unchanged:
+        manifest["files"][file].update(fingerprints[file])
+
+    if to_index:
+        text_splitter = make_splitter(splitter, chunk_size, chunk_overlap)
+        # Chunks of the file currently being streamed
+        state = {"file": None, "chunk_ids": [], "merged_into": {}, "chunks_done": 0}
+
+        def commit_file(file: str, ids: List[str], merged_into: Dict[str, int]) -> None:
+            manifest["files"][file] = dict(fingerprints[file], chunk_ids=ids)
+            if merged_into:
+                manifest["files"][file]["merged_into"] = merged_into
+                touched.update(merged_into)
+            save_manifest(manifest, output_dir)
+            if dedup is not None:
+                dedup.save(minhash_path)
+            print(f"✅ Indexed {len(ids)} chunks from {file} ({len(manifest['files'])}/{len(files)} files)")
+
+        def checkpoint_batch() -> None:
+            file = state["file"]
+            save_checkpoint(None if file is None else dict(
+                state, sha256=fingerprints[file]["sha256"]
+            ), output_dir)
+
+        with timer.stage("load_model"):
+            embedding_model = get_embedding_model(cache_dir=embedding_cache_dir,
+                                                  cache_max_bytes=embedding_cache_max_bytes,
+                                                  backend=embedding_backend)
+        writer = StreamingIndexWriter(collection, embedding_model, batch_size,
+                                      on_file_done=commit_file, on_flush=checkpoint_batch, timer=timer)
+
+        # Step 2: Stream pages of added or changed files through splitting and embedding
+        chunk_count, page_count, skip_until, resumed_ids = 0, 0, 0, set()
+        try:
+            for file, docs, last_range in timer.iterate(extract_files(input_dir, to_index, workers=workers),
+                                                        "extract"):
+                if state["file"] != file:
+                    state.update(file=file, chunk_ids=[], merged_into={}, chunks_done=0)
+                    if in_progress and in_progress["file"] == file:
+                        state.update(chunk_ids=list(in_progress["chunk_ids"]),
+                                     merged_into=dict(in_progress["merged_into"]))
+                        skip_until, resumed_ids = in_progress["chunks_done"], set(in_progress["chunk_ids"])
+
+                with timer.stage("split"):
+                    chunks = split_range(text_splitter, docs, last_range)
+                for chunk in chunks:
+                    chunk_id = make_chunk_id(file, fingerprints[file]["sha256"], chunk_count)
+                    chunk_count += 1
+                    if chunk_count <= skip_until:
+                        # Already written before the interruption; only rebuild the dedup state
+                        if dedup is not None and chunk_id in resumed_ids:
+                            dedup.add(chunk_id, dedup.hasher.signature(chunk.page_content))
+                        continue
+                    if dedup is not None:
+                        with timer.stage("dedup"):
+                            signature = dedup.hasher.signature(chunk.page_content)
+                            rep_id = dedup.find_duplicate(signature)
+                        if rep_id is not None:
+                            writer.merge(rep_id, source_ref(chunk.metadata))
+                            state["merged_into"][rep_id] = state["merged_into"].get(rep_id, 0) + 1
+                            state["chunks_done"] = chunk_count
+                            continue
+                        dedup.add(chunk_id, signature)
+                    state["chunk_ids"].append(chunk_id)
+                    state["chunks_done"] = chunk_count
+                    writer.add(chunk, chunk_id)
+                page_count += len(docs)
+
+                if last_range:
+                    if page_count == 0:
+                        print(f"⚠️ No text extracted from: {file}")
+                    writer.close_file(file, state["chunk_ids"], state["merged_into"])
+                    state.update(file=None, chunk_ids=[], merged_into={}, chunks_done=0)
+                    chunk_count, page_count, skip_until, resumed_ids = 0, 0, 0, set()
+            writer.flush()
+        except KeyboardInterrupt:
+            print("⏸️ Interrupted. Finished files and batches are saved; rerun with --resume to continue.")
+            raise
+
+        if isinstance(embedding_model, CachedEmbeddings):
+            stats = embedding_model.cache.stats()
+            print(f"🗃️ Embedding cache: {stats['hits']} hits, {stats['misses']} misses, {stats['entries']} entries")
+
+    if dedup is not None:
+        dedup.save(minhash_path)
+        print(f"🧬 Collapsed {dedup.duplicates_found} near-duplicate chunks into their representatives")
+
+    save_manifest(manifest, output_dir)
+    print(f"✅ Embeddings saved to Chroma DB at: {persist_dir} ({collection.count()} chunks)")
+
+    # Step 3: Save text, metadata and embeddings to the memory-mapped chunk store
+    if not changed and chunk_store_current(manifest, output_dir):
+        # Nothing was added or removed: the chunk store and the indexes built from it are current
+        print("ℹ️ No chunk changes, chunk store and derived indexes are up to date.")
+        clear_checkpoint(output_dir)
+        return manifest
+    with timer.stage("export"):
+        rows = export_chunk_store(collection, manifest, output_dir, refresh=touched if store_exported else None)
+    print(f"✅ Chunk store with {rows} rows saved to: {os.path.join(output_dir, 'chunk_store')}")
+    if rows:
+        with timer.stage("bm25"):
+            terms = build_bm25_index(os.path.join(output_dir, "chunk_store"), os.path.join(output_dir, "bm25_index"))
+        print(f"✅ BM25 index with {terms} terms saved to: {os.path.join(output_dir, 'bm25_index')}")
+        with timer.stage("quantize"):
+            refresh_quantized_index(output_dir)
+    else:
+        # Every file was removed: indexes built from the old store would still return its chunks
+        for index_dir in ("bm25_index", "quantized_index"):
+            shutil.rmtree(os.path.join(output_dir, index_dir), ignore_errors=True)
+        print("🗑️ No chunks left, removed the chunk store, BM25 and quantized indexes")
+    manifest["chunk_store_exported"] = True
+    save_manifest(manifest, output_dir)
+    clear_checkpoint(output_dir)
+    return manifest
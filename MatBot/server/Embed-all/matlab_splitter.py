@@ -0,0 +1,146 @@
+import re
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from langchain.text_splitter import RecursiveCharacterTextSplitter
+from langchain.schema import Document
+
+# Headings of a MathWorks function/class reference page, in the order they usually appear
+SECTION_HEADINGS = (
+    "Syntax", "Description", "Examples", "Input Arguments", "Name-Value Arguments",
+    "Name-Value Pair Arguments", "Output Arguments", "Properties", "Object Functions", "Methods",
+    "Limitations", "Tips", "Algorithms", "Alternative Functionality", "References", "More About",
+    "Extended Capabilities", "Compatibility Considerations", "Version History", "See Also",
+)
+# Boilerplate that rarely answers a question but costs index space and prompt tokens
+DEFAULT_DROP_SECTIONS = ("Extended Capabilities", "Version History")
+# Running footers such as "1-1234" or "1 Alphabetical List"
+FOOTER_RE = re.compile(r"^(\d+-\d+|\d+ (Alphabetical List|Functions|Classes))$")
+IDENTIFIER_RE = re.compile(r"^[A-Za-z][\w.]{0,62}$")
+
+class MatlabDocSplitter:
+    """
+    Splits MathWorks reference PDFs on function pages instead of character counts.
+
+    A function page starts at an identifier line (the title), followed by a
+    one-line summary that is not an identifier and then a "Syntax" (or, for
+    classes, "Description") heading. Identifiers listed under "See Also" are
+    not titles: inside that section only the first line of a new PDF page can
+    start the next function. A page's sections are packed whole into chunks of
+    up to `max_chars`, so Syntax, Description and Examples stay together; only
+    a single section longer than that is split further.
+    Every chunk records the function name and its sections in metadata, and
+    continuation chunks repeat the name so they remain retrievable on their own.
+    Text outside function pages (user guides, front matter) falls back to a
+    regular recursive splitter.
+
+    Pages may be fed in several calls (one per extraction range); the page that
+    is still open carries over until `finish` is called for the file.
+    """
+
+    def __init__(self, max_chars: int = 2000, fallback_chunk_size: int = 1024, fallback_chunk_overlap: int = 192,
+                 drop_sections: Sequence[str] = DEFAULT_DROP_SECTIONS):
+        self.max_chars = max_chars
+        self.drop_sections = set(drop_sections)
+        self.fallback = RecursiveCharacterTextSplitter(chunk_size=fallback_chunk_size,
+                                                       chunk_overlap=fallback_chunk_overlap)
+        self._section_splitter = RecursiveCharacterTextSplitter(chunk_size=max_chars, chunk_overlap=0)
+        self._unit: Optional[Dict] = None
+        self._in_see_also = False  # The open function page's "See Also" list is being read
+
+    # -------------------- Streaming API --------------------
+    def feed(self, docs: List[Document]) -> List[Document]:
+        """
+        Splits the next pages of a file.
+        Args:
+            docs (List[Document]): Consecutive pages of one file.
+        Returns:
+            List[Document]: Chunks of every function page closed by these pages.
+        """
+        chunks = []
+        for doc in docs:
+            lines = [line.rstrip() for line in doc.page_content.splitlines()
+                     if not FOOTER_RE.match(line.strip())]
+            segment_start = 0
+            page_top = next((i for i, line in enumerate(lines) if line.strip()), None)
+            for i in range(len(lines)):
+                if lines[i].strip() in SECTION_HEADINGS:
+                    self._in_see_also = self._unit is not None and lines[i].strip() == "See Also"
+                elif self._is_function_start(lines, i) and (not self._in_see_also or i == page_top):
+                    chunks.extend(self._append(lines[segment_start:i], doc.metadata))
+                    chunks.extend(self._close_unit())
+                    self._unit = {"name": lines[i].strip(), "metadata": dict(doc.metadata), "lines": []}
+                    segment_start = i
+            chunks.extend(self._append(lines[segment_start:], doc.metadata))
+        return chunks
+
+    def finish(self) -> List[Document]:
+        """Closes the last open function page of the file."""
+        return self._close_unit()
+
+    def split_documents(self, docs: List[Document]) -> List[Document]:
+        """Splits all pages of one file at once."""
+        return self.feed(docs) + self.finish()
+
+    # -------------------- Page Segmentation --------------------
+    @staticmethod
+    def _is_function_start(lines: List[str], i: int) -> bool:
+        """A title, then a summary sentence (a wrapped one may take two lines), then Syntax or Description."""
+        name = lines[i].strip()
+        if not IDENTIFIER_RE.match(name) or name in SECTION_HEADINGS:
+            return False
+        following = [line.strip() for line in lines[i + 1:i + 8] if line.strip()][:4]
+        if not following or IDENTIFIER_RE.match(following[0]) or following[0] in SECTION_HEADINGS:
+            return False
+        return "Syntax" in following[1:4] or "Description" in following[1:3]
+
+    def _append(self, lines: List[str], metadata: Dict) -> List[Document]:
+        """Adds page lines to the open function page, or splits them as loose text."""
+        if self._unit is None:
+            text = "\n".join(lines).strip()
+            return self.fallback.split_documents([Document(page_content=text, metadata=dict(metadata))]) if text else []
+        # Continuation pages repeat the function name as a running header
+        if self._unit["lines"] and lines and lines[0].strip() == self._unit["name"]:
+            lines = lines[1:]
+        self._unit["lines"].extend(lines)
+        return []
+
+    def _sections(self, lines: List[str]) -> List[Tuple[str, str]]:
+        """Groups the lines of a function page into (heading, text) sections."""
+        sections, title, current = [], "Summary", []
+        for line in lines:
+            if line.strip() in SECTION_HEADINGS:
+                sections.append((title, "\n".join(current).strip()))
+                title, current = line.strip(), [line]
+            else:
+                current.append(line)
+        sections.append((title, "\n".join(current).strip()))
+        return [(title, text) for title, text in sections if text and title not in self.drop_sections]
+
+    def _close_unit(self) -> List[Document]:
+        """Packs the sections of the open function page into chunks."""
+        unit, self._unit = self._unit, None
+        self._in_see_also = False
+        if unit is None:
+            return []
+
+        name = unit["name"]
+        packed: List[Tuple[List[str], str]] = []
+        titles, text = [], ""
+        for title, section in self._sections(unit["lines"]):
+            pieces = [section] if len(section) <= self.max_chars else self._section_splitter.split_text(section)
+            for piece in pieces:
+                if text and len(text) + len(piece) + 1 > self.max_chars:
+                    packed.append((titles, text))
+                    titles, text = [], ""
+                if not text and packed:
+                    text = name  # Continuation chunks repeat the function name
+                text = f"{text}\n{piece}" if text else piece
+                if title not in titles:
+                    titles.append(title)
+        if text:
+            packed.append((titles, text))
+
+        return [
+            Document(page_content=text, metadata=dict(unit["metadata"], function=name, section=", ".join(titles)))
+            for titles, text in packed
+        ]
@@ -0,0 +1,225 @@
+import os
+import json
+import time
+import sqlite3
+import hashlib
+import threading
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+DEFAULT_ANSWER_CACHE_PATH = os.getenv("MATBOT_ANSWER_CACHE",
+                                      os.path.expanduser("~/.cache/matbot/answers.sqlite3"))
+DEFAULT_THRESHOLD = 0.92  # Cosine similarity; BGE paraphrases of one question usually score above this
+DEFAULT_TTL_SECONDS = 7 * 24 * 3600
+DEFAULT_MAX_ENTRIES = 5000
+
+# -------------------- Index Version --------------------
+def index_version(output_dir: str) -> str:
+    """
+    Fingerprints the indexed corpus so cached answers expire when it changes.
+    Args:
+        output_dir (str): Ingestion output directory.
+    Returns:
+        str: Hash of the manifest's settings and file hashes, or of the Chroma
+        database's modification time for indexes built without a manifest.
+    """
+    manifest_path = os.path.join(output_dir, "manifest.json")
+    if os.path.exists(manifest_path):
+        with open(manifest_path, "r", encoding="utf-8") as f:
+            manifest = json.load(f)
+        # chunk_store_exported only tracks the export of the same chunks
+        fingerprint = {key: value for key, value in manifest.items() if key not in ("files", "chunk_store_exported")}
+        fingerprint["files"] = {file: entry["sha256"] for file, entry in manifest["files"].items()}
+    else:
+        database = os.path.join(output_dir, "chroma_index", "chroma.sqlite3")
+        fingerprint = {"chroma_mtime_ns": os.stat(database).st_mtime_ns if os.path.exists(database) else None}
+    return hashlib.sha256(json.dumps(fingerprint, sort_keys=True).encode("utf-8")).hexdigest()[:16]
+
+def _index_stamp(output_dir: str) -> Optional[Tuple[int, int]]:
+    """Modification time and size of the file index_version reads."""
+    for path in (os.path.join(output_dir, "manifest.json"), os.path.join(output_dir, "chroma_index", "chroma.sqlite3")):
+        if os.path.exists(path):
+            stat = os.stat(path)
+            return stat.st_mtime_ns, stat.st_size
+    return None
+
+def index_version_checker(output_dirs: Sequence[str]) -> Callable[[], str]:
+    """
+    Tracks the combined index version of several ingestion output directories.
+    Args:
+        output_dirs (Sequence[str]): Ingestion output directories.
+    Returns:
+        Callable[[], str]: Returns the current version; it re-reads the manifests only
+            when one of them changed on disk, so it is cheap enough to call per query.
+    """
+    state = {"stamp": None, "version": ""}
+
+    def current() -> str:
+        stamp = [_index_stamp(output_dir) for output_dir in output_dirs]
+        if stamp != state["stamp"]:
+            state["stamp"] = stamp
+            state["version"] = "+".join(index_version(output_dir) for output_dir in output_dirs)
+        return state["version"]
+    return current
+
+def _normalize_query(query: str) -> str:
+    return " ".join(query.lower().split())
+
+# -------------------- Answer Cache --------------------
+class SemanticAnswerCache:
+    """
+    Caches generated answers by query meaning rather than exact text.
+
+    Entries (query embedding, answer, source metadata) persist in SQLite and are
+    mirrored in an in-memory matrix, so a lookup is one matrix-vector product.
+    A query whose cosine similarity to a cached query reaches `threshold` gets
+    the cached answer; the same query text (up to case and spacing) matches
+    without an embedding. Entries expire after `ttl_seconds`, the least recently
+    used ones are evicted beyond `max_entries`, and entries written for another
+    index version are dropped on open and, with `version_fn`, as soon as the
+    index is rebuilt under a running app.
+    """
+
+    def __init__(self, path: str = DEFAULT_ANSWER_CACHE_PATH, version: str = "",
+                 threshold: float = DEFAULT_THRESHOLD, ttl_seconds: float = DEFAULT_TTL_SECONDS,
+                 max_entries: int = DEFAULT_MAX_ENTRIES, version_fn: Optional[Callable[[], str]] = None):
+        self.version = version
+        self.version_fn = version_fn
+        self.threshold = threshold
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.executescript("""
+            CREATE TABLE IF NOT EXISTS answers (
+                id INTEGER PRIMARY KEY,
+                version TEXT NOT NULL,
+                variant TEXT NOT NULL,
+                query TEXT NOT NULL,
+                embedding BLOB NOT NULL,
+                answer TEXT NOT NULL,
+                metadata TEXT NOT NULL,
+                created REAL NOT NULL,
+                last_used REAL NOT NULL
+            );
+        """)
+        self._db.execute("DELETE FROM answers WHERE version != ? OR created < ?",
+                         (version, time.time() - ttl_seconds))
+        self._db.commit()
+        self._load()
+
+    def _load(self) -> None:
+        """Mirrors the stored embeddings in memory."""
+        rows = self._db.execute("SELECT id, variant, embedding, created, query FROM answers ORDER BY id").fetchall()
+        self._ids = np.array([row[0] for row in rows], dtype=np.int64)
+        self._variants = [row[1] for row in rows]
+        self._queries = [_normalize_query(row[4]) for row in rows]
+        self._created = np.array([row[3] for row in rows], dtype=np.float64)
+        self._matrix = (np.stack([np.frombuffer(row[2], dtype=np.float32) for row in rows])
+                        if rows else np.zeros((0, 0), dtype=np.float32))
+
+    def __len__(self) -> int:
+        return len(self._ids)
+
+    @staticmethod
+    def _normalize(embedding: Sequence[float]) -> np.ndarray:
+        vector = np.asarray(embedding, dtype=np.float32)
+        return vector / max(float(np.linalg.norm(vector)), 1e-12)
+
+    def _sync_version(self) -> None:
+        """Drops every answer when the index version has changed since the last call."""
+        if self.version_fn is None:
+            return
+        version = self.version_fn()
+        if version != self.version:
+            print(f"♻️ Index version changed ({self.version} -> {version}), dropping cached answers")
+            self.version = version
+            self._db.execute("DELETE FROM answers WHERE version != ?", (version,))
+            self._db.commit()
+            self._load()
+
+    def lookup(self, embedding: Optional[Sequence[float]], variant: str = "",
+               query: Optional[str] = None) -> Optional[Tuple[str, List[Dict], float]]:
+        """
+        Finds a cached answer for the same or a semantically equivalent query.
+        Args:
+            embedding (Optional[Sequence[float]]): Query embedding (None matches the query text only).
+            variant (str): Generation variant (e.g. web search, source scope); only equal variants match.
+            query (Optional[str]): Query text; an identical earlier query matches with similarity 1.0.
+        Returns:
+            Optional[tuple]: Answer, source metadata and similarity, or None on a miss.
+        """
+        with self._lock:
+            self._sync_version()
+            best, similarity = None, 0.0
+            if len(self._ids):
+                valid = ((np.array(self._variants) == variant)
+                         & (self._created >= time.time() - self.ttl_seconds))
+                if query is not None:
+                    exact = np.flatnonzero(valid & (np.array(self._queries) == _normalize_query(query)))
+                    if len(exact):
+                        best, similarity = int(exact[-1]), 1.0
+                if best is None and embedding is not None and self._matrix.shape[1] == len(embedding):
+                    scores = np.where(valid, self._matrix @ self._normalize(embedding), -1.0)
+                    candidate = int(np.argmax(scores))
+                    if scores[candidate] >= self.threshold:
+                        best, similarity = candidate, float(scores[candidate])
+            if best is None:
+                self.misses += 1
+                return None
+            answer, metadata = self._db.execute("SELECT answer, metadata FROM answers WHERE id = ?",
+                                                (int(self._ids[best]),)).fetchone()
+            self._db.execute("UPDATE answers SET last_used = ? WHERE id = ?", (time.time(), int(self._ids[best])))
+            self._db.commit()
+            self.hits += 1
+            return answer, json.loads(metadata), similarity
+
+    def store(self, query: str, embedding: Sequence[float], answer: str, metadata: List[Dict],
+              variant: str = "") -> None:
+        """
+        Caches a generated answer, evicting expired and least recently used entries.
+        Args:
+            query (str): Query text (kept for inspection).
+            embedding (Sequence[float]): Query embedding.
+            answer (str): Generated answer.
+            metadata (List[Dict]): Metadata of the documents the answer used.
+            variant (str): Generation variant.
+        """
+        vector = self._normalize(embedding)
+        now = time.time()
+        with self._lock:
+            self._sync_version()
+            row_id = self._db.execute(
+                "INSERT INTO answers (version, variant, query, embedding, answer, metadata, created, last_used) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (self.version, variant, query, vector.tobytes(), answer, json.dumps(metadata, default=str), now, now)
+            ).lastrowid
+            evicted = self._db.execute("DELETE FROM answers WHERE created < ?", (now - self.ttl_seconds,)).rowcount
+            evicted += self._db.execute("DELETE FROM answers WHERE id NOT IN "
+                                        "(SELECT id FROM answers ORDER BY last_used DESC LIMIT ?)",
+                                        (self.max_entries,)).rowcount
+            self._db.commit()
+            if evicted or self._matrix.shape[1] not in (0, len(vector)):
+                self._load()
+            else:
+                self._ids = np.append(self._ids, row_id)
+                self._variants.append(variant)
+                self._queries.append(_normalize_query(query))
+                self._created = np.append(self._created, now)
+                self._matrix = np.vstack([self._matrix.reshape(-1, len(vector)), vector])
+
+    def clear(self) -> None:
+        """Drops every cached answer."""
+        with self._lock:
+            self._db.execute("DELETE FROM answers")
+            self._db.commit()
+            self._load()
+
+    def stats(self) -> dict:
+        """Returns hit/miss counters and the number of cached answers."""
+        return {"hits": self.hits, "misses": self.misses, "entries": len(self)}
@@ -1,52 +1,213 @@
+import os
+import time
 import torch
-from typing import Dict, List, Optional
-from transformers import AutoModelForCausalLM, AutoTokenizer, pipeline, BitsAndBytesConfig
+from concurrent.futures import ThreadPoolExecutor
+from threading import Thread
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple, Union
+from transformers import AutoModelForCausalLM, AutoTokenizer, pipeline, BitsAndBytesConfig, TextIteratorStreamer
 from langchain_huggingface import HuggingFaceEmbeddings  # Updated import
 from langchain_chroma import Chroma  # Updated import
 from langchain.schema import Document
 from langchain_community.document_loaders import WikipediaLoader
 from langchain_community.tools.tavily_search import TavilySearchResults
+from answer_cache import DEFAULT_ANSWER_CACHE_PATH, SemanticAnswerCache, index_version_checker
+from bm25_index import load_bm25_index, reciprocal_rank_fusion
+from context_builder import ContextBuilder
+from cpu_backend import CPU_MODE, load_cpu_model
+from generation_budget import (DEADLINE_SECONDS, DOCUMENTATION_HEADING, MAX_NEW_TOKENS, QUESTION_HEADING, WEB_HEADING,
+                               GenerationBudget, stopping_kwargs, strip_stop_markers)
+from generation_scheduler import GenerationScheduler
+from prefix_cache import PrefixKVCache, load_prefix_cache
+from multi_index import MultiIndexRetriever
+from numpy_store import load_numpy_store
+from onnx_embeddings import ONNXEmbeddings
+from quantized_index import load_quantized_store
+from query_cache import DEFAULT_QUERY_CACHE_DIR, cache_query_embeddings
+from source_router import SourceRouter, indexed_sources
+from speculative import DRAFT_MODEL, NUM_ASSISTANT_TOKENS, SpeculativeDecoder, load_speculative_decoder
+
+# -------------------- Vector Store Backends --------------------
+# Every backend returns an object with similarity_search_by_vector(embedding, k) -> List[Document];
+# the chunk-store backends also take sources=[...] to search only those files' row partitions
+VECTORSTORE_BACKEND = os.getenv("MATBOT_VECTORSTORE", "chroma")
+EMBEDDING_BACKEND = os.getenv("MATBOT_EMBEDDINGS", "huggingface")
+
+def _persist_dirs(persist_dir: Union[str, Sequence[str]]) -> List[str]:
+    """One or several Chroma index directories as a list."""
+    return [persist_dir] if isinstance(persist_dir, str) else list(persist_dir)
+
+def _output_dir(persist_dir: str) -> str:
+    """Ingestion output directory holding a Chroma index and the files written next to it."""
+    return os.path.dirname(os.path.normpath(persist_dir))
+
+def _load_chroma(persist_dir, embedding_model, **options):
+    """Chroma persistent client (SQLite + hnswlib HNSW index)."""
+    return Chroma(persist_directory=persist_dir, embedding_function=embedding_model)
+
+def _load_numpy(persist_dir, embedding_model, **options):
+    """Exact search over the memory-mapped chunk store written next to the Chroma index."""
+    vectorstore = load_numpy_store(_output_dir(persist_dir))
+    print(f"✅ Loaded NumPy exact-search store ({len(vectorstore)} chunks)")
+    return vectorstore
+
+def _load_quantized(persist_dir, embedding_model, candidates=100, **options):
+    """int8/binary first pass re-ranked against the full-precision chunk store."""
+    vectorstore = load_quantized_store(_output_dir(persist_dir), candidates)
+    print(f"✅ Loaded {vectorstore.index.mode} quantized index ({len(vectorstore.store)} chunks)")
+    return vectorstore
+
+VECTORSTORE_BACKENDS = {
+    "chroma": _load_chroma,
+    "numpy": _load_numpy,
+    "quantized": _load_quantized,
+}
+
+def load_vectorstore(backend=VECTORSTORE_BACKEND, persist_dir="Embed-all-Act/chroma_index", embedding_model=None,
+                     **options):
+    """
+    Opens a vector store backend over an ingestion output.
+    Args:
+        backend (str): "chroma", "numpy" or "quantized" (default: $MATBOT_VECTORSTORE or "chroma").
+        persist_dir (str): Directory of the Chroma index; the other backends read the
+            chunk store and indexes written next to it.
+        embedding_model: Embedding model (only used by Chroma for text queries).
+        **options: Backend options, e.g. candidates for "quantized".
+    Returns:
+        Vector store instance.
+    """
+    if backend not in VECTORSTORE_BACKENDS:
+        raise ValueError(f"Unknown vectorstore backend '{backend}', expected one of {sorted(VECTORSTORE_BACKENDS)}")
+    return VECTORSTORE_BACKENDS[backend](persist_dir, embedding_model, **options)
 
 # -------------------- Load Embeddings + Chroma Vectorstore --------------------
-def load_embedding_model(persist_dir="Embed-all-Act/chroma_index"):
+def load_embedding_model(persist_dir="Embed-all-Act/chroma_index", backend=VECTORSTORE_BACKEND, candidates=100,
+                         query_cache_size=1024, query_cache_dir=DEFAULT_QUERY_CACHE_DIR,
+                         embedding_backend=EMBEDDING_BACKEND):
     """
     Loads the embedding model and Chroma vectorstore.
+    Several index directories (e.g. indexes built with different chunk sizes) are
+    opened as one MultiIndexRetriever that searches them concurrently.
     Args:
-        persist_dir (str): Directory to persist the Chroma index.
+        persist_dir (Union[str, Sequence[str]]): Directory of the Chroma index, or a list of them.
+        backend (str): Vector store backend, see load_vectorstore.
+        candidates (int): Candidates re-ranked per query by the quantized backend.
+        query_cache_size (int): Query embeddings kept in memory; 0 disables the query cache.
+        query_cache_dir (Optional[str]): On-disk query cache that survives restarts; None keeps it in memory.
+        embedding_backend (str): "huggingface" (PyTorch) or "onnx" (int8 ONNX Runtime, CPU only).
     Returns:
         tuple: Embedding model and Chroma vectorstore instance.
     """
     device = "cuda" if torch.cuda.is_available() else "cpu"
+    if embedding_backend == "onnx":
+        device = "cpu (ONNX Runtime int8)"
     print(f"🔄 Loading embedding model on {device}...")
 
     try:
-        embedding_model = HuggingFaceEmbeddings(
-            model_name="BAAI/bge-base-en-v1.5",
-            model_kwargs={"device": device}
-        )
+        if embedding_backend == "onnx":
+            embedding_model = ONNXEmbeddings("BAAI/bge-base-en-v1.5")
+            cache_name = embedding_model.cache_name
+        else:
+            embedding_model = HuggingFaceEmbeddings(
+                model_name="BAAI/bge-base-en-v1.5",
+                model_kwargs={"device": device}
+            )
+            cache_name = "BAAI/bge-base-en-v1.5"
+        if query_cache_size:
+            embedding_model = cache_query_embeddings(embedding_model, cache_name, query_cache_size, query_cache_dir)
 
-        vectorstore = Chroma(
-            persist_directory=persist_dir,
-            embedding_function=embedding_model
+        persist_dirs = _persist_dirs(persist_dir)
+        vectorstores = {directory: load_vectorstore(backend, directory, embedding_model, candidates=candidates)
+                        for directory in persist_dirs}
+        if len(vectorstores) == 1:
+            return embedding_model, vectorstores[persist_dirs[0]]
+        print(f"✅ Searching {len(vectorstores)} indexes in parallel: {', '.join(persist_dirs)}")
+        vectorstore = MultiIndexRetriever(
+            vectorstores, search=_dense_search,
+            search_many=lambda store, embeddings, k: _search_many(store, embeddings, k, workers=1)
         )
         return embedding_model, vectorstore
     except Exception as e:
         raise RuntimeError(f"Failed to load embedding model or vectorstore: {e}")
 
+def load_lexical_index(persist_dir="Embed-all-Act/chroma_index"):
+    """
+    Loads the BM25 index built next to the Chroma index by the ingestion scripts.
+    Args:
+        persist_dir (Union[str, Sequence[str]]): Directory of the Chroma index; with several,
+            the BM25 index of the first one is used.
+    Returns:
+        BM25Index or None: The lexical index, or None when it has not been built.
+    """
+    lexical_index = load_bm25_index(_output_dir(_persist_dirs(persist_dir)[0]))
+    if lexical_index is None:
+        print("⚠ No BM25 index found, hybrid retrieval disabled (rerun the ingestion scripts)")
+    return lexical_index
+
+def load_answer_cache(persist_dir="Embed-all-Act/chroma_index", path=DEFAULT_ANSWER_CACHE_PATH, **options):
+    """
+    Opens the semantic answer cache, dropping answers generated against an older index
+    (also when the index is rebuilt while the app runs).
+    Args:
+        persist_dir (Union[str, Sequence[str]]): Directory of the Chroma index, or a list of them.
+        path (str): SQLite file of the cache.
+        **options: threshold, ttl_seconds and max_entries of SemanticAnswerCache.
+    Returns:
+        SemanticAnswerCache: Answer cache.
+    """
+    version_fn = index_version_checker([_output_dir(directory) for directory in _persist_dirs(persist_dir)])
+    version = version_fn()
+    answer_cache = SemanticAnswerCache(path, version, version_fn=version_fn, **options)
+    print(f"✅ Loaded answer cache ({len(answer_cache)} answers for index version {version})")
+    return answer_cache
+
+def load_source_router(persist_dir="Embed-all-Act/chroma_index", max_sources=3):
+    """
+    Builds the query router that scopes retrieval to the relevant manuals.
+    Args:
+        persist_dir (Union[str, Sequence[str]]): Directory of the Chroma index, or a list of them.
+        max_sources (int): Most manuals a routed query may be scoped to.
+    Returns:
+        SourceRouter or None: The router, or None when the indexed sources are unknown.
+    """
+    sources = set()
+    for directory in _persist_dirs(persist_dir):
+        sources.update(indexed_sources(_output_dir(directory)) or [])
+    if not sources:
+        print("⚠ No chunk store or manifest found, source routing disabled (rerun the ingestion scripts)")
+        return None
+    return SourceRouter(sources, max_sources=max_sources)
+
 # -------------------- Load Mistral Model --------------------
-def load_mistral_model(model_id="mistralai/Mistral-7B-Instruct-v0.2", use_4bit=True):
+# Shared by the pipeline and streaming generation
+GENERATION_KWARGS = {
+    "max_new_tokens": 1024,
+    "do_sample": True,
+    "temperature": 0.3,
+    "top_k": 50,
+    "top_p": 0.95,
+    "repetition_penalty": 1.2,
+}
+
+def load_mistral_model(model_id="mistralai/Mistral-7B-Instruct-v0.2", use_4bit=True, device=None,
+                       cpu_mode=CPU_MODE, cpu_threads=None):
     """
     Loads the Mistral model for text generation.
     Args:
         model_id (str): Model identifier.
-        use_4bit (bool): Whether to use 4-bit quantization.
+        use_4bit (bool): Whether to use 4-bit quantization (GPU only; bitsandbytes needs CUDA).
+        device (Optional[str]): "cuda" or "cpu" (default: "cuda" when available).
+        cpu_mode (str): CPU weights: "auto", "int8", "bf16" or "fp32", see cpu_backend.load_cpu_model.
+        cpu_threads (Optional[int]): CPU intra-op threads (default: physical cores).
     Returns:
         pipeline: Text generation pipeline.
     """
+    device = device or ("cuda" if torch.cuda.is_available() else "cpu")
     print(f"🔄 Loading {model_id}...")
 
     try:
-        if use_4bit:
+        if device == "cpu":
+            model, _ = load_cpu_model(model_id, cpu_mode, cpu_threads)
+        elif use_4bit:
             quant_config = BitsAndBytesConfig(
                 load_in_4bit=True, 
                 bnb_4bit_compute_dtype=torch.float16
@@ -71,22 +232,83 @@ def load_mistral_model(model_id="mistralai/Mistral-7B-Instruct-v0.2", use_4bit=T
             "text-generation",
             model=model,
             tokenizer=tokenizer,
-            device_map="auto",
-            max_new_tokens=1024,
-            do_sample=True,
-            temperature=0.3,
-            top_k=50,
-            top_p=0.95,
-            repetition_penalty=1.2,
-            pad_token_id=tokenizer.eos_token_id
+            **({"device_map": "auto"} if device != "cpu" else {}),
+            pad_token_id=tokenizer.eos_token_id,
+            **GENERATION_KWARGS
         )
         return text_gen
     except Exception as e:
         raise RuntimeError(f"Failed to load Mistral model: {e}")
 
+def load_generation_scheduler(model_pipeline, max_batch_size=8, max_wait_ms=20, prefix_cache=None, speculative=None):
+    """
+    Wraps the Mistral pipeline in a scheduler that batches the prompts of concurrent callers.
+    Args:
+        model_pipeline: Text generation pipeline from load_mistral_model.
+        max_batch_size (int): Most prompts generated together.
+        max_wait_ms (float): How long a prompt waits for others to batch with.
+        prefix_cache (Optional[PrefixKVCache]): Reused for prompts that run alone.
+        speculative (Optional[SpeculativeDecoder]): Drafts tokens for prompts that run alone.
+    Returns:
+        GenerationScheduler: Scheduler shared by all callers of the pipeline.
+    """
+    scheduler = GenerationScheduler(model_pipeline, GENERATION_KWARGS, max_batch_size, max_wait_ms, prefix_cache,
+                                    speculative)
+    print(f"✅ Generation scheduler ready (batches of up to {max_batch_size}, {max_wait_ms} ms wait)")
+    return scheduler
+
+def load_prompt_prefix_cache(model_pipeline):
+    """
+    Prefills the constant system instructions of format_prompt once, for reuse by every request.
+    Args:
+        model_pipeline: Text generation pipeline from load_mistral_model.
+    Returns:
+        PrefixKVCache or None: The prefix cache, or None when the model cannot provide one.
+    """
+    prefix_cache = load_prefix_cache(model_pipeline, PROMPT_PREFIX)
+    if prefix_cache is not None:
+        print(f"✅ Cached the {len(prefix_cache)}-token prompt prefix ({prefix_cache.prefill_seconds:.2f}s prefill)")
+    return prefix_cache
+
+def load_speculative_decoding(model_pipeline, draft_model_id=DRAFT_MODEL, num_assistant_tokens=NUM_ASSISTANT_TOKENS):
+    """
+    Loads a draft model that proposes tokens for Mistral to verify (speculative decoding).
+    Args:
+        model_pipeline: Text generation pipeline from load_mistral_model.
+        draft_model_id (Optional[str]): Small model sharing Mistral's tokenizer (default: $MATBOT_DRAFT_MODEL;
+            unset turns speculative decoding off).
+        num_assistant_tokens (int): Tokens drafted per verification step.
+    Returns:
+        SpeculativeDecoder or None: The decoder, or None when off or the draft cannot be used.
+    """
+    speculative = load_speculative_decoder(model_pipeline, draft_model_id, num_assistant_tokens)
+    if speculative is not None:
+        print(f"✅ Speculative decoding with {draft_model_id} ({num_assistant_tokens} draft tokens per step)")
+    return speculative
+
 # -------------------- Prompt Formatter --------------------
 from typing import Optional
 
+# Constant head of every prompt: its KV cache is computed once and reused (see prefix_cache.py).
+# It ends on a newline so tokenizing it alone yields the same ids as inside a full prompt.
+PROMPT_PREFIX = f"""<s>[INST] You are an expert technical assistant specializing in MATLAB, programming, and data analysis. 
+
+            System Instructions:
+            1. Answer the user's question based primarily on the provided documentation context.
+            2. If the documentation context is insufficient, use any additional web search information provided.
+            3. Provide practical, step-by-step solutions.
+            4. Include relevant code examples when helpful.
+            5. If you're unsure or if information is missing, acknowledge the limitations in your answer.
+            6. Format your response in well-structured Markdown to make it easily readable on the web.
+            7. Focus on technical accuracy and precision.
+            8. While responding write only the MATLAB code in '' code block.
+            9. Do not include any other text in the code block.
+            10. Ensure good formatting and readability in your response and have good spacing too.
+            
+
+            {DOCUMENTATION_HEADING}
+"""
+
 def format_prompt(question: str, context: str, additional_web_context: Optional[str] = None) -> str:
     """
     Creates a well-structured prompt for the Mistral model that will return nicely formatted Markdown.
@@ -104,57 +326,205 @@ def format_prompt(question: str, context: str, additional_web_context: Optional[
     web_context_section = ""
     if additional_web_context:
         web_context_section = f"""
-        ## Additional Information From Web Search:
+        {WEB_HEADING}
         
         
         {additional_web_context}
         
         """
     
-    return f"""<s>[INST] You are an expert technical assistant specializing in MATLAB, programming, and data analysis. 
-
-            System Instructions:
-            1. Answer the user's question based primarily on the provided documentation context.
-            2. If the documentation context is insufficient, use any additional web search information provided.
-            3. Provide practical, step-by-step solutions.
-            4. Include relevant code examples when helpful.
-            5. If you're unsure or if information is missing, acknowledge the limitations in your answer.
-            6. Format your response in well-structured Markdown to make it easily readable on the web.
-            7. Focus on technical accuracy and precision.
-            8. While responding write only the MATLAB code in '' code block.
-            9. Do not include any other text in the code block.
-            10. Ensure good formatting and readability in your response and have good spacing too.
-            
-
-            ## Documentation Context:
-
+    return PROMPT_PREFIX + f"""
             code
             {cleaned_context}
             
             {web_context_section}
-            ## User Question: 
+            {QUESTION_HEADING} 
             {question} [/INST]
         """
         
 
 # -------------------- Query Database --------------------
-def query_database(query: str, embedding_model, vectorstore, k: int = 5) -> List[Document]:
+def _dense_search(vectorstore, embedding: List[float], k: int, sources: Optional[List[str]] = None) -> List[Document]:
+    """Nearest-neighbour search, pre-filtered to the chunks of the given source files."""
+    if not sources:
+        return vectorstore.similarity_search_by_vector(embedding, k=k)
+    if isinstance(vectorstore, Chroma):
+        # Chroma applies the metadata filter before the vector search
+        where = {"source": sources[0]} if len(sources) == 1 else {"source": {"$in": sources}}
+        return vectorstore.similarity_search_by_vector(embedding, k=k, filter=where)
+    return vectorstore.similarity_search_by_vector(embedding, k=k, sources=sources)
+
+def _route(query: str, sources: Optional[List[str]], source_router) -> Optional[List[str]]:
+    """Explicit sources win; otherwise the router picks them (None searches every source)."""
+    if sources is None and source_router is not None:
+        sources = source_router.route(query)
+    return sources or None
+
+def _lexical_identifier(query: str, lexical_index) -> Optional[str]:
+    """The identifier a query consists of, if the lexical index knows it (such queries skip embedding)."""
+    return lexical_index.identifier(query) if lexical_index is not None else None
+
+def query_database(query: str, embedding_model, vectorstore, k: int = 5, lexical_index=None,
+                   candidates: int = 20, sources: Optional[List[str]] = None,
+                   source_router=None, query_embedding: Optional[List[float]] = None) -> List[Document]:
     """
     Queries the database for top-k similar documents.
+    With a lexical index, dense and BM25 rankings are fused with reciprocal rank
+    fusion, and a query that is just a known identifier (e.g. "ode45") is answered
+    from BM25 alone without running the embedding model. Retrieval can be scoped
+    to some source files, given explicitly or picked by a SourceRouter.
     Args:
         query (str): User query.
         embedding_model: Embedding model instance.
         vectorstore: Chroma vectorstore instance.
         k (int): Number of top results to return.
+        lexical_index: Optional BM25 index over the same chunks.
+        candidates (int): Results taken from each retriever before fusion.
+        sources (Optional[List[str]]): Only search chunks of these source files.
+        source_router: Optional SourceRouter used when sources is not given.
+        query_embedding (Optional[List[float]]): Embedding of the query, if already computed.
     Returns:
         List[Document]: Top-k similar documents.
     """
-    print("🔎 Embedding user query and searching database...")
-    embedded_query = embedding_model.embed_query(query)
-    docs = vectorstore.similarity_search_by_vector(embedded_query, k=k)
+    sources = _route(query, sources, source_router)
+    if sources:
+        print(f"🧭 Searching only {', '.join(sources)}")
+
+    identifier = _lexical_identifier(query, lexical_index)
+    if identifier:
+        print(f"🔤 Exact identifier '{identifier}', searching the lexical index only...")
+        docs = lexical_index.similarity_search(query, k=k, sources=sources)
+        print(f"✅ Found {len(docs)} relevant documents")
+        return docs
+
+    if query_embedding is None:
+        print("🔎 Embedding user query and searching database...")
+        embedded_query = embedding_model.embed_query(query)
+    else:
+        print("🔎 Searching database...")
+        embedded_query = query_embedding
+    if lexical_index is None:
+        docs = _dense_search(vectorstore, embedded_query, k, sources)
+    else:
+        dense_docs = _dense_search(vectorstore, embedded_query, max(k, candidates), sources)
+        lexical_docs = lexical_index.similarity_search(query, k=max(k, candidates), sources=sources)
+        docs = reciprocal_rank_fusion([dense_docs, lexical_docs], k=k)
     print(f"✅ Found {len(docs)} relevant documents")
     return docs
 
+def _timed(search: Callable[[], List[Document]]) -> Tuple[List[Document], float]:
+    """Runs one search and measures its wall time."""
+    started = time.perf_counter()
+    docs = search()
+    return docs, time.perf_counter() - started
+
+def _search_many(vectorstore, embeddings: List[List[float]], k: int,
+                 workers: int) -> Tuple[List[List[Document]], List[float]]:
+    """
+    Runs several nearest-neighbour searches, batched when the backend supports it.
+    Returns the results and the seconds spent on each search; a batched search
+    is shared equally between its queries.
+    """
+    if not embeddings:
+        return [], []
+    started = time.perf_counter()
+    if hasattr(vectorstore, "similarity_search_by_vectors"):
+        results = vectorstore.similarity_search_by_vectors(embeddings, k=k)
+    elif isinstance(vectorstore, Chroma):
+        # One collection query answers every embedding
+        records = vectorstore._collection.query(query_embeddings=embeddings, n_results=k,
+                                                include=["documents", "metadatas"])
+        results = [
+            [Document(page_content=text, metadata=metadata or {}) for text, metadata in zip(texts, metadatas)]
+            for texts, metadatas in zip(records["documents"], records["metadatas"])
+        ]
+    else:
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            timed = list(pool.map(lambda embedding: _timed(
+                lambda: vectorstore.similarity_search_by_vector(embedding, k=k)), embeddings))
+        return [docs for docs, _ in timed], [seconds for _, seconds in timed]
+    share = (time.perf_counter() - started) / len(embeddings)
+    return results, [share] * len(embeddings)
+
+def query_database_many(queries: List[str], embedding_model, vectorstore, k: int = 5, lexical_index=None,
+                        candidates: int = 20, workers: int = 4,
+                        source_router=None) -> Tuple[List[List[Document]], Dict]:
+    """
+    Queries the database for several queries in one pass.
+    All queries are embedded in a single batch (cache hits skip the model), the
+    unscoped nearest-neighbour searches run together, and scoped searches, BM25
+    searches and fusion run across a thread pool. Results match query_database
+    for each query.
+    Args:
+        queries (List[str]): User queries.
+        embedding_model: Embedding model instance.
+        vectorstore: Vectorstore instance.
+        k (int): Number of top results per query.
+        lexical_index: Optional BM25 index over the same chunks.
+        candidates (int): Results taken from each retriever before fusion.
+        workers (int): Threads for searches that cannot be batched.
+        source_router: Optional SourceRouter scoping each query to some source files.
+    Returns:
+        tuple: Top-k documents per query, and timings: embed, search and total seconds and queries per
+            second of the pass, and under "per_query" one dict per query with its embed and search
+            seconds (dense search, BM25 and fusion; batched work is shared equally between its queries).
+    """
+    started = time.perf_counter()
+    scopes = [_route(query, None, source_router) for query in queries]
+    lexical_only = set()
+    if lexical_index is not None:
+        lexical_only = {i for i, query in enumerate(queries) if lexical_index.identifier(query)}
+    dense = [i for i in range(len(queries)) if i not in lexical_only]
+    print(f"🔎 Embedding {len(dense)} queries and searching database...")
+
+    embed_many = getattr(embedding_model, "embed_queries", embedding_model.embed_documents)
+    embeddings = embed_many([queries[i] for i in dense]) if dense else []
+    embedded = time.perf_counter()
+
+    dense_k = k if lexical_index is None else max(k, candidates)
+    embedding_of = dict(zip(dense, embeddings))
+    unscoped = [i for i in dense if not scopes[i]]
+    unscoped_docs, unscoped_seconds = _search_many(vectorstore, [embedding_of[i] for i in unscoped], dense_k, workers)
+    dense_docs = dict(zip(unscoped, unscoped_docs))
+    search_seconds = dict(zip(unscoped, unscoped_seconds))
+
+    def finish(i: int) -> Tuple[List[Document], float]:
+        if i in lexical_only:
+            return _timed(lambda: lexical_index.similarity_search(queries[i], k=k, sources=scopes[i]))
+        seconds = search_seconds.get(i, 0.0)
+        if i in dense_docs:
+            docs = dense_docs[i]
+        else:
+            docs, scoped_seconds = _timed(lambda: _dense_search(vectorstore, embedding_of[i], dense_k, scopes[i]))
+            seconds += scoped_seconds
+        if lexical_index is None:
+            return docs, seconds
+        docs, fusion_seconds = _timed(lambda: reciprocal_rank_fusion(
+            [docs, lexical_index.similarity_search(queries[i], k=max(k, candidates), sources=scopes[i])], k=k))
+        return docs, seconds + fusion_seconds
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        finished_queries = list(pool.map(finish, range(len(queries))))
+    finished = time.perf_counter()
+    results = [docs for docs, _ in finished_queries]
+    embed_share = (embedded - started) / len(dense) if dense else 0.0
+
+    timings = {
+        "queries": len(queries),
+        "embed_seconds": embedded - started,
+        "search_seconds": finished - embedded,
+        "total_seconds": finished - started,
+        "queries_per_second": len(queries) / (finished - started) if finished > started else 0.0,
+        "per_query": [
+            {"query": query, "lexical_only": i in lexical_only,
+             "embed_seconds": 0.0 if i in lexical_only else embed_share, "search_seconds": seconds}
+            for i, (query, (_, seconds)) in enumerate(zip(queries, finished_queries))
+        ],
+    }
+    print(f"✅ Retrieved documents for {len(queries)} queries in {timings['total_seconds']:.2f}s "
+          f"({timings['queries_per_second']:.1f} queries/s)")
+    return results, timings
+
 # -------------------- Web Search Function --------------------
 def search_web(query: str, tavily_api_key: str) -> Dict[str, str]:
     """
@@ -200,9 +570,82 @@ def search_web(query: str, tavily_api_key: str) -> Dict[str, str]:
     combined_context = "\n\n".join(filter(None, [wiki_context, web_context]))
     return {"context": combined_context}
 
+# -------------------- Streaming Generation --------------------
+def stream_generate(model_pipeline, prompt: str, prefix_cache: Optional[PrefixKVCache] = None,
+                    speculative: Optional[SpeculativeDecoder] = None, budget: Optional[GenerationBudget] = None,
+                    **generation_kwargs) -> Iterator[str]:
+    """
+    Generates a completion, yielding text as soon as each token is decoded.
+    The model runs on a background thread and hands decoded text to this generator.
+    Args:
+        model_pipeline: Text generation pipeline (its model and tokenizer are used directly).
+        prompt (str): Prompt, including the <s>[INST] markers.
+        prefix_cache (Optional[PrefixKVCache]): Skips the prefill of the prompt's cached prefix (not with
+            `speculative`: assisted generation would hand the target's cache to the draft model).
+        speculative (Optional[SpeculativeDecoder]): Lets a draft model propose tokens for the model to verify.
+        budget (Optional[GenerationBudget]): Token budget, deadline and stop markers (sets max_new_tokens);
+            budget.stop_reason tells why generation stopped.
+        **generation_kwargs: Overrides of GENERATION_KWARGS.
+    Yields:
+        str: Text deltas of the completion (the prompt is not repeated).
+    """
+    tokenizer, model = model_pipeline.tokenizer, model_pipeline.model
+    inputs = tokenizer(prompt, return_tensors="pt", add_special_tokens=False).to(model.device)
+    streamer = TextIteratorStreamer(tokenizer, skip_prompt=True, skip_special_tokens=True)
+    kwargs = dict(GENERATION_KWARGS, **generation_kwargs)
+    if prefix_cache is not None and speculative is None:
+        kwargs["past_key_values"] = prefix_cache.cache_for(inputs["input_ids"])
+    if budget is not None:
+        kwargs.update(stopping_kwargs(tokenizer, inputs["input_ids"].shape[1], [budget]))
+    generate = speculative.generate if speculative is not None else model.generate
+    errors = []
+
+    def run():
+        try:
+            generate(input_ids=inputs["input_ids"], attention_mask=inputs["attention_mask"], streamer=streamer,
+                     pad_token_id=tokenizer.eos_token_id, **kwargs)
+        except Exception as e:
+            errors.append(e)
+            streamer.end()  # Unblock the consumer
+
+    thread = Thread(target=run, daemon=True)
+    thread.start()
+    for text in streamer:
+        if text:
+            yield text
+    thread.join()
+    if errors:
+        raise RuntimeError(f"Generation failed: {errors[0]}")
+
+class StreamingResponse:
+    """
+    A response that is still being generated.
+    Iterating yields text deltas; once the iteration is exhausted, `response`
+    holds the final, formatted answer (as returned by generate_response).
+    """
+
+    def __init__(self, deltas: Iterable[str], finish: Optional[Callable[[str], str]] = None):
+        self._deltas = deltas
+        self._finish = finish
+        self.text = ""
+        self.response: Optional[str] = None
+
+    def __iter__(self) -> Iterator[str]:
+        for delta in self._deltas:
+            self.text += delta
+            yield delta
+        self.response = self._finish(self.text.strip()) if self._finish else self.text
+
 # -------------------- Main Function --------------------
 def generate_response(user_query: str, embedding_model=None, vectorstore=None, model_pipeline=None, 
-                      tavily_api_key: str ="", use_web_search: bool = False) -> str:
+                      tavily_api_key: str ="", use_web_search: bool = False, lexical_index=None,
+                      answer_cache=None, bypass_cache: bool = False, source_router=None,
+                      sources: Optional[List[str]] = None, context_builder: Optional[ContextBuilder] = None,
+                      candidates: int = 8, stream: bool = False,
+                      scheduler: Optional[GenerationScheduler] = None,
+                      prefix_cache: Optional[PrefixKVCache] = None,
+                      speculative: Optional[SpeculativeDecoder] = None, max_new_tokens: int = MAX_NEW_TOKENS,
+                      deadline_seconds: Optional[float] = DEADLINE_SECONDS) -> str:
     """
     Generates a response to the user's query.
     Args:
@@ -212,9 +655,29 @@ def generate_response(user_query: str, embedding_model=None, vectorstore=None, m
         model_pipeline: Preloaded model pipeline.
         tavily_api_key (str): Tavily API key.
         use_web_search (bool): Whether to use web search.
+        lexical_index: Optional BM25 index for hybrid retrieval.
+        answer_cache: Optional SemanticAnswerCache; a paraphrase of an earlier question with the same
+            source scope reuses its answer (a bare identifier only matches the same question).
+        bypass_cache (bool): Always generate a fresh answer (it still refreshes the cache).
+        source_router: Optional SourceRouter scoping retrieval to the manuals the question is about.
+        sources (Optional[List[str]]): Only retrieve from these source files (overrides the router).
+        context_builder (Optional[ContextBuilder]): Fits the retrieved chunks and web context into a
+            token budget; defaults to one counting with the pipeline's tokenizer.
+        candidates (int): Chunks retrieved for the context builder to choose from.
+        stream (bool): Return a StreamingResponse yielding text as it is generated instead of a string.
+        scheduler (Optional[GenerationScheduler]): Batches this generation with those of concurrent callers.
+        prefix_cache (Optional[PrefixKVCache]): Reuses the prefilled system instructions (without a scheduler;
+            a scheduler uses its own).
+        speculative (Optional[SpeculativeDecoder]): Drafts tokens with a small model for Mistral to verify
+            (without a scheduler; a scheduler uses its own).
+        max_new_tokens (int): Longest answer; the budget within it follows the question type and context size.
+        deadline_seconds (Optional[float]): Wall-clock limit of the request, after which the partial answer
+            is returned (None or 0: no limit).
     Returns:
-        str: Generated response.
+        str: Generated response (a StreamingResponse when streaming).
     """
+    started = time.perf_counter()
+
     # Load models if not provided
     if embedding_model is None or vectorstore is None:
         embedding_model, vectorstore = load_embedding_model()
@@ -222,31 +685,71 @@ def generate_response(user_query: str, embedding_model=None, vectorstore=None, m
     if model_pipeline is None:
         model_pipeline = load_mistral_model()
 
+    # Answers depend on the manuals searched, so the routed scope is part of the cache variant
+    sources = _route(user_query, sources, source_router)
+    variant = "web" if use_web_search else "docs"
+    if sources:
+        variant += ":" + ",".join(sorted(sources))
+
+    # Reuse the answer of a semantically equivalent question. The embedding is shared with
+    # retrieval; identifier queries skip it and only match the same question text.
+    query_embedding = None
+    if answer_cache is not None and not _lexical_identifier(user_query, lexical_index):
+        query_embedding = embedding_model.embed_query(user_query)
+    if answer_cache is not None and not bypass_cache:
+        cached = answer_cache.lookup(query_embedding, variant, query=user_query)
+        if cached is not None:
+            response, used_metadata, similarity = cached
+            print(f"♻️ Answer cache hit (similarity {similarity:.3f})")
+            return (StreamingResponse([response]) if stream else response), used_metadata
+
     # Perform similarity search
-    top_docs = query_database(user_query, embedding_model, vectorstore, k=5)
-    combined_context = "\n".join(doc.page_content for doc in top_docs)
+    retrieved_docs = query_database(user_query, embedding_model, vectorstore, k=candidates,
+                                    lexical_index=lexical_index, sources=sources, query_embedding=query_embedding)
     
     # Perform web search if enabled
     web_context = ""
     if use_web_search:
         web_results = search_web(user_query, tavily_api_key)
         web_context = web_results["context"]
+
+    # Fit the least redundant chunks and the web context into the token budget
+    if context_builder is None:
+        context_builder = ContextBuilder(getattr(model_pipeline, "tokenizer", None))
+    combined_context, web_context, top_docs = context_builder.build(retrieved_docs, web_context)
+    context_tokens = context_builder.count_tokens(combined_context + web_context)
+    print(f"🧩 Context: {len(top_docs)} of {len(retrieved_docs)} chunks, {context_tokens} tokens")
+
+    # Size the answer to the question and its context, within the request's deadline
+    budget = GenerationBudget.for_query(user_query, context_tokens, started, deadline_seconds, max_new_tokens)
     
     # Create prompt
     prompt = format_prompt(user_query, combined_context, web_context)
     
-    # Generate response
-    print("🧠 Generating response...")
-    result = model_pipeline(prompt)[0]['generated_text']
     used_metadata = [doc.metadata for doc in top_docs]
-    
-    # Extract assistant's response
-    response_start = result.find("[/INST]")
-    response = result[response_start + len("[/INST]"):].strip() if response_start != -1 else result
 
-    # Format response to include code blocks
-    response = response.replace("", "<pre>").replace("```", "</pre>")
-    return response, used_metadata
+    def finish(response: str) -> str:
+        response = strip_stop_markers(response).strip()
+        if budget.timed_out:
+            print(f"⏱️ Deadline reached, returning a partial answer ({time.perf_counter() - started:.1f}s)")
+            response += "\n\n*(Answer cut short to keep the response time bounded.)*"
+        # Format response to include code blocks
+        response = response.replace("", "<pre>").replace("```", "</pre>")
+        if answer_cache is not None and not budget.timed_out:  # Partial answers are not reused
+            # Identifier queries are embedded only now, after the answer has been produced
+            embedding = embedding_model.embed_query(user_query) if query_embedding is None else query_embedding
+            answer_cache.store(user_query, embedding, response, used_metadata, variant)
+        return response
+
+    # Generate response
+    print(f"🧠 Generating response (up to {budget.max_new_tokens} tokens)...")
+    if scheduler is not None:
+        deltas = scheduler.stream(prompt, budget)
+    else:
+        deltas = stream_generate(model_pipeline, prompt, prefix_cache, speculative, budget)
+    if stream:
+        return StreamingResponse(deltas, finish), used_metadata
+    return finish("".join(deltas)), used_metadata
 
 # -------------------- Command Line Interface --------------------
 if __name__ == "__main__":
@@ -255,7 +758,12 @@ if __name__ == "__main__":
 
     # Load models once
     embedding_model, vectorstore = load_embedding_model()
+    lexical_index = load_lexical_index()
+    answer_cache = load_answer_cache()
+    source_router = load_source_router()
     model_pipeline = load_mistral_model()
+    prefix_cache = load_prompt_prefix_cache(model_pipeline)
+    speculative = load_speculative_decoding(model_pipeline)
 
     while True:
         user_input = input("\n📝 Your question (or type 'q' to quit): ")
@@ -268,12 +776,17 @@ if __name__ == "__main__":
             embedding_model=embedding_model,
             vectorstore=vectorstore,
             model_pipeline=model_pipeline,
-            use_web_search=use_web
+            use_web_search=use_web,
+            lexical_index=lexical_index,
+            answer_cache=answer_cache,
+            source_router=source_router,
+            stream=True,
+            prefix_cache=prefix_cache,
+            speculative=speculative
         )
-        print("\n🤖 Response:\n", response)
+        print("\n🤖 Response:\n", end=" ", flush=True)
+        for delta in response:
+            print(delta, end="", flush=True)
+        print()
         
-<<<<<<< HEAD
-        print("\n📄 Used Metadata:", used_metadata)
-=======
         print("\n📄 Used Metadata:", used_metadata)
->>>>>>> 5d317817a5ea15392351f6814d0287bfa4e1fd41
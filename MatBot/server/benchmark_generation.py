@@ -0,0 +1,239 @@
+import json
+import time
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List
+
+import torch
+
+from app import GENERATION_KWARGS, format_prompt, load_mistral_model, load_prompt_prefix_cache, stream_generate
+from cpu_backend import CPU_MODE, CPU_MODES, cpu_model_name, native_bf16, resolve_mode
+from generation_scheduler import GenerationScheduler
+from speculative import NUM_ASSISTANT_TOKENS, SpeculativeDecoder, load_speculative_decoder
+
+QUESTIONS = [
+    "How do I solve a system of linear equations in MATLAB?",
+    "What is the difference between ode45 and ode15s?",
+    "How can I read a CSV file into a table?",
+    "How do I create a push button callback in App Designer?",
+    "How do I define a handle class with properties and methods?",
+    "How do I add a legend and axis labels to a plot?",
+    "How do I call a Python function from MATLAB?",
+    "How can I interpolate missing values in a vector?",
+]
+
+# -------------------- Benchmark --------------------
+def run_users(scheduler: GenerationScheduler, users: int, requests_per_user: int, max_new_tokens: int) -> Dict:
+    """
+    Simulates concurrent chat users, each sending its questions one after another.
+    Args:
+        scheduler (GenerationScheduler): Scheduler under test.
+        users (int): Concurrent users.
+        requests_per_user (int): Questions sent by each user.
+        max_new_tokens (int): Generation length per answer.
+    Returns:
+        Dict: Aggregate tokens/s, requests/s, mean time to first token and mean batch size.
+    """
+    before = scheduler.stats()
+
+    def user(index: int) -> List[float]:
+        first_token_seconds = []
+        for i in range(requests_per_user):
+            question = QUESTIONS[(index + i) % len(QUESTIONS)]
+            started = time.perf_counter()
+            stream = scheduler.stream(format_prompt(question, ""), max_new_tokens=max_new_tokens)
+            for _ in stream:
+                first_token_seconds.append(time.perf_counter() - started)
+                break
+            for _ in stream:
+                pass
+        return first_token_seconds
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=users) as pool:
+        first_tokens = [seconds for result in pool.map(user, range(users)) for seconds in result]
+    elapsed = time.perf_counter() - started
+
+    after = scheduler.stats()
+    tokens = after["tokens"] - before["tokens"]
+    batches = after["batches"] - before["batches"]
+    return {
+        "users": users,
+        "requests": users * requests_per_user,
+        "tokens": tokens,
+        "seconds": elapsed,
+        "tokens_per_second": tokens / elapsed,
+        "requests_per_second": users * requests_per_user / elapsed,
+        "mean_first_token_seconds": sum(first_tokens) / len(first_tokens) if first_tokens else None,
+        "mean_batch_size": (after["requests"] - before["requests"]) / batches if batches else 0.0,
+    }
+
+def measure_decode_speed(model_pipeline, max_new_tokens: int, repeats: int = 3) -> Dict:
+    """
+    Measures single-stream generation speed, the figure that matters on CPU.
+    Args:
+        model_pipeline: Text generation pipeline.
+        max_new_tokens (int): Tokens generated per prompt.
+        repeats (int): Prompts timed (the median is reported).
+    Returns:
+        Dict: Median tokens/s and seconds to the first token.
+    """
+    def run(question: str) -> tuple:
+        started = time.perf_counter()
+        first_token, tokens = None, 0
+        for _ in stream_generate(model_pipeline, format_prompt(question, ""), max_new_tokens=max_new_tokens):
+            first_token = first_token or time.perf_counter() - started
+            tokens += 1  # One delta per decoded token (held-back partial characters aside)
+        return tokens / (time.perf_counter() - started), first_token
+
+    run(QUESTIONS[0])  # Warm-up
+    timings = sorted(run(QUESTIONS[i % len(QUESTIONS)]) for i in range(repeats))
+    tokens_per_second, first_token = timings[len(timings) // 2]
+    return {"tokens_per_second": tokens_per_second, "first_token_seconds": first_token}
+
+def measure_first_token(model_pipeline, prefix_cache, context: str, repeats: int = 5) -> Dict:
+    """
+    Measures time to first token (prefill) with and without the prompt prefix cache.
+    Args:
+        model_pipeline: Text generation pipeline.
+        prefix_cache (PrefixKVCache): Cache of the prompt prefix.
+        context (str): Documentation context put in every prompt.
+        repeats (int): Prompts timed per setting (the median is reported).
+    Returns:
+        Dict: Median seconds to the first token for both settings, and the prompt and prefix lengths.
+    """
+    prompts = [format_prompt(QUESTIONS[i % len(QUESTIONS)], context) for i in range(repeats)]
+
+    def median_seconds(cache) -> float:
+        timings = []
+        for prompt in prompts:
+            started = time.perf_counter()
+            for _ in stream_generate(model_pipeline, prompt, cache, max_new_tokens=1):
+                pass
+            timings.append(time.perf_counter() - started)
+        return sorted(timings)[len(timings) // 2]
+
+    median_seconds(None)  # Warm-up
+    prompt_tokens = len(model_pipeline.tokenizer(prompts[0], add_special_tokens=False)["input_ids"])
+    full, cached = median_seconds(None), median_seconds(prefix_cache)
+    return {"prompt_tokens": prompt_tokens, "prefix_tokens": len(prefix_cache),
+            "first_token_seconds": full, "first_token_seconds_cached": cached, "saved_seconds": full - cached}
+
+def measure_speculative(model_pipeline, speculative: SpeculativeDecoder, max_new_tokens: int,
+                        questions: int = len(QUESTIONS), prefix_cache=None) -> Dict:
+    """
+    Compares greedy decoding with and without the draft model.
+    Args:
+        model_pipeline: Text generation pipeline.
+        speculative (SpeculativeDecoder): Decoder with the draft model under test.
+        max_new_tokens (int): Tokens generated per question.
+        questions (int): Questions answered per setting.
+        prefix_cache (Optional[PrefixKVCache]): Also checks that the draft combined with the prefix
+            cache, as the app and the scheduler run them, leaves the answers unchanged.
+    Returns:
+        Dict: Seconds for both settings, the speedup, whether every answer matched, and the
+            draft's acceptance statistics.
+    """
+    prompts = [format_prompt(QUESTIONS[i % len(QUESTIONS)], "") for i in range(questions)]
+    greedy = {"do_sample": False, "max_new_tokens": max_new_tokens}
+
+    def run(decoder) -> tuple:
+        started = time.perf_counter()
+        answers = ["".join(stream_generate(model_pipeline, prompt, speculative=decoder, **greedy)) for prompt in prompts]
+        return answers, time.perf_counter() - started
+
+    run(None)  # Warm-up
+    run(speculative)
+    before = speculative.stats()
+    plain, plain_seconds = run(None)
+    assisted, assisted_seconds = run(speculative)
+    after = speculative.stats()
+    tokens, steps, drafted = (after[key] - before[key] for key in ("tokens", "target_steps", "drafted"))
+    report = {"seconds": plain_seconds, "seconds_speculative": assisted_seconds,
+              "speedup": plain_seconds / assisted_seconds, "identical": plain == assisted,
+              "acceptance_rate": max(tokens - steps, 0) / drafted if drafted else 0.0,
+              "tokens_per_step": tokens / steps if steps else 0.0}
+    if prefix_cache is not None:
+        combined = ["".join(stream_generate(model_pipeline, prompt, prefix_cache, speculative, **greedy))
+                    for prompt in prompts]
+        scheduler = GenerationScheduler(model_pipeline, dict(GENERATION_KWARGS, **greedy), 1, 0, prefix_cache, speculative)
+        scheduled = [scheduler.generate(prompt) for prompt in prompts]
+        scheduler.close()
+        report["identical_with_prefix_cache"] = plain == combined and plain == scheduled
+    return report
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Measure generation throughput versus concurrent users, single-stream speed, speculative decoding, or the prefix cache's time to first token.")
+    parser.add_argument("--model", default="mistralai/Mistral-7B-Instruct-v0.2")
+    parser.add_argument("--no-4bit", action="store_true", help="Load fp16 weights instead of 4-bit")
+    parser.add_argument("--device", default=None, choices=["cuda", "cpu"], help="Default: cuda when available")
+    parser.add_argument("--cpu-mode", default=CPU_MODE, choices=CPU_MODES, help="CPU weights (default: $MATBOT_CPU_MODE or auto)")
+    parser.add_argument("--threads", type=int, default=None, help="CPU threads (default: physical cores)")
+    parser.add_argument("--users", default="1,2,4,8", help="Comma-separated numbers of concurrent users")
+    parser.add_argument("--requests-per-user", type=int, default=2)
+    parser.add_argument("--max-new-tokens", type=int, default=128)
+    parser.add_argument("--max-batch-size", type=int, default=8)
+    parser.add_argument("--max-wait-ms", type=float, default=20)
+    parser.add_argument("--single-stream", action="store_true",
+                        help="Measure one user's tokens/s and time to first token instead")
+    parser.add_argument("--draft-model", default=None,
+                        help="Measure speculative decoding with this draft model (sharing the tokenizer) instead")
+    parser.add_argument("--num-assistant-tokens", type=int, default=NUM_ASSISTANT_TOKENS)
+    parser.add_argument("--prefix-cache", action="store_true",
+                        help="Measure the time to first token saved by the prompt prefix cache instead")
+    parser.add_argument("--context-chars", type=int, default=3000, help="Context length for --prefix-cache")
+    parser.add_argument("--json", default=None, help="Write the results to this JSON file")
+    args = parser.parse_args()
+
+    model_pipeline = load_mistral_model(args.model, use_4bit=not args.no_4bit, device=args.device,
+                                        cpu_mode=args.cpu_mode, cpu_threads=args.threads)
+    if args.single_stream:
+        report = dict(measure_decode_speed(model_pipeline, args.max_new_tokens), device=str(model_pipeline.model.device),
+                      cpu_mode=args.cpu_mode, threads=torch.get_num_threads())
+        print(f"📊 {report['device']}: {report['tokens_per_second']:.1f} tokens/s, "
+              f"first token {report['first_token_seconds']:.2f}s ({report['threads']} threads)")
+        if report["device"] == "cpu":
+            report.update(cpu=cpu_model_name(), native_bf16=native_bf16(), cpu_mode=resolve_mode(args.cpu_mode))
+            # A row for the CPU results table in the README
+            print(f"| {args.model} | {report['cpu_mode']} | {report['cpu']} | {report['threads']} | "
+                  f"{report['tokens_per_second']:.2f} | {report['first_token_seconds']:.2f} s |")
+    elif args.draft_model:
+        speculative = load_speculative_decoder(model_pipeline, args.draft_model, args.num_assistant_tokens)
+        if speculative is None:
+            raise SystemExit(1)
+        report = dict(measure_speculative(model_pipeline, speculative, args.max_new_tokens,
+                                          prefix_cache=load_prompt_prefix_cache(model_pipeline)),
+                      draft_model=args.draft_model, num_assistant_tokens=args.num_assistant_tokens)
+        print(f"📊 {args.draft_model}, {args.num_assistant_tokens} draft tokens: {report['seconds']:.2f}s -> "
+              f"{report['seconds_speculative']:.2f}s ({report['speedup']:.2f}x), acceptance "
+              f"{report['acceptance_rate']:.0%}, {report['tokens_per_step']:.2f} tokens per Mistral step, "
+              f"{'identical' if report['identical'] else 'DIFFERENT'} greedy output")
+        if "identical_with_prefix_cache" in report:
+            print(f"📊 With the prefix cache: {'identical' if report['identical_with_prefix_cache'] else 'DIFFERENT'} "
+                  f"greedy output")
+    elif args.prefix_cache:
+        context = ("ode45 solves nonstiff differential equations with a medium-order method. " * 64)[:args.context_chars]
+        report = measure_first_token(model_pipeline, load_prompt_prefix_cache(model_pipeline), context)
+        print(f"📊 {report['prompt_tokens']}-token prompt, {report['prefix_tokens']}-token prefix: first token "
+              f"{report['first_token_seconds']:.3f}s -> {report['first_token_seconds_cached']:.3f}s "
+              f"(saved {report['saved_seconds']:.3f}s)")
+    else:
+        results = {}
+        for label, max_batch_size in (("unbatched", 1), ("batched", args.max_batch_size)):
+            scheduler = GenerationScheduler(model_pipeline, GENERATION_KWARGS, max_batch_size, args.max_wait_ms)
+            scheduler.generate(format_prompt(QUESTIONS[0], ""), max_new_tokens=8)  # Warm-up
+            results[label] = []
+            for users in [int(value) for value in args.users.split(",")]:
+                result = run_users(scheduler, users, args.requests_per_user, args.max_new_tokens)
+                results[label].append(result)
+                print(f"📊 {label:<9} {users:>2} users: {result['tokens_per_second']:8.1f} tokens/s  "
+                      f"{result['requests_per_second']:6.2f} requests/s  "
+                      f"first token {result['mean_first_token_seconds']:.2f}s  "
+                      f"batch {result['mean_batch_size']:.1f}")
+            scheduler.close()
+        report = {"max_new_tokens": args.max_new_tokens, "results": results}
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(dict(report, model=args.model), f, indent=2)
+        print(f"✅ Results written to: {args.json}")
@@ -0,0 +1,113 @@
+import os
+import json
+import time
+import argparse
+from typing import Dict, List
+
+import numpy as np
+
+from app import VECTORSTORE_BACKENDS, load_vectorstore
+from bm25_index import document_key
+from numpy_store import load_numpy_store
+
+# -------------------- Queries --------------------
+def sample_queries(embeddings: np.ndarray, count: int, noise: float, seed: int = 0) -> np.ndarray:
+    """
+    Builds synthetic queries from stored chunk embeddings, perturbed and renormalized
+    so the nearest neighbours are not trivially the source chunks.
+    Args:
+        embeddings (np.ndarray): Chunk embeddings (n, d), possibly memory-mapped.
+        count (int): Number of queries.
+        noise (float): Standard deviation of the Gaussian noise per dimension.
+        seed (int): Random seed.
+    Returns:
+        np.ndarray: Query embeddings (count, d).
+    """
+    rng = np.random.RandomState(seed)
+    rows = np.sort(rng.choice(len(embeddings), min(count, len(embeddings)), replace=False))
+    queries = np.asarray(embeddings[rows], dtype=np.float32)
+    queries += noise * rng.randn(*queries.shape).astype(np.float32)
+    return queries / np.linalg.norm(queries, axis=1, keepdims=True)
+
+def embed_queries(path: str) -> np.ndarray:
+    """Embeds one question per line of a text file with the app's embedding model."""
+    from langchain_huggingface import HuggingFaceEmbeddings
+
+    with open(path, "r", encoding="utf-8") as f:
+        questions = [line.strip() for line in f if line.strip()]
+    embedding_model = HuggingFaceEmbeddings(model_name="BAAI/bge-base-en-v1.5")
+    return np.asarray([embedding_model.embed_query(question) for question in questions], dtype=np.float32)
+
+# -------------------- Benchmark --------------------
+def benchmark_backend(vectorstore, queries: np.ndarray, truth: List[set], k: int, warmup: int = 5) -> Dict:
+    """
+    Measures per-query latency and recall@k of one backend.
+    Args:
+        vectorstore: Vector store with similarity_search_by_vector.
+        queries (np.ndarray): Query embeddings.
+        truth (List[set]): Exact top-k document keys per query.
+        k (int): Number of results per query.
+        warmup (int): Untimed queries run first (page cache, lazy initialization).
+    Returns:
+        Dict: Latency percentiles in milliseconds, queries per second and recall.
+    """
+    for query in queries[:warmup]:
+        vectorstore.similarity_search_by_vector(query.tolist(), k=k)
+
+    latencies, hits = [], 0
+    for query, expected in zip(queries, truth):
+        started = time.perf_counter()
+        docs = vectorstore.similarity_search_by_vector(query.tolist(), k=k)
+        latencies.append(time.perf_counter() - started)
+        hits += len(expected & {document_key(doc) for doc in docs})
+
+    latencies = np.array(latencies) * 1000
+    return {
+        "mean_ms": float(latencies.mean()),
+        "p50_ms": float(np.percentile(latencies, 50)),
+        "p95_ms": float(np.percentile(latencies, 95)),
+        "p99_ms": float(np.percentile(latencies, 99)),
+        "qps": float(1000 / latencies.mean()),
+        f"recall@{k}": hits / (k * len(queries)),
+    }
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compare latency and recall of the vector store backends.")
+    parser.add_argument("output_dir", help="Ingestion output directory (holding chroma_index and chunk_store)")
+    parser.add_argument("--backends", default=",".join(VECTORSTORE_BACKENDS),
+                        help="Comma-separated backends to compare")
+    parser.add_argument("--queries", help="Text file with one question per line (default: synthetic queries)")
+    parser.add_argument("--sample", type=int, default=200, help="Number of synthetic queries")
+    parser.add_argument("--noise", type=float, default=0.03, help="Noise added to synthetic queries")
+    parser.add_argument("--k", type=int, default=5)
+    parser.add_argument("--candidates", type=int, default=100, help="Candidates re-ranked by the quantized backend")
+    parser.add_argument("--json", default=None, help="Write the results to this JSON file")
+    args = parser.parse_args()
+
+    persist_dir = os.path.join(args.output_dir, "chroma_index")
+    exact = load_numpy_store(args.output_dir)
+    queries = embed_queries(args.queries) if args.queries else sample_queries(exact.embeddings, args.sample, args.noise)
+    print(f"🧪 {len(queries)} queries over {len(exact)} chunks")
+
+    # Ground truth: exhaustive inner-product search
+    truth = [{document_key(doc) for doc in exact.similarity_search_by_vector(query, k=args.k)} for query in queries]
+
+    results = {}
+    for backend in args.backends.split(","):
+        started = time.perf_counter()
+        try:
+            vectorstore = load_vectorstore(backend, persist_dir, candidates=args.candidates)
+        except (OSError, ValueError) as e:
+            print(f"⚠ Skipping {backend}: {e}")
+            continue
+        load_seconds = time.perf_counter() - started
+        results[backend] = dict(benchmark_backend(vectorstore, queries, truth, args.k), load_seconds=load_seconds)
+        result = results[backend]
+        print(f"📊 {backend:<10} p50 {result['p50_ms']:7.2f} ms  p95 {result['p95_ms']:7.2f} ms  "
+              f"{result['qps']:8.1f} q/s  recall@{args.k} {result[f'recall@{args.k}']:.3f}  "
+              f"(loaded in {load_seconds:.2f}s)")
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump({"chunks": len(exact), "queries": len(queries), "k": args.k, "backends": results}, f, indent=2)
+        print(f"✅ Results written to: {args.json}")
@@ -0,0 +1,242 @@
+import os
+import re
+import json
+import shutil
+import argparse
+from collections import Counter
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+from langchain.schema import Document
+
+from chunk_store import ChunkStore, open_chunk_store
+
+CONFIG_FILE = "config.json"
+VOCAB_FILE = "vocab.json"
+POSTINGS_FILE = "postings.npz"
+FUNCTIONS_FILE = "functions.json"  # Titles of the function pages found by the MATLAB splitter
+# MATLAB identifiers (ode45, uicontrol, containers.Map) are kept whole as well as split on dots
+TOKEN_RE = re.compile(r"[a-z_][a-z0-9_]*(?:\.[a-z_][a-z0-9_]*)*|\d+(?:\.\d+)?")
+IDENTIFIER_QUERY_RE = re.compile(r"^\s*`?([A-Za-z][\w.]*)(?:\(\))?`?\s*(?:function|command)?\s*\??\s*$", re.IGNORECASE)
+CODE_CHARS_RE = re.compile(r"[\d_.]")  # A lone word with one of these is code, not English ("ode45", "num2str")
+K1 = 1.2
+B = 0.75
+BUILD_BATCH_ROWS = 4096
+
+# -------------------- Tokenization --------------------
+def tokenize(text: str) -> List[str]:
+    """
+    Lowercases text and splits it into identifier-preserving terms.
+    Args:
+        text (str): Chunk or query text.
+    Returns:
+        List[str]: Terms; dotted names yield the full name and each part.
+    """
+    terms = []
+    for token in TOKEN_RE.findall(text.lower()):
+        terms.append(token)
+        if "." in token and not token[0].isdigit():
+            terms.extend(token.split("."))
+    return terms
+
+def identifier_query(query: str) -> Optional[str]:
+    """
+    Recognizes queries that are just one word ("ode45", "linsolve()", "uicontrol function").
+    BM25Index.identifier decides whether that word is a known identifier.
+    Args:
+        query (str): User query.
+    Returns:
+        Optional[str]: The lowercased identifier, or None for a natural-language query.
+    """
+    match = IDENTIFIER_QUERY_RE.match(query)
+    return match.group(1).lower() if match else None
+
+# -------------------- Building --------------------
+def build_bm25_index(store_dir: str, index_dir: str) -> int:
+    """
+    Builds the BM25 inverted index of a chunk store, so lexical hits map to the same rows.
+    Postings are stored per term in CSR layout: the rows and term frequencies of
+    term i are rows[offsets[i]:offsets[i + 1]] and tfs[offsets[i]:offsets[i + 1]].
+    The function names recorded in chunk metadata are saved alongside.
+    Args:
+        store_dir (str): Chunk store directory.
+        index_dir (str): Output directory.
+    Returns:
+        int: Number of distinct terms.
+    """
+    store = ChunkStore(store_dir)
+    postings: Dict[str, List[Tuple[int, int]]] = {}
+    lengths = np.zeros(len(store), dtype=np.int32)
+    functions = set()
+    for start in range(0, len(store), BUILD_BATCH_ROWS):
+        rows = range(start, min(start + BUILD_BATCH_ROWS, len(store)))
+        for raw in store.table.column("metadata").slice(start, len(rows)).to_pylist():
+            functions.add(str(json.loads(raw).get("function", "")).lower())
+        for row, text in zip(rows, store.texts(rows)):
+            counts = Counter(tokenize(text))
+            lengths[row] = sum(counts.values())
+            for term, count in counts.items():
+                postings.setdefault(term, []).append((row, count))
+
+    vocab = sorted(postings)
+    offsets = np.zeros(len(vocab) + 1, dtype=np.int64)
+    offsets[1:] = np.cumsum([len(postings[term]) for term in vocab])
+    rows = np.empty(offsets[-1], dtype=np.int32)
+    tfs = np.empty(offsets[-1], dtype=np.uint16)
+    for i, term in enumerate(vocab):
+        entries = np.array(postings[term], dtype=np.int64)
+        rows[offsets[i]:offsets[i + 1]] = entries[:, 0]
+        tfs[offsets[i]:offsets[i + 1]] = np.minimum(entries[:, 1], np.iinfo(np.uint16).max)
+
+    tmp_dir = index_dir.rstrip(os.sep) + ".tmp"
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    os.makedirs(tmp_dir)
+    np.savez(os.path.join(tmp_dir, POSTINGS_FILE), offsets=offsets, rows=rows, tfs=tfs, lengths=lengths)
+    with open(os.path.join(tmp_dir, VOCAB_FILE), "w", encoding="utf-8") as f:
+        json.dump(vocab, f)
+    with open(os.path.join(tmp_dir, FUNCTIONS_FILE), "w", encoding="utf-8") as f:
+        json.dump(sorted(functions - {""}), f)
+    with open(os.path.join(tmp_dir, CONFIG_FILE), "w", encoding="utf-8") as f:
+        json.dump({"rows": len(store), "terms": len(vocab), "k1": K1, "b": B}, f, indent=2)
+    shutil.rmtree(index_dir, ignore_errors=True)
+    os.replace(tmp_dir, index_dir)
+    return len(vocab)
+
+# -------------------- Searching --------------------
+class BM25Index:
+    """Okapi BM25 search over the rows of a chunk store."""
+
+    def __init__(self, index_dir: str, store: ChunkStore):
+        with open(os.path.join(index_dir, CONFIG_FILE), "r", encoding="utf-8") as f:
+            self.config = json.load(f)
+        if self.config["rows"] != len(store):
+            raise ValueError("BM25 index is out of date with the chunk store; rebuild it")
+        with open(os.path.join(index_dir, VOCAB_FILE), "r", encoding="utf-8") as f:
+            self.term_ids = {term: i for i, term in enumerate(json.load(f))}
+        functions_path = os.path.join(index_dir, FUNCTIONS_FILE)
+        self.functions = set()
+        if os.path.exists(functions_path):  # Indexes built before function names were recorded lack it
+            with open(functions_path, "r", encoding="utf-8") as f:
+                self.functions = set(json.load(f))
+        postings = np.load(os.path.join(index_dir, POSTINGS_FILE))
+        self.offsets = postings["offsets"]
+        self.rows = postings["rows"]
+        self.tfs = postings["tfs"]
+        self.lengths = postings["lengths"].astype(np.float32)
+        self.store = store
+        self.k1 = self.config["k1"]
+        self.b = self.config["b"]
+        average_length = max(float(self.lengths.mean()), 1.0) if len(self.lengths) else 1.0
+        self._norm = self.k1 * (1 - self.b + self.b * self.lengths / average_length)
+
+    def __len__(self) -> int:
+        return len(self.lengths)
+
+    def __contains__(self, term: str) -> bool:
+        return term in self.term_ids
+
+    def identifier(self, query: str) -> Optional[str]:
+        """
+        Returns the identifier a query consists of, if it is indexed and looks like code.
+        A word counts when it has a digit, underscore or dot ("ode45", "containers.map") or
+        titles a function page; plain words ("plot" without function pages, "help", "matrix")
+        are left to hybrid retrieval.
+        Args:
+            query (str): User query.
+        Returns:
+            Optional[str]: The lowercased identifier, or None.
+        """
+        word = identifier_query(query)
+        if word is None or word not in self.term_ids:
+            return None
+        return word if CODE_CHARS_RE.search(word) or word in self.functions else None
+
+    def idf(self, term_id: int) -> float:
+        df = self.offsets[term_id + 1] - self.offsets[term_id]
+        return float(np.log(1 + (len(self) - df + 0.5) / (df + 0.5)))
+
+    def search(self, query: str, k: int = 5, rows: Optional[np.ndarray] = None) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Scores every chunk containing a query term.
+        Args:
+            query (str): Query text.
+            k (int): Number of results.
+            rows (Optional[np.ndarray]): Restrict the results to these rows.
+        Returns:
+            tuple: Row IDs and BM25 scores, best first (fewer than k if few chunks match).
+        """
+        scores = np.zeros(len(self), dtype=np.float32)
+        for term, count in Counter(tokenize(query)).items():
+            term_id = self.term_ids.get(term)
+            if term_id is None:
+                continue
+            start, end = self.offsets[term_id], self.offsets[term_id + 1]
+            postings = self.rows[start:end]
+            tfs = self.tfs[start:end].astype(np.float32)
+            scores[postings] += count * self.idf(term_id) * tfs * (self.k1 + 1) / (tfs + self._norm[postings])
+
+        matched = np.flatnonzero(scores)
+        if rows is not None:
+            matched = np.intersect1d(matched, rows, assume_unique=True)
+        if len(matched) > k:
+            matched = matched[np.argpartition(-scores[matched], k - 1)[:k]]
+        order = matched[np.argsort(-scores[matched], kind="stable")]
+        return order, scores[order]
+
+    def similarity_search(self, query: str, k: int = 5, sources: Optional[List[str]] = None) -> List[Document]:
+        """Returns the top-k chunks for a query as documents, optionally only from some source files."""
+        rows, _ = self.search(query, k, rows=self.store.rows_for_sources(sources) if sources else None)
+        return self.store.documents(rows.tolist())
+
+def load_bm25_index(output_dir: str) -> Optional[BM25Index]:
+    """
+    Opens the BM25 index of an ingestion output directory.
+    Args:
+        output_dir (str): Directory holding chunk_store and bm25_index.
+    Returns:
+        Optional[BM25Index]: The index, or None when it has not been built.
+    """
+    store = open_chunk_store(os.path.join(output_dir, "chunk_store"))
+    index_dir = os.path.join(output_dir, "bm25_index")
+    if store is None or not os.path.exists(os.path.join(index_dir, CONFIG_FILE)):
+        return None
+    return BM25Index(index_dir, store)
+
+# -------------------- Rank Fusion --------------------
+def document_key(doc: Document) -> Tuple:
+    """Identifies a chunk across retrievers (Chroma results carry no row or chunk ID)."""
+    return doc.metadata.get("source"), doc.metadata.get("page"), doc.page_content
+
+def reciprocal_rank_fusion(rankings: List[List[Document]], k: int = 5, rrf_k: int = 60) -> List[Document]:
+    """
+    Fuses ranked result lists with reciprocal rank fusion: score = sum of 1 / (rrf_k + rank).
+    Args:
+        rankings (List[List[Document]]): Result lists, best first.
+        k (int): Number of fused results.
+        rrf_k (int): Damping constant; 60 is the usual choice.
+    Returns:
+        List[Document]: Fused results, best first.
+    """
+    scores: Dict[Tuple, float] = {}
+    docs: Dict[Tuple, Document] = {}
+    for ranking in rankings:
+        for rank, doc in enumerate(ranking, start=1):
+            key = document_key(doc)
+            scores[key] = scores.get(key, 0.0) + 1.0 / (rrf_k + rank)
+            docs.setdefault(key, doc)
+    return [docs[key] for key in sorted(scores, key=scores.get, reverse=True)[:k]]
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build or query the BM25 index of an ingestion output directory.")
+    parser.add_argument("output_dir", help="Ingestion output directory (holding chunk_store)")
+    parser.add_argument("--query", help="Print the top chunks for this query instead of building")
+    parser.add_argument("--k", type=int, default=5)
+    args = parser.parse_args()
+
+    if args.query:
+        index = load_bm25_index(args.output_dir)
+        for doc in index.similarity_search(args.query, args.k):
+            print(f"📄 {doc.metadata.get('source')} p.{doc.metadata.get('page')}: {doc.page_content[:120]!r}")
+    else:
+        terms = build_bm25_index(os.path.join(args.output_dir, "chunk_store"), os.path.join(args.output_dir, "bm25_index"))
+        print(f"✅ BM25 index with {terms} terms saved to: {os.path.join(args.output_dir, 'bm25_index')}")
@@ -0,0 +1,182 @@
+import os
+import json
+import shutil
+from typing import Dict, Iterable, List, Optional, Sequence
+
+import numpy as np
+import pyarrow as pa
+from langchain.schema import Document
+
+CHUNKS_FILE = "chunks.arrow"
+EMBEDDINGS_FILE = "embeddings.npy"
+SCHEMA = pa.schema([
+    ("id", pa.string()),
+    ("text", pa.string()),
+    ("source", pa.string()),
+    ("page", pa.int32()),
+    ("metadata", pa.string()),  # Remaining metadata as JSON
+])
+
+# -------------------- Writing --------------------
+class ChunkStoreWriter:
+    """
+    Streams chunks into a columnar store directory.
+
+    Text and metadata go to an Arrow IPC file written one record batch at a
+    time; embeddings go to a preallocated float32 .npy of shape (count, dim).
+    Everything is written to a temporary directory that replaces `store_dir`
+    on close, so readers never see a half-written store.
+    """
+
+    def __init__(self, store_dir: str, count: int, dim: int):
+        self.store_dir = store_dir
+        self.count = count
+        self.rows_written = 0
+        self._tmp_dir = store_dir.rstrip(os.sep) + ".tmp"
+        shutil.rmtree(self._tmp_dir, ignore_errors=True)
+        os.makedirs(self._tmp_dir)
+        self._sink = pa.OSFile(os.path.join(self._tmp_dir, CHUNKS_FILE), "wb")
+        self._writer = pa.ipc.new_file(self._sink, SCHEMA)
+        self._embeddings = np.lib.format.open_memmap(
+            os.path.join(self._tmp_dir, EMBEDDINGS_FILE), mode="w+", dtype=np.float32, shape=(count, dim)
+        )
+
+    def write(self, ids: Sequence[str], texts: Sequence[str], metadatas: Sequence[Dict],
+              embeddings: Sequence[Sequence[float]]) -> None:
+        """
+        Appends one batch of chunks.
+        Args:
+            ids (Sequence[str]): Chunk IDs.
+            texts (Sequence[str]): Chunk texts.
+            metadatas (Sequence[Dict]): Chunk metadata.
+            embeddings (Sequence[Sequence[float]]): Chunk embeddings.
+        """
+        end = self.rows_written + len(ids)
+        if end > self.count:
+            raise ValueError(f"Chunk store was sized for {self.count} rows, got {end}")
+
+        rest = [{k: v for k, v in metadata.items() if k not in ("source", "page")} for metadata in metadatas]
+        batch = pa.record_batch([
+            pa.array(ids, pa.string()),
+            pa.array(texts, pa.string()),
+            pa.array([metadata.get("source", "") for metadata in metadatas], pa.string()),
+            pa.array([metadata.get("page", -1) for metadata in metadatas], pa.int32()),
+            pa.array([json.dumps(metadata) for metadata in rest], pa.string()),
+        ], schema=SCHEMA)
+        self._writer.write_batch(batch)
+        self._embeddings[self.rows_written:end] = np.asarray(embeddings, dtype=np.float32)
+        self.rows_written = end
+
+    def close(self) -> None:
+        """Finishes both files and atomically swaps the store into place."""
+        if self.rows_written != self.count:
+            raise ValueError(f"Chunk store expected {self.count} rows, got {self.rows_written}")
+        self._writer.close()
+        self._sink.close()
+        self._embeddings.flush()
+        del self._embeddings
+
+        old_dir = self.store_dir.rstrip(os.sep) + ".old"
+        shutil.rmtree(old_dir, ignore_errors=True)
+        if os.path.exists(self.store_dir):
+            os.replace(self.store_dir, old_dir)
+        os.replace(self._tmp_dir, self.store_dir)
+        shutil.rmtree(old_dir, ignore_errors=True)
+
+# -------------------- Reading --------------------
+class ChunkStore:
+    """
+    Read-only, memory-mapped view of a chunk store.
+
+    Opening the store maps the Arrow file and the embedding matrix without
+    reading them; rows are paged in on access and the page cache is shared
+    zero-copy by every process that opens the same store.
+    """
+
+    def __init__(self, store_dir: str):
+        self.store_dir = store_dir
+        self._source = pa.memory_map(os.path.join(store_dir, CHUNKS_FILE), "r")
+        self.table = pa.ipc.open_file(self._source).read_all()
+        self.embeddings = np.load(os.path.join(store_dir, EMBEDDINGS_FILE), mmap_mode="r")
+        self._row_by_id: Optional[Dict[str, int]] = None
+        self._rows_by_source: Optional[Dict[str, np.ndarray]] = None
+
+    def __len__(self) -> int:
+        return self.table.num_rows
+
+    @property
+    def dim(self) -> int:
+        return self.embeddings.shape[1]
+
+    def text(self, row: int) -> str:
+        """Returns the text of one chunk."""
+        return self.table.column("text")[row].as_py()
+
+    def texts(self, rows: Iterable[int]) -> List[str]:
+        """Returns the texts of several chunks."""
+        return self.table.column("text").take(pa.array(list(rows), pa.int64())).to_pylist()
+
+    def metadata(self, row: int) -> Dict:
+        """Returns the full metadata of one chunk."""
+        metadata = json.loads(self.table.column("metadata")[row].as_py())
+        metadata["source"] = self.table.column("source")[row].as_py()
+        page = self.table.column("page")[row].as_py()
+        if page >= 0:
+            metadata["page"] = page
+        return metadata
+
+    def documents(self, rows: Iterable[int]) -> List[Document]:
+        """
+        Builds langchain documents for the given rows.
+        Args:
+            rows (Iterable[int]): Row IDs.
+        Returns:
+            List[Document]: Documents in the order of `rows`.
+        """
+        rows = list(rows)
+        return [Document(page_content=text, metadata=self.metadata(row))
+                for row, text in zip(rows, self.texts(rows))]
+
+    def row_for_id(self, chunk_id: str) -> Optional[int]:
+        """Maps a chunk ID to its row (the lookup table is built on first use)."""
+        if self._row_by_id is None:
+            self._row_by_id = {chunk_id: row for row, chunk_id in enumerate(self.table.column("id").to_pylist())}
+        return self._row_by_id.get(chunk_id)
+
+    @property
+    def sources(self) -> List[str]:
+        """Source files present in the store."""
+        return sorted(self._source_partitions())
+
+    def _source_partitions(self) -> Dict[str, np.ndarray]:
+        if self._rows_by_source is None:
+            sources = np.array(self.table.column("source").to_pylist(), dtype=object)
+            order = np.argsort(sources, kind="stable")  # Rows are already grouped by file, so this is cheap
+            names, starts = np.unique(sources[order], return_index=True)
+            bounds = list(starts) + [len(order)]
+            self._rows_by_source = {name: order[bounds[i]:bounds[i + 1]] for i, name in enumerate(names)}
+        return self._rows_by_source
+
+    def rows_for_sources(self, sources: Iterable[str]) -> np.ndarray:
+        """
+        Returns the rows of the given source files, the partitions scoped searches scan.
+        Args:
+            sources (Iterable[str]): Source file names.
+        Returns:
+            np.ndarray: Sorted row IDs (empty when no source is indexed).
+        """
+        partitions = self._source_partitions()
+        parts = [partitions[source] for source in sources if source in partitions]
+        return np.sort(np.concatenate(parts)) if parts else np.zeros(0, dtype=np.int64)
+
+def open_chunk_store(store_dir: str) -> Optional[ChunkStore]:
+    """
+    Opens a chunk store if one exists.
+    Args:
+        store_dir (str): Store directory.
+    Returns:
+        Optional[ChunkStore]: The store, or None when it has not been built.
+    """
+    if not os.path.exists(os.path.join(store_dir, CHUNKS_FILE)):
+        return None
+    return ChunkStore(store_dir)
@@ -0,0 +1,151 @@
+import re
+from typing import List, Optional, Set, Tuple
+
+from langchain.schema import Document
+
+DEFAULT_BUDGET_TOKENS = 1200  # About five 1024-character chunks
+DEFAULT_WEB_BUDGET_TOKENS = 400
+MAX_WEB_SHARE = 0.5  # Web context never takes more than this fraction of the budget
+DEFAULT_LAMBDA = 0.7  # MMR trade-off: 1.0 ranks by relevance only, 0.0 by novelty only
+DUPLICATE_SIMILARITY = 0.8  # Shingle Jaccard similarity at which a chunk is dropped as a duplicate
+MIN_OVERLAP_CHARS = 32
+MAX_OVERLAP_CHARS = 400  # Above the 192-character chunk overlap of the splitters
+SHINGLE_SIZE = 4
+CHARS_PER_TOKEN = 4  # Estimate used without a tokenizer
+
+# -------------------- Text Overlap --------------------
+def shingles(text: str, size: int = SHINGLE_SIZE) -> Set[str]:
+    """Word n-grams of lowercased text (the whole text when shorter than `size`)."""
+    words = re.findall(r"\w+", text.lower())
+    if len(words) < size:
+        return {" ".join(words)}
+    return {" ".join(words[i:i + size]) for i in range(len(words) - size + 1)}
+
+def _overlap_length(first: str, second: str, min_chars: int = MIN_OVERLAP_CHARS,
+                    max_chars: int = MAX_OVERLAP_CHARS) -> int:
+    """Length of the longest suffix of `first` that is a prefix of `second` (0 below min_chars)."""
+    for length in range(min(len(first), len(second), max_chars), min_chars - 1, -1):
+        if first.endswith(second[:length]):
+            return length
+    return 0
+
+def trim_overlap(text: str, selected: List[str]) -> str:
+    """
+    Removes the spans a chunk shares with adjacent, already selected chunks.
+    The splitters repeat up to 192 characters between neighbouring chunks; the
+    repeated head (or tail) of `text` is cut so the prompt carries it once.
+    Args:
+        text (str): Chunk text.
+        selected (List[str]): Texts already in the context (from the same source).
+    Returns:
+        str: The chunk without the shared spans.
+    """
+    for other in selected:
+        head = _overlap_length(other, text)
+        if head:
+            text = text[head:]
+        tail = _overlap_length(text, other)
+        if tail:
+            text = text[:-tail]
+    return text.strip()
+
+# -------------------- Context Builder --------------------
+class ContextBuilder:
+    """
+    Assembles the prompt context from retrieved chunks within a token budget.
+
+    Chunks are picked by maximal marginal relevance: each step takes the chunk
+    with the best trade-off between its retrieval rank and its word-shingle
+    similarity to the chunks already picked, so near-identical chunks do not
+    crowd out new information. Text repeated between adjacent chunks is
+    trimmed, and chunks are added while they fit the budget, counted with the
+    generator's tokenizer. Web context is truncated to its own budget, capped
+    at `MAX_WEB_SHARE` of the total so documentation always has room.
+    """
+
+    def __init__(self, tokenizer=None, budget_tokens: int = DEFAULT_BUDGET_TOKENS,
+                 web_budget_tokens: int = DEFAULT_WEB_BUDGET_TOKENS, lambda_mult: float = DEFAULT_LAMBDA,
+                 separator: str = "\n"):
+        self.tokenizer = tokenizer
+        self.budget_tokens = budget_tokens
+        self.web_budget_tokens = web_budget_tokens
+        self.lambda_mult = lambda_mult
+        self.separator = separator
+
+    def count_tokens(self, text: str) -> int:
+        """Counts tokens with the tokenizer, or estimates them from the length."""
+        if self.tokenizer is None:
+            return (len(text) + CHARS_PER_TOKEN - 1) // CHARS_PER_TOKEN
+        return len(self.tokenizer.encode(text, add_special_tokens=False))
+
+    def truncate(self, text: str, max_tokens: int) -> str:
+        """Cuts text to at most max_tokens tokens."""
+        if max_tokens <= 0:
+            return ""
+        if self.count_tokens(text) <= max_tokens:
+            return text
+        if self.tokenizer is None:
+            return text[:max_tokens * CHARS_PER_TOKEN]
+        ids = self.tokenizer.encode(text, add_special_tokens=False)[:max_tokens]
+        return self.tokenizer.decode(ids, skip_special_tokens=True)
+
+    def select(self, docs: List[Document]) -> List[Tuple[Document, str]]:
+        """
+        Orders chunks by maximal marginal relevance and trims overlapping text.
+        Args:
+            docs (List[Document]): Retrieved chunks, best first.
+        Returns:
+            List[tuple]: (document, trimmed text) pairs in selection order, without duplicates or empty texts.
+        """
+        candidates = list(range(len(docs)))
+        candidate_shingles = [shingles(doc.page_content) for doc in docs]
+        relevance = [1.0 - rank / max(len(docs), 1) for rank in range(len(docs))]
+        redundancy = [0.0] * len(docs)
+        selected: List[Tuple[Document, str]] = []
+        while candidates:
+            best = max(candidates, key=lambda i: self.lambda_mult * relevance[i]
+                       - (1 - self.lambda_mult) * redundancy[i])
+            candidates.remove(best)
+            if redundancy[best] >= DUPLICATE_SIMILARITY:
+                continue
+            doc = docs[best]
+            source = doc.metadata.get("source")
+            same_source = [text for other, text in selected if other.metadata.get("source") == source]
+            text = trim_overlap(doc.page_content, same_source)
+            if text:
+                selected.append((doc, text))
+            for i in candidates:
+                union = len(candidate_shingles[i] | candidate_shingles[best]) or 1
+                similarity = len(candidate_shingles[i] & candidate_shingles[best]) / union
+                redundancy[i] = max(redundancy[i], similarity)
+        return selected
+
+    def build(self, docs: List[Document], web_context: Optional[str] = None) -> Tuple[str, str, List[Document]]:
+        """
+        Builds the documentation and web context for a prompt.
+        Args:
+            docs (List[Document]): Retrieved chunks, best first.
+            web_context (Optional[str]): Web search context.
+        Returns:
+            tuple: Documentation context, web context (both within budget) and the documents used.
+        """
+        web_budget = min(self.web_budget_tokens, int(self.budget_tokens * MAX_WEB_SHARE))
+        web_context = self.truncate(web_context or "", web_budget)
+        budget = self.budget_tokens - self.count_tokens(web_context)
+        separator_tokens = self.count_tokens(self.separator)
+
+        texts, used = [], []
+        for doc, text in self.select(docs):
+            tokens = self.count_tokens(text) + (separator_tokens if texts else 0)
+            if tokens > budget:
+                if not texts:  # Always keep part of the best chunk, if any of it fits
+                    text = self.truncate(text, budget).strip()
+                    if text:
+                        texts.append(text)
+                        used.append(doc)
+                    budget = 0
+                continue
+            texts.append(text)
+            used.append(doc)
+            budget -= tokens
+        return self.separator.join(texts), web_context, used
@@ -0,0 +1,94 @@
+import os
+import platform
+from typing import Optional
+
+import torch
+
+CPU_MODE = os.getenv("MATBOT_CPU_MODE", "auto")  # auto, int8, bf16 or fp32
+CPU_MODES = ("auto", "int8", "bf16", "fp32")
+
+# -------------------- Hardware --------------------
+def physical_cores() -> int:
+    """Physical cores available to this process (hyper-threads do not speed up matmuls)."""
+    try:
+        import psutil
+        cores = psutil.cpu_count(logical=False)
+    except ImportError:
+        cores = None
+    available = len(os.sched_getaffinity(0)) if hasattr(os, "sched_getaffinity") else os.cpu_count()
+    return max(1, min(cores or available or 1, available or 1))
+
+def cpu_model_name() -> str:
+    """Marketing name of the CPU, for benchmark reports."""
+    try:
+        with open("/proc/cpuinfo", "r", encoding="utf-8") as f:
+            for line in f:
+                if line.startswith("model name"):
+                    return line.split(":", 1)[1].strip()
+    except OSError:
+        pass
+    return platform.processor() or "unknown CPU"
+
+def native_bf16() -> bool:
+    """Whether the CPU has bf16 instructions (AVX512-BF16 or AMX); elsewhere bf16 is emulated and slow."""
+    try:
+        with open("/proc/cpuinfo", "r", encoding="utf-8") as f:
+            flags = f.read()
+    except OSError:
+        return False
+    return "avx512_bf16" in flags or "amx_bf16" in flags
+
+def configure_threads(threads: Optional[int] = None) -> int:
+    """
+    Sets PyTorch's thread pools for single-stream decoding.
+    Args:
+        threads (Optional[int]): Intra-op threads (default: $MATBOT_CPU_THREADS or the physical cores).
+    Returns:
+        int: Intra-op threads in use.
+    """
+    threads = threads or int(os.getenv("MATBOT_CPU_THREADS", "0")) or physical_cores()
+    torch.set_num_threads(threads)
+    try:
+        torch.set_num_interop_threads(1)  # Decoding is one op after another
+    except RuntimeError:
+        pass  # Only settable before the first parallel op
+    return threads
+
+def resolve_mode(mode: str = CPU_MODE) -> str:
+    """Maps "auto" to bf16 on CPUs with native bf16, and to int8 elsewhere."""
+    if mode not in CPU_MODES:
+        raise ValueError(f"Unknown CPU mode '{mode}', expected one of {CPU_MODES}")
+    if mode == "auto":
+        return "bf16" if native_bf16() else "int8"
+    return mode
+
+# -------------------- Model --------------------
+def load_cpu_model(model_id: str, mode: str = CPU_MODE, threads: Optional[int] = None):
+    """
+    Loads a causal LM for CPU inference.
+    Modes:
+        int8: fp32 weights, then dynamic int8 quantization of every nn.Linear
+              (int8 weights, activations quantized per batch; ~4x smaller matmuls).
+              Loading peaks at the fp32 size before quantization.
+        bf16: bf16 weights and compute, for CPUs with AVX512-BF16/AMX.
+        fp32: reference precision.
+    Args:
+        model_id (str): Model identifier.
+        mode (str): "auto", "int8", "bf16" or "fp32" (default: $MATBOT_CPU_MODE or "auto").
+        threads (Optional[int]): Intra-op threads, see configure_threads.
+    Returns:
+        tuple: Model in eval mode and the resolved mode.
+    """
+    from transformers import AutoModelForCausalLM
+
+    mode = resolve_mode(mode)
+    threads = configure_threads(threads)
+    print(f"🖥️ No GPU, loading {model_id} for CPU ({mode}, {threads} threads)...")
+    model = AutoModelForCausalLM.from_pretrained(
+        model_id,
+        torch_dtype=torch.bfloat16 if mode == "bf16" else torch.float32,
+        low_cpu_mem_usage=True
+    ).eval()
+    if mode == "int8":
+        model = torch.ao.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+    return model, mode
@@ -0,0 +1,285 @@
+import os
+import re
+import time
+import sqlite3
+import hashlib
+import threading
+import unicodedata
+from contextlib import contextmanager
+from typing import Iterator, List, Optional, Sequence
+
+import numpy as np
+
+try:
+    import fcntl
+except ImportError:  # Windows: index builds sharing a cache must not run at the same time
+    fcntl = None
+
+# Shared by both indexes (Embed-all and Embed-all-Act) and by the app
+DEFAULT_CACHE_DIR = os.getenv("MATBOT_EMBEDDING_CACHE", os.path.expanduser("~/.cache/matbot/embeddings"))
+DEFAULT_MAX_BYTES = 2 << 30  # 2 GiB of vectors
+SQLITE_MAX_VARIABLES = 900
+
+# -------------------- Keys --------------------
+def normalize_text(text: str) -> str:
+    """
+    Normalizes text before hashing so whitespace-only differences share one entry.
+    Args:
+        text (str): Chunk or query text.
+    Returns:
+        str: NFKC-normalized text with collapsed whitespace.
+    """
+    return re.sub(r"\s+", " ", unicodedata.normalize("NFKC", text)).strip()
+
+def text_key(text: str) -> str:
+    """
+    Hashes normalized text into a cache key.
+    Args:
+        text (str): Chunk or query text.
+    Returns:
+        str: SHA-256 hex digest of the normalized text.
+    """
+    return hashlib.sha256(normalize_text(text).encode("utf-8")).hexdigest()
+
+# -------------------- Embedding Cache --------------------
+class EmbeddingCache:
+    """
+    On-disk embedding cache keyed by (model name, normalized text hash).
+
+    Vectors live in a memory-mapped float32 file (one row per entry) and a
+    SQLite table maps keys to rows and tracks when each entry was last used.
+    When the cache would exceed `max_bytes`, the least recently used entries
+    are evicted and their rows reused, so the vector file stays dense.
+
+    Several processes may share a cache (two index builds and the app): a file
+    lock next to the SQLite index is held exclusively while rows are allocated,
+    evicted and written, and shared while vectors are read, and the row count
+    and file size are re-read from SQLite once the lock is held.
+    """
+
+    def __init__(self, cache_dir: str = DEFAULT_CACHE_DIR, model_name: str = "BAAI/bge-base-en-v1.5",
+                 max_bytes: int = DEFAULT_MAX_BYTES):
+        self.model_name = model_name
+        self.max_bytes = max_bytes
+        self.cache_dir = os.path.join(cache_dir, re.sub(r"[^\w.-]+", "_", model_name))
+        os.makedirs(self.cache_dir, exist_ok=True)
+        self.hits = 0
+        self.misses = 0
+
+        self._lock = threading.Lock()
+        self._lock_file = open(os.path.join(self.cache_dir, "index.lock"), "a")
+        self._vectors_path = os.path.join(self.cache_dir, "vectors.f32")
+        self._db = sqlite3.connect(os.path.join(self.cache_dir, "index.sqlite3"), timeout=60, check_same_thread=False)
+        self._vectors: Optional[np.memmap] = None
+        self.dim: Optional[int] = None
+        self._capacity = 0
+        self._count = 0
+        with self._locked(exclusive=True):
+            self._db.executescript("""
+                CREATE TABLE IF NOT EXISTS entries (
+                    key TEXT PRIMARY KEY,
+                    row INTEGER NOT NULL,
+                    last_used REAL NOT NULL
+                );
+                CREATE INDEX IF NOT EXISTS entries_last_used ON entries(last_used);
+                CREATE TABLE IF NOT EXISTS meta (name TEXT PRIMARY KEY, value INTEGER NOT NULL);
+            """)
+            self._sync()
+
+    def __len__(self) -> int:
+        return self._count
+
+    @property
+    def max_entries(self) -> int:
+        """Number of vectors that fit in max_bytes (unknown until the dimension is)."""
+        return max(1, self.max_bytes // (4 * self.dim)) if self.dim else 0
+
+    def _open_vectors(self) -> np.memmap:
+        return np.memmap(self._vectors_path, dtype=np.float32, mode="r+", shape=(self._capacity, self.dim))
+
+    @contextmanager
+    def _locked(self, exclusive: bool) -> Iterator[None]:
+        """Holds the thread lock and the cross-process file lock (shared for reads)."""
+        with self._lock:
+            if fcntl is None:
+                yield
+                return
+            fcntl.flock(self._lock_file, fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+            try:
+                yield
+            finally:
+                fcntl.flock(self._lock_file, fcntl.LOCK_UN)
+
+    def _sync(self, count: bool = True) -> None:
+        """Reloads the dimension, capacity and entry count another process may have changed."""
+        meta = dict(self._db.execute("SELECT name, value FROM meta"))
+        self.dim = meta.get("dim")
+        capacity = meta.get("capacity", 0)
+        if capacity != self._capacity or (self._vectors is None and self.dim and capacity):
+            self._capacity = capacity
+            self._vectors = self._open_vectors() if self.dim and capacity else None
+        if count:
+            self._count = self._db.execute("SELECT COUNT(*) FROM entries").fetchone()[0]
+
+    def _set_meta(self, name: str, value: int) -> None:
+        self._db.execute("INSERT OR REPLACE INTO meta (name, value) VALUES (?, ?)", (name, value))
+
+    def _ensure_capacity(self, rows: int) -> None:
+        """Grows the vector file (doubling, capped at max_entries) to hold `rows` rows."""
+        if rows <= self._capacity:
+            return
+        capacity = min(max(rows, 2 * self._capacity, 1024), self.max_entries)
+        if self._vectors is not None:
+            self._vectors.flush()
+            self._vectors = None
+        with open(self._vectors_path, "ab") as f:
+            f.truncate(capacity * self.dim * 4)
+        self._capacity = capacity
+        self._set_meta("capacity", capacity)
+        self._vectors = self._open_vectors()
+
+    def _lookup(self, keys: Sequence[str]) -> dict:
+        rows = {}
+        for start in range(0, len(keys), SQLITE_MAX_VARIABLES):
+            part = keys[start:start + SQLITE_MAX_VARIABLES]
+            placeholders = ",".join("?" * len(part))
+            rows.update(self._db.execute(f"SELECT key, row FROM entries WHERE key IN ({placeholders})", part))
+        return rows
+
+    def get_many(self, texts: Sequence[str]) -> List[Optional[np.ndarray]]:
+        """
+        Looks up cached vectors.
+        Args:
+            texts (Sequence[str]): Texts to look up.
+        Returns:
+            List[Optional[np.ndarray]]: Vector per text, or None on a miss.
+        """
+        keys = [text_key(text) for text in texts]
+        with self._locked(exclusive=False):
+            self._sync(count=False)
+            if self._vectors is None:
+                self.misses += len(keys)
+                return [None] * len(keys)
+            rows = self._lookup(list(set(keys)))
+            results = [np.array(self._vectors[rows[key]]) if key in rows else None for key in keys]
+            if rows:
+                now = time.time()
+                self._db.executemany("UPDATE entries SET last_used = ? WHERE key = ?",
+                                     [(now, key) for key in rows])
+                self._db.commit()
+            hits = sum(result is not None for result in results)
+            self.hits += hits
+            self.misses += len(results) - hits
+            return results
+
+    def get(self, text: str) -> Optional[np.ndarray]:
+        """Looks up a single cached vector."""
+        return self.get_many([text])[0]
+
+    def put_many(self, texts: Sequence[str], vectors: Sequence[Sequence[float]]) -> None:
+        """
+        Stores vectors, evicting least recently used entries when the cache is full.
+        Args:
+            texts (Sequence[str]): Embedded texts.
+            vectors (Sequence[Sequence[float]]): Their embeddings.
+        """
+        if not texts:
+            return
+        matrix = np.asarray(vectors, dtype=np.float32)
+        new = {}
+        for text, vector in zip(texts, matrix):
+            new[text_key(text)] = vector
+
+        with self._locked(exclusive=True):
+            self._sync()
+            if self.dim is None:
+                self.dim = matrix.shape[1]
+                self._set_meta("dim", self.dim)
+            elif matrix.shape[1] != self.dim:
+                raise ValueError(f"Expected {self.dim}-d vectors for {self.model_name}, got {matrix.shape[1]}-d")
+
+            existing = self._lookup(list(new))
+            items = [(key, vector) for key, vector in new.items() if key not in existing]
+            items = items[-self.max_entries:]  # A batch larger than the cache keeps its tail
+            if not items:
+                self._db.commit()  # A new dimension, without holding SQLite's write lock
+                return
+
+            # Reuse the rows of evicted entries, then append after the last row
+            overflow = self._count + len(items) - self.max_entries
+            rows = []
+            if overflow > 0:
+                victims = self._db.execute(
+                    "SELECT key, row FROM entries ORDER BY last_used LIMIT ?", (overflow,)
+                ).fetchall()
+                self._db.executemany("DELETE FROM entries WHERE key = ?", [(key,) for key, _ in victims])
+                rows = [row for _, row in victims]
+                self._count -= len(victims)
+            rows.extend(range(self._count + len(rows), self._count + len(items)))
+
+            self._ensure_capacity(max(rows) + 1)
+            for row, (_, vector) in zip(rows, items):
+                self._vectors[row] = vector
+            self._vectors.flush()
+
+            now = time.time()
+            self._db.executemany("INSERT INTO entries (key, row, last_used) VALUES (?, ?, ?)",
+                                 [(key, row, now) for row, (key, _) in zip(rows, items)])
+            self._db.commit()
+            self._count += len(items)
+
+    def put(self, text: str, vector: Sequence[float]) -> None:
+        """Stores a single vector."""
+        self.put_many([text], [vector])
+
+    def stats(self) -> dict:
+        """Returns hit/miss counters and the current size."""
+        return {"hits": self.hits, "misses": self.misses, "entries": self._count,
+                "bytes": self._count * 4 * (self.dim or 0)}
+
+class CachedEmbeddings:
+    """
+    Wraps a langchain embedding model so identical texts are never embedded twice.
+    Queries and documents share entries, which holds for HuggingFaceEmbeddings
+    since it embeds both the same way. Anything else is forwarded to the wrapped model.
+    """
+
+    def __init__(self, embeddings, cache: EmbeddingCache):
+        self.embeddings = embeddings
+        self.cache = cache
+
+    def __getattr__(self, name):
+        return getattr(self.embeddings, name)
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        """
+        Embeds texts, running the model only on cache misses.
+        Args:
+            texts (List[str]): Texts to embed.
+        Returns:
+            List[List[float]]: One embedding per text.
+        """
+        vectors = self.cache.get_many(texts)
+        missing = {}
+        for i, vector in enumerate(vectors):
+            if vector is None:
+                missing.setdefault(text_key(texts[i]), []).append(i)
+
+        if missing:
+            # Embed each distinct missing text once
+            firsts = [positions[0] for positions in missing.values()]
+            computed = self.embeddings.embed_documents([texts[i] for i in firsts])
+            self.cache.put_many([texts[i] for i in firsts], computed)
+            for positions, vector in zip(missing.values(), computed):
+                for i in positions:
+                    vectors[i] = np.asarray(vector, dtype=np.float32)
+        return [vector.tolist() for vector in vectors]
+
+    def embed_query(self, text: str) -> List[float]:
+        """Embeds a single query through the cache."""
+        vector = self.cache.get(text)
+        if vector is None:
+            vector = self.embeddings.embed_query(text)
+            self.cache.put(text, vector)
+            return list(vector)
+        return vector.tolist()
@@ -0,0 +1,145 @@
+import os
+import re
+import time
+from typing import List, Optional, Sequence
+
+import torch
+from transformers import StoppingCriteria, StoppingCriteriaList
+
+from context_builder import DEFAULT_BUDGET_TOKENS
+
+# Off unless set: a fixed limit would cut most answers short on slow (CPU) backends
+DEADLINE_SECONDS = float(os.getenv("MATBOT_DEADLINE_SECONDS", "0"))
+MAX_NEW_TOKENS = 1024
+MIN_NEW_TOKENS = 64
+
+# Answer length by question type; the first matching pattern wins. Questions no pattern
+# matches may need code, so they get the full budget.
+TOKEN_BUDGETS = {"code": 1024, "explanation": 512, "definition": 192, "other": MAX_NEW_TOKENS}
+QUERY_TYPES = [
+    ("code", re.compile(r"\b(write|code|script|implement|example|snippet|program|syntax|"
+                        r"create (an? )?(function|class|app|plot|gui))\b", re.I)),
+    ("explanation", re.compile(r"\b(how|why|difference|differ|compare|versus|vs)\b", re.I)),
+    ("definition", re.compile(r"^\s*(what (does|is|are)|define|meaning of|what's)\b[^?.!]{0,60}[?.!]?\s*$", re.I)),
+]
+DEFAULT_QUERY_TYPE = "other"
+
+# Headings of the prompt (format_prompt in app.py); an answer that echoes one is stopped
+DOCUMENTATION_HEADING = "## Documentation Context:"
+WEB_HEADING = "## Additional Information From Web Search:"
+QUESTION_HEADING = "## User Question:"
+
+# Text that never belongs in an answer: a new turn or an echo of the prompt's headings
+STOP_MARKERS = ("[INST]", "</s>", DOCUMENTATION_HEADING, WEB_HEADING, QUESTION_HEADING)
+MARKER_WINDOW_TOKENS = 16  # Tail of the completion searched for markers at each step
+
+# -------------------- Budget --------------------
+def classify_query(query: str) -> str:
+    """Returns "code", "explanation", "definition" or, when no pattern matches, "other" for a question."""
+    for query_type, pattern in QUERY_TYPES:
+        if pattern.search(query):
+            return query_type
+    return DEFAULT_QUERY_TYPE
+
+def token_budget(query: str, context_tokens: int, max_new_tokens: int = MAX_NEW_TOKENS) -> int:
+    """
+    Picks max_new_tokens for a question.
+    The budget of the question's type is scaled from half (no retrieved context) to
+    full (a full context budget): there is less to explain from a thin context.
+    Args:
+        query (str): User's question.
+        context_tokens (int): Tokens of documentation and web context in the prompt.
+        max_new_tokens (int): Upper bound.
+    Returns:
+        int: Tokens the answer may use.
+    """
+    base = TOKEN_BUDGETS[classify_query(query)]
+    fill = min(context_tokens / DEFAULT_BUDGET_TOKENS, 1.0)
+    return max(MIN_NEW_TOKENS, min(max_new_tokens, int(base * (0.5 + 0.5 * fill))))
+
+class GenerationBudget:
+    """
+    Token and wall-clock limits of one answer.
+    The generation that runs it records in `stop_reason` why it stopped early:
+    "length", "deadline" or "marker" (None when the model ended the answer).
+    """
+
+    def __init__(self, max_new_tokens: int = MAX_NEW_TOKENS, deadline: Optional[float] = None):
+        self.max_new_tokens = max_new_tokens
+        self.deadline = deadline  # time.perf_counter() value, or None
+        self.stop_reason: Optional[str] = None
+
+    @classmethod
+    def for_query(cls, query: str, context_tokens: int, started: Optional[float] = None,
+                  deadline_seconds: Optional[float] = DEADLINE_SECONDS, max_new_tokens: int = MAX_NEW_TOKENS):
+        """
+        Sets the budget of a question from its type and context size.
+        Args:
+            query (str): User's question.
+            context_tokens (int): Tokens of context in the prompt.
+            started (Optional[float]): time.perf_counter() when the request arrived (default: now).
+            deadline_seconds (Optional[float]): Wall-clock limit of the whole request (None or 0: none).
+            max_new_tokens (int): Upper bound of the token budget.
+        Returns:
+            GenerationBudget: The budget.
+        """
+        started = time.perf_counter() if started is None else started
+        deadline = started + deadline_seconds if deadline_seconds else None
+        return cls(token_budget(query, context_tokens, max_new_tokens), deadline)
+
+    @property
+    def timed_out(self) -> bool:
+        """Whether the deadline cut the answer short."""
+        return self.stop_reason == "deadline"
+
+# -------------------- Stopping --------------------
+class AnswerStoppingCriteria(StoppingCriteria):
+    """
+    Stops each row of a generate() call at its own token budget, deadline or stop marker.
+    Rows of a batch are stopped individually; generate() ends when all are done.
+    """
+
+    def __init__(self, tokenizer, prompt_length: int, budgets: Sequence[GenerationBudget],
+                 markers: Sequence[str] = STOP_MARKERS):
+        self.tokenizer = tokenizer
+        self.prompt_length = prompt_length  # Padded length for batches
+        self.budgets = list(budgets)
+        self.markers = tuple(markers)
+        self.done = [False] * len(self.budgets)
+
+    def _stop_reason(self, row_ids: torch.Tensor, budget: GenerationBudget, generated: int, now: float) -> Optional[str]:
+        if generated >= budget.max_new_tokens:
+            return "length"
+        if budget.deadline is not None and now >= budget.deadline:
+            return "deadline"
+        if self.markers:
+            tail = self.tokenizer.decode(row_ids[max(self.prompt_length, row_ids.shape[0] - MARKER_WINDOW_TOKENS):],
+                                         skip_special_tokens=False)
+            if any(marker in tail for marker in self.markers):
+                return "marker"
+        return None
+
+    def __call__(self, input_ids: torch.LongTensor, scores: torch.FloatTensor, **kwargs) -> torch.BoolTensor:
+        generated = input_ids.shape[1] - self.prompt_length
+        now = time.perf_counter()
+        for row, budget in enumerate(self.budgets):
+            if self.done[row]:
+                continue
+            if generated > 0 and input_ids[row, -1].item() == self.tokenizer.eos_token_id:
+                self.done[row] = True  # The model ended the answer (generate() pads the row from here on)
+                continue
+            reason = self._stop_reason(input_ids[row], budget, generated, now)
+            if reason is not None:
+                self.done[row] = True
+                budget.stop_reason = reason
+        return torch.tensor(self.done, dtype=torch.bool, device=input_ids.device)
+
+def strip_stop_markers(text: str, markers: Sequence[str] = STOP_MARKERS) -> str:
+    """Cuts an answer at the first stop marker."""
+    cuts = [text.find(marker) for marker in markers if marker in text]
+    return text[:min(cuts)] if cuts else text
+
+def stopping_kwargs(tokenizer, prompt_length: int, budgets: List[GenerationBudget]) -> dict:
+    """generate() arguments enforcing the budgets of a batch's rows (max_new_tokens is their maximum)."""
+    return {"max_new_tokens": max(budget.max_new_tokens for budget in budgets),
+            "stopping_criteria": StoppingCriteriaList([AnswerStoppingCriteria(tokenizer, prompt_length, budgets)])}
@@ -0,0 +1,228 @@
+import copy
+import time
+import queue
+import threading
+from typing import Dict, Iterator, List, Optional, Set
+
+from transformers.generation.streamers import BaseStreamer
+
+from generation_budget import MAX_NEW_TOKENS, GenerationBudget, stopping_kwargs
+
+DEFAULT_MAX_BATCH_SIZE = 8
+DEFAULT_MAX_WAIT_MS = 20  # How long the first request of a batch waits for company
+
+class GenerationRequest:
+    """One prompt waiting for, or going through, generation."""
+
+    _END = object()
+
+    def __init__(self, prompt: str, generation_kwargs: Dict, budget: Optional[GenerationBudget] = None):
+        self.prompt = prompt
+        max_new_tokens = generation_kwargs.pop("max_new_tokens", MAX_NEW_TOKENS)
+        self.budget = budget or GenerationBudget(max_new_tokens)
+        self.generation_kwargs = generation_kwargs
+        # Only requests with equal settings share a batch; budgets are enforced per row
+        self.key = tuple(sorted(generation_kwargs.items()))
+        self.submitted = time.perf_counter()
+        self.text = ""
+        self.tokens = 0
+        self.error: Optional[BaseException] = None
+        self._deltas: "queue.Queue" = queue.Queue()
+
+    def _put(self, delta: str) -> None:
+        self.text += delta
+        self._deltas.put(delta)
+
+    def _finish(self, error: Optional[BaseException] = None) -> None:
+        self.error = error
+        self._deltas.put(self._END)
+
+    def __iter__(self) -> Iterator[str]:
+        """Yields text deltas until the request is finished."""
+        while True:
+            delta = self._deltas.get()
+            if delta is self._END:
+                break
+            yield delta
+        if self.error is not None:
+            raise RuntimeError(f"Generation failed: {self.error}")
+
+    def result(self) -> str:
+        """Blocks until the request is finished and returns the completion."""
+        for _ in self:
+            pass
+        return self.text
+
+class _BatchStreamer(BaseStreamer):
+    """Routes the tokens of a batched generate() call to the request of each row."""
+
+    def __init__(self, tokenizer, requests: List[GenerationRequest], stop_token_ids: Set[int]):
+        self.tokenizer = tokenizer
+        self.requests = requests
+        self.stop_token_ids = stop_token_ids  # EOS, and the padding generate() appends to stopped rows
+        self.token_ids: List[List[int]] = [[] for _ in requests]
+        self.emitted = [0] * len(requests)
+        self.finished = [False] * len(requests)
+        self._prompt = True
+
+    def put(self, value) -> None:
+        if self._prompt:  # generate() first passes the prompt ids
+            self._prompt = False
+            return
+        # One token per row, or several for a single row under assisted generation
+        for row, tokens in enumerate(value.reshape(len(self.requests), -1).tolist()):
+            if self.finished[row]:
+                continue
+            stop = next((i for i, token in enumerate(tokens) if token in self.stop_token_ids), None)
+            if stop is not None:
+                tokens = tokens[:stop]
+            self.token_ids[row].extend(tokens)
+            self.requests[row].tokens += len(tokens)
+            text = self.tokenizer.decode(self.token_ids[row], skip_special_tokens=True)
+            if tokens and not text.endswith("\ufffd"):  # Hold back an incomplete multi-byte character
+                self.requests[row]._put(text[self.emitted[row]:])
+                self.emitted[row] = len(text)
+            if stop is not None:
+                # The row is done; its caller need not wait for the rest of the batch
+                self.finished[row] = True
+                self.requests[row]._finish()
+
+    def end(self) -> None:
+        for row, request in enumerate(self.requests):
+            if not self.finished[row]:
+                self.finished[row] = True
+                request._finish()
+
+class GenerationScheduler:
+    """
+    Shares one causal LM between concurrent callers by micro-batching their prompts.
+
+    Callers submit prompts from any thread. A worker thread takes the oldest
+    pending request, waits up to `max_wait_ms` for more requests with the same
+    generation settings, and runs up to `max_batch_size` of them as one
+    left-padded generate() call. Tokens are routed back to each request as they
+    are produced, so callers can stream, and a request is released as soon as
+    its own row emits EOS or reaches its GenerationBudget (token budget, deadline
+    or stop marker). Batching is per request: prompts that arrive while a
+    batch is running join the next one. A prompt that runs alone reuses the
+    optional SpeculativeDecoder (assisted generation takes one prompt), or else the
+    optional PrefixKVCache (left padding shifts the prefix in larger batches).
+    """
+
+    def __init__(self, model_pipeline, generation_kwargs: Optional[Dict] = None,
+                 max_batch_size: int = DEFAULT_MAX_BATCH_SIZE, max_wait_ms: float = DEFAULT_MAX_WAIT_MS,
+                 prefix_cache=None, speculative=None):
+        self.model = model_pipeline.model
+        self.tokenizer = copy.copy(model_pipeline.tokenizer)
+        self.tokenizer.padding_side = "left"  # Decoder-only models continue from the right edge
+        if self.tokenizer.pad_token is None:
+            self.tokenizer.pad_token = self.tokenizer.eos_token
+        self.generation_kwargs = dict(generation_kwargs or {})
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000
+        self.prefix_cache = prefix_cache
+        self.speculative = speculative
+        self.batches = 0
+        self.requests = 0
+        self.tokens = 0
+
+        self._pending: List[GenerationRequest] = []
+        self._condition = threading.Condition()
+        self._closed = False
+        self._worker = threading.Thread(target=self._run, name="generation-scheduler", daemon=True)
+        self._worker.start()
+
+    # -------------------- Callers --------------------
+    def submit(self, prompt: str, budget: Optional[GenerationBudget] = None, **generation_kwargs) -> GenerationRequest:
+        """
+        Queues a prompt for generation.
+        Args:
+            prompt (str): Prompt, including the <s>[INST] markers.
+            budget (Optional[GenerationBudget]): Token budget and deadline of this prompt
+                (default: max_new_tokens of the generation settings, no deadline).
+            **generation_kwargs: Overrides of the scheduler's generation settings.
+        Returns:
+            GenerationRequest: Iterate over it for text deltas, or call result() for the completion.
+        """
+        request = GenerationRequest(prompt, dict(self.generation_kwargs, **generation_kwargs), budget)
+        with self._condition:
+            if self._closed:
+                raise RuntimeError("Generation scheduler is closed")
+            self._pending.append(request)
+            self._condition.notify()
+        return request
+
+    def stream(self, prompt: str, budget: Optional[GenerationBudget] = None, **generation_kwargs) -> Iterator[str]:
+        """Generates a completion, yielding text deltas as they are produced."""
+        return iter(self.submit(prompt, budget, **generation_kwargs))
+
+    def generate(self, prompt: str, budget: Optional[GenerationBudget] = None, **generation_kwargs) -> str:
+        """Generates a completion (without the prompt), blocking until it is done."""
+        return self.submit(prompt, budget, **generation_kwargs).result()
+
+    def stats(self) -> dict:
+        """Returns batch, request and generated token counters."""
+        return {"batches": self.batches, "requests": self.requests, "tokens": self.tokens,
+                "mean_batch_size": self.requests / self.batches if self.batches else 0.0,
+                "pending": len(self._pending)}
+
+    def close(self) -> None:
+        """Stops the worker after the running batch; pending requests fail."""
+        with self._condition:
+            self._closed = True
+            pending, self._pending = self._pending, []
+            self._condition.notify()
+        for request in pending:
+            request._finish(RuntimeError("Generation scheduler was closed"))
+        self._worker.join()
+
+    # -------------------- Worker --------------------
+    def _next_batch(self) -> List[GenerationRequest]:
+        """Waits for requests and takes the next batch (empty once closed)."""
+        with self._condition:
+            while not self._pending and not self._closed:
+                self._condition.wait()
+            if self._closed:
+                return []
+            key = self._pending[0].key
+            deadline = self._pending[0].submitted + self.max_wait
+            while (sum(request.key == key for request in self._pending) < self.max_batch_size
+                   and not self._closed):
+                remaining = deadline - time.perf_counter()
+                if remaining <= 0:
+                    break
+                self._condition.wait(remaining)
+            batch = [request for request in self._pending if request.key == key][:self.max_batch_size]
+            self._pending = [request for request in self._pending if request not in batch]
+            return batch
+
+    def _run(self) -> None:
+        while True:
+            batch = self._next_batch()
+            if not batch:
+                return
+            streamer = _BatchStreamer(self.tokenizer, batch, {self.tokenizer.eos_token_id, self.tokenizer.pad_token_id})
+            try:
+                inputs = self.tokenizer([request.prompt for request in batch], return_tensors="pt", padding=True,
+                                        add_special_tokens=False).to(self.model.device)
+                kwargs = dict(batch[0].generation_kwargs)
+                kwargs.update(stopping_kwargs(self.tokenizer, inputs["input_ids"].shape[1],
+                                              [request.budget for request in batch]))
+                generate = self.model.generate
+                if len(batch) == 1:
+                    if self.speculative is not None:
+                        # Not with the prefix cache: assisted generation copies past_key_values to the draft
+                        generate = self.speculative.generate
+                    elif self.prefix_cache is not None:
+                        kwargs["past_key_values"] = self.prefix_cache.cache_for(inputs["input_ids"])
+                generate(input_ids=inputs["input_ids"], attention_mask=inputs["attention_mask"],
+                         streamer=streamer, pad_token_id=self.tokenizer.pad_token_id, **kwargs)
+                streamer.end()
+            except Exception as e:
+                for row, request in enumerate(batch):
+                    if not streamer.finished[row]:
+                        streamer.finished[row] = True
+                        request._finish(e)
+            self.batches += 1
+            self.requests += len(batch)
+            self.tokens += sum(request.tokens for request in batch)
@@ -0,0 +1,104 @@
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List, Optional, Sequence
+
+from langchain.schema import Document
+
+from bm25_index import reciprocal_rank_fusion
+from context_builder import shingles
+
+OVERLAP_THRESHOLD = 0.8  # Share of the smaller chunk's shingles found in a kept chunk
+
+def _default_search(vectorstore, embedding: List[float], k: int, sources: Optional[List[str]] = None):
+    if sources:
+        return vectorstore.similarity_search_by_vector(embedding, k=k, sources=sources)
+    return vectorstore.similarity_search_by_vector(embedding, k=k)
+
+def drop_overlapping(docs: List[Document], k: int, threshold: float = OVERLAP_THRESHOLD) -> List[Document]:
+    """
+    Keeps the first k documents that do not mostly repeat a better-ranked one.
+    A fine-grained chunk contained in a coarse chunk of the same source (or the
+    reverse) counts as a repeat.
+    Args:
+        docs (List[Document]): Documents, best first.
+        k (int): Number of documents to keep.
+        threshold (float): Shingle overlap, relative to the smaller chunk, above which a document is dropped.
+    Returns:
+        List[Document]: Up to k documents, best first.
+    """
+    kept, kept_shingles = [], []
+    for doc in docs:
+        doc_shingles = shingles(doc.page_content)
+        source = doc.metadata.get("source")
+        if any(kept_doc.metadata.get("source") == source
+               and len(doc_shingles & other) >= threshold * min(len(doc_shingles), len(other))
+               for kept_doc, other in zip(kept, kept_shingles)):
+            continue
+        kept.append(doc)
+        kept_shingles.append(doc_shingles)
+        if len(kept) == k:
+            break
+    return kept
+
+class MultiIndexRetriever:
+    """
+    Searches several vector stores (e.g. indexes built with different chunk
+    sizes) as one.
+
+    Every query embedding is searched in all stores concurrently from a shared
+    thread pool, so latency tracks the slowest store rather than the sum. The
+    per-store rankings are merged with reciprocal rank fusion and overlapping
+    chunks are collapsed. It exposes the vector store interface used by
+    app.query_database, so it can stand in for a single store.
+
+    `search(vectorstore, embedding, k, sources)` runs one search in one store,
+    and the optional `search_many(vectorstore, embeddings, k)` a batch of them.
+    """
+
+    def __init__(self, vectorstores: Dict[str, object], search: Callable = _default_search,
+                 search_many: Optional[Callable] = None, overlap_threshold: float = OVERLAP_THRESHOLD):
+        self.vectorstores = vectorstores
+        self.search = search
+        self.search_many = search_many
+        self.overlap_threshold = overlap_threshold
+        self._pool = ThreadPoolExecutor(max_workers=max(len(vectorstores), 1), thread_name_prefix="multi-index")
+
+    def __len__(self) -> int:
+        return len(self.vectorstores)
+
+    def _merge(self, rankings: List[List[Document]], k: int) -> List[Document]:
+        fused = reciprocal_rank_fusion(rankings, k=sum(len(ranking) for ranking in rankings))
+        return drop_overlapping(fused, k, self.overlap_threshold)
+
+    def similarity_search_by_vector(self, embedding: List[float], k: int = 5, sources: Optional[List[str]] = None,
+                                    **kwargs) -> List[Document]:
+        """
+        Returns the top-k chunks over all stores for a query embedding.
+        Args:
+            embedding (List[float]): Query embedding, shared by every store.
+            k (int): Number of results.
+            sources (Optional[List[str]]): Only search chunks of these source files.
+        Returns:
+            List[Document]: Fused chunks, best first.
+        """
+        futures = [self._pool.submit(self.search, vectorstore, embedding, k, sources)
+                   for vectorstore in self.vectorstores.values()]
+        return self._merge([future.result() for future in futures], k)
+
+    def similarity_search_by_vectors(self, embeddings: Sequence[List[float]], k: int = 5) -> List[List[Document]]:
+        """
+        Returns the top-k chunks over all stores for several query embeddings.
+        Each store runs its batched search concurrently with the others.
+        Args:
+            embeddings (Sequence[List[float]]): Query embeddings.
+            k (int): Number of results per query.
+        Returns:
+            List[List[Document]]: Fused chunks per query, best first.
+        """
+        def run(vectorstore) -> List[List[Document]]:
+            if self.search_many is not None:
+                return self.search_many(vectorstore, list(embeddings), k)
+            return [self.search(vectorstore, embedding, k, None) for embedding in embeddings]
+
+        futures = [self._pool.submit(run, vectorstore) for vectorstore in self.vectorstores.values()]
+        per_store = [future.result() for future in futures]
+        return [self._merge([results[i] for results in per_store], k) for i in range(len(embeddings))]
@@ -0,0 +1,127 @@
+import os
+from typing import List, Optional, Sequence, Tuple
+
+import numpy as np
+from langchain.schema import Document
+
+from chunk_store import ChunkStore, open_chunk_store
+
+SEARCH_BLOCK_ROWS = 65536
+QUERY_BLOCK = 256  # Queries scored per matrix product, bounds the (rows x queries) score matrix
+
+class NumpyVectorStore:
+    """
+    Exact inner-product search over the memory-mapped embeddings of a chunk store.
+
+    One matrix-vector product per block of rows scores the whole corpus (inner
+    product ranks like cosine and l2 for the normalized BGE vectors), and the
+    documents of the winners come straight from the Arrow file, without any
+    database round trip. The page cache is shared by every process that opens
+    the same store.
+    """
+
+    def __init__(self, store: ChunkStore, block_rows: int = SEARCH_BLOCK_ROWS):
+        self.store = store
+        self.embeddings = store.embeddings
+        self.block_rows = block_rows
+
+    def __len__(self) -> int:
+        return len(self.store)
+
+    def search(self, query: Sequence[float], k: int = 5, rows: Optional[np.ndarray] = None
+               ) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Finds the k rows with the highest inner product.
+        Args:
+            query (Sequence[float]): Query embedding.
+            k (int): Number of results.
+            rows (Optional[np.ndarray]): Restrict the search to these rows.
+        Returns:
+            tuple: Row IDs and scores, best first.
+        """
+        query = np.asarray(query, dtype=np.float32)
+        if rows is not None:
+            row_ids = np.sort(rows)  # Sequential access into the memory map
+            scores = np.asarray(self.embeddings[row_ids], dtype=np.float32) @ query
+        else:
+            scores = np.empty(len(self.embeddings), dtype=np.float32)
+            for start in range(0, len(scores), self.block_rows):
+                scores[start:start + self.block_rows] = self.embeddings[start:start + self.block_rows] @ query
+            row_ids = None
+        k = min(k, len(scores))
+        if k == 0:
+            return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.float32)
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return (row_ids[top] if row_ids is not None else top), scores[top]
+
+    def search_many(self, queries: Sequence[Sequence[float]], k: int = 5) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Finds the k rows with the highest inner product for several queries at once.
+        Each block of the memory map is read once per QUERY_BLOCK queries.
+        Args:
+            queries (Sequence[Sequence[float]]): Query embeddings (q, d).
+            k (int): Number of results per query.
+        Returns:
+            tuple: Row IDs (q, k) and scores (q, k), best first.
+        """
+        queries = np.asarray(queries, dtype=np.float32).reshape(-1, self.embeddings.shape[1])
+        k = min(k, len(self.embeddings))
+        all_rows = np.zeros((len(queries), k), dtype=np.int64)
+        all_scores = np.zeros((len(queries), k), dtype=np.float32)
+        if k == 0:
+            return all_rows, all_scores
+        for q_start in range(0, len(queries), QUERY_BLOCK):
+            block_queries = queries[q_start:q_start + QUERY_BLOCK]
+            scores = np.empty((len(self.embeddings), len(block_queries)), dtype=np.float32)
+            for start in range(0, len(scores), self.block_rows):
+                scores[start:start + self.block_rows] = self.embeddings[start:start + self.block_rows] @ block_queries.T
+            top = np.argpartition(-scores, k - 1, axis=0)[:k].T
+            top_scores = np.take_along_axis(scores.T, top, axis=1)
+            order = np.argsort(-top_scores, axis=1)
+            all_rows[q_start:q_start + len(block_queries)] = np.take_along_axis(top, order, axis=1)
+            all_scores[q_start:q_start + len(block_queries)] = np.take_along_axis(top_scores, order, axis=1)
+        return all_rows, all_scores
+
+    def similarity_search_by_vectors(self, embeddings: Sequence[Sequence[float]], k: int = 5,
+                                     sources: Optional[List[str]] = None) -> List[List[Document]]:
+        """
+        Returns the top-k chunks for several query embeddings in one pass.
+        Args:
+            embeddings (Sequence[Sequence[float]]): Query embeddings.
+            k (int): Number of results per query.
+            sources (Optional[List[str]]): Only search chunks of these source files.
+        Returns:
+            List[List[Document]]: Matching chunks per query, best first.
+        """
+        if sources:
+            return [self.similarity_search_by_vector(embedding, k, sources) for embedding in embeddings]
+        rows, _ = self.search_many(embeddings, k)
+        return [self.store.documents(query_rows.tolist()) for query_rows in rows]
+
+    def similarity_search_by_vector(self, embedding: List[float], k: int = 5, sources: Optional[List[str]] = None,
+                                    **kwargs) -> List[Document]:
+        """
+        Returns the top-k chunks for a query embedding.
+        Args:
+            embedding (List[float]): Query embedding.
+            k (int): Number of results.
+            sources (Optional[List[str]]): Only search chunks of these source files (their row partitions).
+        Returns:
+            List[Document]: Matching chunks, best first.
+        """
+        rows, _ = self.search(embedding, k, rows=self.store.rows_for_sources(sources) if sources else None)
+        return self.store.documents(rows.tolist())
+
+def load_numpy_store(output_dir: str) -> NumpyVectorStore:
+    """
+    Opens the chunk store of an ingestion output directory for exact search.
+    Args:
+        output_dir (str): Directory holding chunk_store.
+    Returns:
+        NumpyVectorStore: Vector store.
+    """
+    store = open_chunk_store(os.path.join(output_dir, "chunk_store"))
+    if store is None:
+        raise FileNotFoundError(f"No chunk store in {output_dir}; run the ingestion scripts first")
+    return NumpyVectorStore(store)
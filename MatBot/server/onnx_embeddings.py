@@ -0,0 +1,178 @@
+import os
+import re
+import argparse
+from typing import List, Optional
+
+import numpy as np
+
+DEFAULT_ONNX_DIR = os.getenv("MATBOT_ONNX_DIR", os.path.expanduser("~/.cache/matbot/onnx"))
+MODEL_FILE = "model.onnx"
+QUANTIZED_MODEL_FILE = "model_int8.onnx"
+MAX_LENGTH = 512  # BGE's maximum sequence length
+PARITY_TEXTS = [
+    "How do I solve a system of linear equations in MATLAB?",
+    "ode45 solves nonstiff differential equations with a medium-order method.",
+    "uicontrol creates a user interface control such as a push button or slider.",
+    "Use readtable to import a CSV file as a table.",
+    "plot(X,Y) creates a 2-D line plot of the data in Y versus the corresponding values in X.",
+]
+
+# -------------------- Export --------------------
+def model_dir(model_name: str, onnx_dir: str = DEFAULT_ONNX_DIR) -> str:
+    """Directory holding the exported files of one model."""
+    return os.path.join(onnx_dir, re.sub(r"[^\w.-]+", "_", model_name))
+
+def export_onnx_model(model_name: str = "BAAI/bge-base-en-v1.5", onnx_dir: str = DEFAULT_ONNX_DIR,
+                      quantize: bool = True) -> str:
+    """
+    Exports the transformer of an embedding model to ONNX, optionally with dynamic int8 quantization.
+    Existing exports are reused.
+    Args:
+        model_name (str): HuggingFace model identifier.
+        onnx_dir (str): Root directory for exported models.
+        quantize (bool): Quantize the MatMul weights to int8 (activations are quantized at run time).
+    Returns:
+        str: Path of the ONNX model to load.
+    """
+    target_dir = model_dir(model_name, onnx_dir)
+    fp32_path = os.path.join(target_dir, MODEL_FILE)
+    int8_path = os.path.join(target_dir, QUANTIZED_MODEL_FILE)
+    if not os.path.exists(fp32_path):
+        import torch
+        from transformers import AutoModel, AutoTokenizer
+
+        print(f"🔄 Exporting {model_name} to ONNX...")
+        os.makedirs(target_dir, exist_ok=True)
+        tokenizer = AutoTokenizer.from_pretrained(model_name)
+        model = AutoModel.from_pretrained(model_name).eval()
+
+        class Encoder(torch.nn.Module):
+            """Pins the exported signature to the three tokenizer outputs, by keyword."""
+
+            def __init__(self, model):
+                super().__init__()
+                self.model = model
+
+            def forward(self, input_ids, attention_mask, token_type_ids):
+                return self.model(input_ids=input_ids, attention_mask=attention_mask,
+                                  token_type_ids=token_type_ids)[0]
+
+        inputs = tokenizer(PARITY_TEXTS[:2], padding=True, return_tensors="pt")
+        dynamic_axes = {name: {0: "batch", 1: "sequence"} for name in ("input_ids", "attention_mask", "token_type_ids")}
+        dynamic_axes["last_hidden_state"] = {0: "batch", 1: "sequence"}
+        with torch.no_grad():
+            torch.onnx.export(
+                Encoder(model),
+                (inputs["input_ids"], inputs["attention_mask"], inputs["token_type_ids"]),
+                fp32_path + ".tmp",
+                input_names=["input_ids", "attention_mask", "token_type_ids"],
+                output_names=["last_hidden_state"],
+                dynamic_axes=dynamic_axes,
+                opset_version=14,
+            )
+        os.replace(fp32_path + ".tmp", fp32_path)
+        tokenizer.save_pretrained(target_dir)
+
+    if not quantize:
+        return fp32_path
+    if not os.path.exists(int8_path):
+        from onnxruntime.quantization import QuantType, quantize_dynamic
+
+        print("🔄 Quantizing the ONNX model to int8...")
+        quantize_dynamic(fp32_path, int8_path + ".tmp", weight_type=QuantType.QInt8)
+        os.replace(int8_path + ".tmp", int8_path)
+    return int8_path
+
+# -------------------- Embeddings --------------------
+class ONNXEmbeddings:
+    """
+    Langchain-compatible embeddings served by ONNX Runtime on CPU.
+
+    Reproduces the sentence-transformers pipeline of BGE: CLS pooling followed
+    by L2 normalization. Documents are embedded in batches sorted by length so
+    little compute is spent on padding.
+    """
+
+    def __init__(self, model_name: str = "BAAI/bge-base-en-v1.5", onnx_dir: str = DEFAULT_ONNX_DIR,
+                 quantize: bool = True, batch_size: int = 32, threads: Optional[int] = None):
+        import onnxruntime as ort
+        from transformers import AutoTokenizer
+
+        self.model_name = model_name
+        self.quantize = quantize
+        self.batch_size = batch_size
+        model_path = export_onnx_model(model_name, onnx_dir, quantize)
+        self.tokenizer = AutoTokenizer.from_pretrained(model_dir(model_name, onnx_dir))
+
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if threads:
+            options.intra_op_num_threads = threads
+        self.session = ort.InferenceSession(model_path, options, providers=["CPUExecutionProvider"])
+        self._input_names = {node.name for node in self.session.get_inputs()}
+
+    @property
+    def cache_name(self) -> str:
+        """Embedding cache namespace; int8 vectors must not mix with PyTorch ones."""
+        return f"{self.model_name}-onnx{'-int8' if self.quantize else ''}"
+
+    def _embed(self, texts: List[str]) -> np.ndarray:
+        encoded = self.tokenizer(texts, padding=True, truncation=True, max_length=MAX_LENGTH, return_tensors="np")
+        feeds = {name: encoded[name].astype(np.int64) for name in encoded if name in self._input_names}
+        cls = self.session.run(["last_hidden_state"], feeds)[0][:, 0]
+        return cls / np.maximum(np.linalg.norm(cls, axis=1, keepdims=True), 1e-12)
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        """
+        Embeds texts in length-sorted batches.
+        Args:
+            texts (List[str]): Texts to embed.
+        Returns:
+            List[List[float]]: One normalized embedding per text, in input order.
+        """
+        if not texts:
+            return []
+        order = np.argsort([len(text) for text in texts])
+        vectors = np.empty((len(texts), 0), dtype=np.float32)
+        for start in range(0, len(texts), self.batch_size):
+            batch = order[start:start + self.batch_size]
+            embedded = self._embed([texts[i] for i in batch])
+            if vectors.shape[1] == 0:
+                vectors = np.empty((len(texts), embedded.shape[1]), dtype=np.float32)
+            vectors[batch] = embedded
+        return vectors.tolist()
+
+    def embed_query(self, text: str) -> List[float]:
+        """Embeds a single query."""
+        return self._embed([text])[0].tolist()
+
+# -------------------- Parity Check --------------------
+def check_parity(onnx_embeddings: ONNXEmbeddings, texts: List[str] = PARITY_TEXTS, min_cosine: float = 0.99) -> float:
+    """
+    Compares ONNX vectors with those of the PyTorch sentence-transformers model.
+    Args:
+        onnx_embeddings (ONNXEmbeddings): Backend to check.
+        texts (List[str]): Texts to embed with both.
+        min_cosine (float): Lowest acceptable cosine similarity.
+    Returns:
+        float: Lowest cosine similarity over the texts.
+    """
+    from sentence_transformers import SentenceTransformer
+
+    reference = SentenceTransformer(onnx_embeddings.model_name, device="cpu").encode(texts, normalize_embeddings=True)
+    cosines = np.sum(np.asarray(onnx_embeddings.embed_documents(texts)) * reference, axis=1)
+    worst = float(cosines.min())
+    if worst < min_cosine:
+        raise ValueError(f"ONNX embeddings diverge from PyTorch: cosine {worst:.4f} < {min_cosine}")
+    return worst
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Export BGE to ONNX (int8) and check parity with PyTorch.")
+    parser.add_argument("--model", default="BAAI/bge-base-en-v1.5")
+    parser.add_argument("--onnx-dir", default=DEFAULT_ONNX_DIR)
+    parser.add_argument("--no-quantize", action="store_true", help="Keep fp32 weights")
+    parser.add_argument("--min-cosine", type=float, default=0.99)
+    args = parser.parse_args()
+
+    embeddings = ONNXEmbeddings(args.model, args.onnx_dir, quantize=not args.no_quantize)
+    print(f"✅ Parity with PyTorch: min cosine {check_parity(embeddings, min_cosine=args.min_cosine):.4f}")
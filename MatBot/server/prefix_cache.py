@@ -0,0 +1,71 @@
+import copy
+import time
+from typing import Optional
+
+import torch
+from transformers import DynamicCache
+
+class PrefixKVCache:
+    """
+    Keeps the attention keys/values of a constant prompt prefix.
+
+    The prefix (the system instructions at the head of every prompt) is
+    prefilled once. A prompt that starts with the same token ids then gets a
+    copy of that cache, and generate() only prefills the tokens after it:
+    the retrieved context and the question. Prompts whose ids do not start
+    with the prefix (e.g. a tokenizer merge across the boundary) get None and
+    are prefilled in full as before.
+    """
+
+    def __init__(self, model, tokenizer, prefix: str):
+        self.model = model
+        self.prefix = prefix
+        self.hits = 0
+        self.misses = 0
+        started = time.perf_counter()
+        ids = tokenizer(prefix, return_tensors="pt", add_special_tokens=False)["input_ids"]
+        self.prefix_ids = ids.to(model.device)
+        with torch.no_grad():
+            output = model(input_ids=self.prefix_ids, past_key_values=DynamicCache(), use_cache=True)
+        self._cache = output.past_key_values
+        self.prefill_seconds = time.perf_counter() - started
+
+    def __len__(self) -> int:
+        return self.prefix_ids.shape[1]
+
+    def cache_for(self, input_ids: torch.Tensor):
+        """
+        Returns a cache to pass to generate() as past_key_values.
+        Args:
+            input_ids (torch.Tensor): Token ids of one full prompt, shape (1, n).
+        Returns:
+            A copy of the prefix cache (generate() extends it in place), or None when the
+            prompt does not start with the prefix.
+        """
+        n = len(self)
+        if (input_ids.shape[0] != 1 or input_ids.shape[1] <= n
+                or not torch.equal(input_ids[0, :n].to(self.prefix_ids.device), self.prefix_ids[0])):
+            self.misses += 1
+            return None
+        self.hits += 1
+        return copy.deepcopy(self._cache)
+
+    def stats(self) -> dict:
+        """Returns the prefix length, its one-off prefill time and hit/miss counters."""
+        return {"prefix_tokens": len(self), "prefill_seconds": self.prefill_seconds,
+                "hits": self.hits, "misses": self.misses}
+
+def load_prefix_cache(model_pipeline, prefix: str) -> Optional[PrefixKVCache]:
+    """
+    Prefills a prompt prefix for a text generation pipeline.
+    Args:
+        model_pipeline: Text generation pipeline.
+        prefix (str): Constant head of every prompt.
+    Returns:
+        Optional[PrefixKVCache]: The cache, or None when the model cannot return one.
+    """
+    try:
+        return PrefixKVCache(model_pipeline.model, model_pipeline.tokenizer, prefix)
+    except (RuntimeError, TypeError, ValueError) as e:
+        print(f"⚠ Prefix caching disabled: {e}")
+        return None
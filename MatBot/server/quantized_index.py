@@ -0,0 +1,272 @@
+import os
+import json
+import argparse
+from typing import List, Optional, Tuple
+
+import numpy as np
+from langchain.schema import Document
+
+from chunk_store import ChunkStore, open_chunk_store
+
+CONFIG_FILE = "config.json"
+CODES_FILE = "codes.npy"
+SCALES_FILE = "scales.npy"
+MEAN_FILE = "mean.npy"
+PROJECTION_FILE = "projection.npy"
+PCA_SAMPLE_SIZE = 50000
+SCAN_BLOCK_ROWS = 65536
+POPCOUNT = np.array([bin(i).count("1") for i in range(256)], dtype=np.uint8)
+
+# -------------------- Building --------------------
+def fit_reduction(embeddings: np.ndarray, dims: Optional[int], reduction: str, seed: int = 0
+                  ) -> Tuple[np.ndarray, Optional[np.ndarray]]:
+    """
+    Fits the dimension reduction applied before quantization.
+    Args:
+        embeddings (np.ndarray): Full-precision embeddings (n, d), possibly memory-mapped.
+        dims (Optional[int]): Target dimension; None keeps all dimensions.
+        reduction (str): "pca" projects on the top principal components, "truncate"
+            keeps the leading dimensions (Matryoshka style).
+        seed (int): Seed for the PCA sample.
+    Returns:
+        tuple: Mean vector (d,) and projection matrix (d, dims), or None for no projection.
+    """
+    rng = np.random.RandomState(seed)
+    rows = np.sort(rng.choice(len(embeddings), min(len(embeddings), PCA_SAMPLE_SIZE), replace=False))
+    sample = np.asarray(embeddings[rows], dtype=np.float32)
+    mean = sample.mean(axis=0)
+    if not dims or dims >= embeddings.shape[1]:
+        return mean, None
+    if reduction == "truncate":
+        return mean, np.eye(embeddings.shape[1], dims, dtype=np.float32)
+    if reduction == "pca":
+        _, _, vt = np.linalg.svd(sample - mean, full_matrices=False)
+        return mean, vt[:dims].T.astype(np.float32)
+    raise ValueError(f"Unknown reduction: {reduction}")
+
+def build_quantized_index(store_dir: str, index_dir: str, mode: str = "int8", dims: Optional[int] = None,
+                          reduction: str = "pca") -> None:
+    """
+    Builds a quantized first-pass index over the embeddings of a chunk store.
+    The full-precision vectors are not copied: re-ranking reads the chunk store's
+    memory-mapped embeddings.npy.
+    Args:
+        store_dir (str): Chunk store directory.
+        index_dir (str): Output directory.
+        mode (str): "int8" (per-dimension scalar quantization) or "binary" (1 bit per dimension).
+        dims (Optional[int]): Reduced dimension, None to keep all.
+        reduction (str): "pca" or "truncate".
+    """
+    if mode not in ("int8", "binary"):
+        raise ValueError(f"Unknown quantization mode: {mode}")
+    embeddings = np.load(os.path.join(store_dir, "embeddings.npy"), mmap_mode="r")
+    mean, projection = fit_reduction(embeddings, dims, reduction)
+    out_dims = projection.shape[1] if projection is not None else embeddings.shape[1]
+
+    def reduce(block: np.ndarray) -> np.ndarray:
+        block = np.asarray(block, dtype=np.float32) - mean
+        return block @ projection if projection is not None else block
+
+    os.makedirs(index_dir, exist_ok=True)
+    for name in (CONFIG_FILE, CODES_FILE, SCALES_FILE, MEAN_FILE, PROJECTION_FILE):
+        if os.path.exists(os.path.join(index_dir, name)):
+            os.remove(os.path.join(index_dir, name))  # Files of a previous mode must not be picked up
+    scales = None
+    if mode == "int8":
+        # Symmetric per-dimension scale from the largest magnitude seen
+        max_abs = np.zeros(out_dims, dtype=np.float32)
+        for start in range(0, len(embeddings), SCAN_BLOCK_ROWS):
+            max_abs = np.maximum(max_abs, np.abs(reduce(embeddings[start:start + SCAN_BLOCK_ROWS])).max(axis=0))
+        scales = np.where(max_abs > 0, max_abs / 127.0, 1.0).astype(np.float32)
+        codes = np.lib.format.open_memmap(os.path.join(index_dir, CODES_FILE), mode="w+",
+                                          dtype=np.int8, shape=(len(embeddings), out_dims))
+    else:
+        codes = np.lib.format.open_memmap(os.path.join(index_dir, CODES_FILE), mode="w+",
+                                          dtype=np.uint8, shape=(len(embeddings), (out_dims + 7) // 8))
+
+    for start in range(0, len(embeddings), SCAN_BLOCK_ROWS):
+        block = reduce(embeddings[start:start + SCAN_BLOCK_ROWS])
+        if mode == "int8":
+            codes[start:start + len(block)] = np.clip(np.rint(block / scales), -127, 127).astype(np.int8)
+        else:
+            codes[start:start + len(block)] = np.packbits(block > 0, axis=1)
+    codes.flush()
+
+    np.save(os.path.join(index_dir, MEAN_FILE), mean)
+    if projection is not None:
+        np.save(os.path.join(index_dir, PROJECTION_FILE), projection)
+    if scales is not None:
+        np.save(os.path.join(index_dir, SCALES_FILE), scales)
+    with open(os.path.join(index_dir, CONFIG_FILE), "w", encoding="utf-8") as f:
+        json.dump({"mode": mode, "dims": out_dims, "reduction": reduction if projection is not None else None,
+                   "rows": len(embeddings)}, f, indent=2)
+
+# -------------------- Searching --------------------
+class QuantizedIndex:
+    """
+    Two-stage search: a scan over the quantized codes picks `candidates` rows,
+    which are then re-scored exactly (inner product, equal to cosine ranking for
+    the normalized BGE vectors) against the full-precision memory-mapped embeddings.
+    """
+
+    def __init__(self, index_dir: str, embeddings: np.ndarray):
+        with open(os.path.join(index_dir, CONFIG_FILE), "r", encoding="utf-8") as f:
+            self.config = json.load(f)
+        self.mode = self.config["mode"]
+        self.codes = np.load(os.path.join(index_dir, CODES_FILE), mmap_mode="r")
+        self.mean = np.load(os.path.join(index_dir, MEAN_FILE))
+        projection_path = os.path.join(index_dir, PROJECTION_FILE)
+        self.projection = np.load(projection_path) if os.path.exists(projection_path) else None
+        self.scales = np.load(os.path.join(index_dir, SCALES_FILE)) if self.mode == "int8" else None
+        self.embeddings = embeddings
+        if len(self.codes) != len(embeddings):
+            raise ValueError("Quantized index is out of date with the chunk store; rebuild it")
+
+    @property
+    def nbytes(self) -> int:
+        """Size of the first-pass codes."""
+        return self.codes.nbytes
+
+    def _reduce(self, query: np.ndarray) -> np.ndarray:
+        query = query - self.mean
+        return query @ self.projection if self.projection is not None else query
+
+    def _scan(self, query: np.ndarray, rows: Optional[np.ndarray] = None) -> np.ndarray:
+        """Approximate scores for every row, or for the given sorted rows (higher is better)."""
+        if self.mode == "int8":
+            # Codes are centered; (x - mean) . q ranks like x . q, so the query itself is not centered
+            reduced = query @ self.projection if self.projection is not None else query
+            weights = (reduced * self.scales).astype(np.float32)
+
+            def score(block: np.ndarray) -> np.ndarray:
+                return block.astype(np.float32) @ weights
+        else:
+            bits = np.packbits(self._reduce(query) > 0)
+
+            def score(block: np.ndarray) -> np.ndarray:
+                return -POPCOUNT[np.bitwise_xor(block, bits)].sum(axis=1, dtype=np.int32)
+
+        if rows is not None:
+            return score(self.codes[rows]).astype(np.float32)
+        scores = np.empty(len(self.codes), dtype=np.float32)
+        for start in range(0, len(self.codes), SCAN_BLOCK_ROWS):
+            block = self.codes[start:start + SCAN_BLOCK_ROWS]
+            scores[start:start + len(block)] = score(block)
+        return scores
+
+    def search(self, query: List[float], k: int = 5, candidates: int = 100,
+               rows: Optional[np.ndarray] = None) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Finds the k nearest rows.
+        Args:
+            query (List[float]): Query embedding.
+            k (int): Number of results.
+            candidates (int): Rows kept from the quantized pass for exact re-ranking.
+            rows (Optional[np.ndarray]): Restrict the search to these rows.
+        Returns:
+            tuple: Row IDs and exact scores, best first.
+        """
+        query = np.asarray(query, dtype=np.float32)
+        row_ids = np.sort(rows) if rows is not None else None
+        n = len(row_ids) if row_ids is not None else len(self.codes)
+        k = min(k, n)
+        if k == 0:
+            return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.float32)
+        candidates = min(max(candidates, k), n)
+        scores = self._scan(query, row_ids)
+        shortlist = np.argpartition(-scores, candidates - 1)[:candidates]
+        if row_ids is not None:
+            shortlist = row_ids[shortlist]
+        shortlist.sort()  # Sequential access into the memory-mapped full vectors
+        exact = np.asarray(self.embeddings[shortlist], dtype=np.float32) @ query
+        order = np.argsort(-exact)[:k]
+        return shortlist[order], exact[order]
+
+class QuantizedVectorStore:
+    """Vector store over a quantized index and its chunk store, searched by embedding."""
+
+    def __init__(self, store: ChunkStore, index: QuantizedIndex, candidates: int = 100):
+        self.store = store
+        self.index = index
+        self.candidates = candidates
+
+    def similarity_search_by_vector(self, embedding: List[float], k: int = 5, sources: Optional[List[str]] = None,
+                                    **kwargs) -> List[Document]:
+        """
+        Returns the top-k chunks for a query embedding.
+        Args:
+            embedding (List[float]): Query embedding.
+            k (int): Number of results.
+            sources (Optional[List[str]]): Only search chunks of these source files.
+        Returns:
+            List[Document]: Matching chunks, best first.
+        """
+        partition = self.store.rows_for_sources(sources) if sources else None
+        rows, _ = self.index.search(embedding, k=k, candidates=self.candidates, rows=partition)
+        return self.store.documents(rows.tolist())
+
+def load_quantized_store(output_dir: str, candidates: int = 100) -> QuantizedVectorStore:
+    """
+    Opens the chunk store and quantized index of an ingestion output directory.
+    Args:
+        output_dir (str): Directory holding chunk_store and quantized_index.
+        candidates (int): Rows re-ranked exactly per query.
+    Returns:
+        QuantizedVectorStore: Vector store.
+    """
+    store = open_chunk_store(os.path.join(output_dir, "chunk_store"))
+    if store is None:
+        raise FileNotFoundError(f"No chunk store in {output_dir}; run the ingestion scripts first")
+    index = QuantizedIndex(os.path.join(output_dir, "quantized_index"), store.embeddings)
+    return QuantizedVectorStore(store, index, candidates)
+
+# -------------------- Evaluation --------------------
+def evaluate_recall(index: QuantizedIndex, queries: np.ndarray, k: int = 5, candidates: int = 100) -> float:
+    """
+    Measures recall@k of the quantized search against exact search.
+    Args:
+        index (QuantizedIndex): Index to evaluate.
+        queries (np.ndarray): Query embeddings (q, d).
+        k (int): Number of results per query.
+        candidates (int): Rows re-ranked exactly per query.
+    Returns:
+        float: Mean fraction of the exact top-k that the index returns.
+    """
+    hits = 0
+    for query in np.asarray(queries, dtype=np.float32):
+        exact = np.empty(len(index.embeddings), dtype=np.float32)
+        for start in range(0, len(exact), SCAN_BLOCK_ROWS):
+            exact[start:start + SCAN_BLOCK_ROWS] = np.asarray(
+                index.embeddings[start:start + SCAN_BLOCK_ROWS], dtype=np.float32) @ query
+        truth = set(np.argpartition(-exact, k - 1)[:k].tolist())
+        rows, _ = index.search(query, k=k, candidates=candidates)
+        hits += len(truth & set(rows.tolist()))
+    return hits / (k * len(queries))
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build or evaluate a quantized first-pass index.")
+    parser.add_argument("output_dir", help="Ingestion output directory (holding chunk_store)")
+    parser.add_argument("--mode", choices=("int8", "binary"), default="int8")
+    parser.add_argument("--dims", type=int, default=None, help="Reduced dimension (default: keep all)")
+    parser.add_argument("--reduction", choices=("pca", "truncate"), default="pca")
+    parser.add_argument("--queries", help="Text file with one evaluation query per line")
+    parser.add_argument("--k", type=int, default=5)
+    parser.add_argument("--candidates", type=int, default=100)
+    args = parser.parse_args()
+
+    index_dir = os.path.join(args.output_dir, "quantized_index")
+    build_quantized_index(os.path.join(args.output_dir, "chunk_store"), index_dir,
+                          mode=args.mode, dims=args.dims, reduction=args.reduction)
+    vectorstore = load_quantized_store(args.output_dir, args.candidates)
+    full_bytes = vectorstore.store.embeddings.nbytes
+    print(f"✅ {args.mode} index: {vectorstore.index.nbytes / 1e6:.1f} MB "
+          f"({full_bytes / vectorstore.index.nbytes:.1f}x smaller than float32)")
+
+    if args.queries:
+        from langchain_huggingface import HuggingFaceEmbeddings
+        with open(args.queries, "r", encoding="utf-8") as f:
+            questions = [line.strip() for line in f if line.strip()]
+        embedding_model = HuggingFaceEmbeddings(model_name="BAAI/bge-base-en-v1.5")
+        recall = evaluate_recall(vectorstore.index, np.array(embedding_model.embed_documents(questions)),
+                                 k=args.k, candidates=args.candidates)
+        print(f"📊 recall@{args.k} over {len(questions)} queries: {recall:.3f}")
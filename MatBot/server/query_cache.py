@@ -0,0 +1,151 @@
+import os
+import threading
+from collections import OrderedDict
+from typing import List, Optional
+
+import numpy as np
+
+from embedding_cache import DEFAULT_CACHE_DIR, EmbeddingCache, text_key
+
+DEFAULT_QUERY_CACHE_DIR = os.path.join(DEFAULT_CACHE_DIR, "queries")
+DEFAULT_MAX_ENTRIES = 1024
+DEFAULT_DISK_MAX_BYTES = 64 << 20  # ~20k BGE-base query vectors
+
+class QueryEmbeddingCache:
+    """
+    Wraps a langchain embedding model so repeated queries skip the encoder.
+
+    Queries are keyed on their normalized text (see embedding_cache.normalize_text).
+    The first tier is a bounded in-process LRU; misses fall through to an optional
+    EmbeddingCache on disk, which survives restarts, and only then to the model.
+    All methods are thread-safe. Anything else is forwarded to the wrapped model.
+    """
+
+    def __init__(self, embeddings, max_entries: int = DEFAULT_MAX_ENTRIES,
+                 disk_cache: Optional[EmbeddingCache] = None):
+        self.embeddings = embeddings
+        self.max_entries = max_entries
+        self.disk_cache = disk_cache
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self._entries: "OrderedDict[str, np.ndarray]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __getattr__(self, name):
+        return getattr(self.embeddings, name)
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def _remember(self, key: str, vector: np.ndarray) -> None:
+        with self._lock:
+            self._entries[key] = vector
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def embed_query(self, text: str) -> List[float]:
+        """
+        Embeds a query, from memory or disk when it has been seen before.
+        Args:
+            text (str): Query text.
+        Returns:
+            List[float]: Query embedding.
+        """
+        key = text_key(text)
+        with self._lock:
+            vector = self._entries.get(key)
+            if vector is not None:
+                self._entries.move_to_end(key)
+                self.memory_hits += 1
+                return vector.tolist()
+
+        vector = self.disk_cache.get(text) if self.disk_cache is not None else None
+        if vector is not None:
+            with self._lock:
+                self.disk_hits += 1
+        else:
+            vector = np.asarray(self.embeddings.embed_query(text), dtype=np.float32)
+            with self._lock:
+                self.misses += 1
+            if self.disk_cache is not None:
+                self.disk_cache.put(text, vector)
+        self._remember(key, vector)
+        return vector.tolist()
+
+    def embed_queries(self, texts: List[str]) -> List[List[float]]:
+        """
+        Embeds several queries, running the model once on all cache misses.
+        The misses go through embed_documents, which embeds exactly like embed_query
+        for the BGE backends used here (no query instruction).
+        Args:
+            texts (List[str]): Query texts.
+        Returns:
+            List[List[float]]: One embedding per query.
+        """
+        keys = [text_key(text) for text in texts]
+        vectors: List[Optional[np.ndarray]] = [None] * len(texts)
+        with self._lock:
+            for i, key in enumerate(keys):
+                if key in self._entries:
+                    self._entries.move_to_end(key)
+                    vectors[i] = self._entries[key]
+                    self.memory_hits += 1
+
+        missing = [i for i, vector in enumerate(vectors) if vector is None]
+        if missing and self.disk_cache is not None:
+            for i, vector in zip(missing, self.disk_cache.get_many([texts[i] for i in missing])):
+                if vector is not None:
+                    vectors[i] = vector
+                    with self._lock:
+                        self.disk_hits += 1
+            missing = [i for i in missing if vectors[i] is None]
+
+        if missing:
+            # Embed each distinct missing query once
+            firsts = {}
+            for i in missing:
+                firsts.setdefault(keys[i], i)
+            computed = np.asarray(self.embeddings.embed_documents([texts[i] for i in firsts.values()]),
+                                  dtype=np.float32)
+            if self.disk_cache is not None:
+                self.disk_cache.put_many([texts[i] for i in firsts.values()], computed)
+            by_key = dict(zip(firsts, computed))
+            with self._lock:
+                self.misses += len(missing)
+            for i in missing:
+                vectors[i] = by_key[keys[i]]
+
+        for key, vector in zip(keys, vectors):
+            self._remember(key, vector)
+        return [vector.tolist() for vector in vectors]
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        """Documents are not cached here; see embedding_cache.CachedEmbeddings for that."""
+        return self.embeddings.embed_documents(texts)
+
+    def stats(self) -> dict:
+        """Returns hit/miss counters per tier and the number of entries in memory."""
+        with self._lock:
+            lookups = self.memory_hits + self.disk_hits + self.misses
+            return {"memory_hits": self.memory_hits, "disk_hits": self.disk_hits, "misses": self.misses,
+                    "hit_rate": (lookups - self.misses) / lookups if lookups else 0.0,
+                    "entries": len(self._entries)}
+
+def cache_query_embeddings(embeddings, model_name: str, max_entries: int = DEFAULT_MAX_ENTRIES,
+                           cache_dir: Optional[str] = DEFAULT_QUERY_CACHE_DIR,
+                           disk_max_bytes: int = DEFAULT_DISK_MAX_BYTES) -> QueryEmbeddingCache:
+    """
+    Wraps an embedding model in a query cache.
+    Args:
+        embeddings: Langchain embedding model.
+        model_name (str): Model identifier, which namespaces the disk tier.
+        max_entries (int): Queries kept in memory.
+        cache_dir (Optional[str]): Directory of the disk tier; None keeps the cache in memory only.
+        disk_max_bytes (int): Size limit of the disk tier.
+    Returns:
+        QueryEmbeddingCache: Cached embedding model.
+    """
+    disk_cache = EmbeddingCache(cache_dir, model_name, disk_max_bytes) if cache_dir else None
+    return QueryEmbeddingCache(embeddings, max_entries, disk_cache)
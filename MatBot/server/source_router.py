@@ -0,0 +1,132 @@
+import os
+import re
+import json
+import argparse
+from typing import Iterable, List, Optional, Sequence, Tuple
+
+from chunk_store import open_chunk_store
+
+# Keyword rules: (pattern, manuals), matched case-insensitively on the raw query. Terms are kept
+# specific to one manual; generic words ("matrix", "mean", "figure") would route most questions.
+DEFAULT_RULES: List[Tuple[str, List[str]]] = [
+    (r"\b(classdef|class(es)?|handle class|inherit\w*|superclass|subclass|object[- ]oriented|oop)\b",
+     ["matlab_oop.pdf"]),
+    (r"\b(gui|guide|app ?designer|uifigure|uicontrol|uimenu|callbacks?|push ?button|slider|dialog box)\b",
+     ["creating_guis.pdf"]),
+    (r"\b(plot\w*|legend|colormap|colorbar|surf|mesh|subplot|histogram|scatter|visuali[sz]\w*)\b",
+     ["creating_plots.pdf", "visualize.pdf"]),
+    (r"\b(import(ing)? data|export(ing)? data|readtable|writetable|readmatrix|csv|excel|xlsread|spreadsheet|"
+     r"fopen|fread|fscanf|textscan)\b", ["import_export.pdf"]),
+    (r"\b(mat-?file format|mat-?file|matfile|level 5|mxarray)\b", ["matfile_format.pdf"]),
+    (r"\b(ode\d+\w*|differential equations?|ivp|stiff|solver options|odeset)\b", ["ode_suite.pdf"]),
+    (r"\b(linear algebra|eig|eigenvalues?|linsolve|determinant|interpolat\w*|interp1|polynomials?|"
+     r"numerical integration|fzero|fminsearch)\b", ["matlab_math.pdf"]),
+    (r"\b(data analysis|descriptive statistics|smoothing|fft|fourier|missing data|preprocess\w*)\b",
+     ["data_analysis.pdf"]),
+    (r"\b(mex|c\+\+|fortran|java|python|\.net|com server|matlab engine|engine api|external interfaces?)\b",
+     ["matlab_external.pdf", "matlab_apiref.pdf"]),
+    (r"\b(desktop|command window|preferences|startup\.m|search path|addpath)\b", ["matlab_env.pdf"]),
+    (r"\b(support packages?|hardware support|arduino|raspberry ?pi|webcam)\b", ["supportpkg.pdf"]),
+    (r"\b(release notes?|what'?s new|introduced in|r20\d\d[ab]|compatibility considerations?)\b", ["rn.pdf"]),
+]
+# Function reference pages (linsolve, ode45, plot, ...) live here, so every rule-scoped search includes it
+REFERENCE_SOURCES = ["matlab_ref.pdf"]
+MIN_NAME_LENGTH = 4  # Shorter stems ("rn.pdf") only match with their extension
+
+class SourceRouter:
+    """
+    Picks the manuals a query should be searched in, before any embedding work.
+
+    A query that names an indexed file is scoped to it. Otherwise every keyword
+    rule that matches contributes its manuals; when more than `max_sources`
+    manuals qualify (a broad question), or none does, the router returns None
+    and retrieval searches the whole corpus. A rule-scoped search also covers
+    the reference manuals, where the function pages are. Rules naming manuals
+    that are not indexed are ignored, so a scoped search never comes back empty
+    by accident.
+    """
+
+    def __init__(self, sources: Iterable[str], rules: Sequence[Tuple[str, List[str]]] = DEFAULT_RULES,
+                 max_sources: int = 3, reference_sources: Sequence[str] = REFERENCE_SOURCES):
+        self.sources = sorted(set(sources))
+        self.max_sources = max_sources
+        indexed = set(self.sources)
+        self.reference_sources = [source for source in reference_sources if source in indexed]
+        self.rules = [(re.compile(pattern, re.IGNORECASE), [source for source in manuals if source in indexed])
+                      for pattern, manuals in rules]
+        self.rules = [(pattern, manuals) for pattern, manuals in self.rules if manuals]
+        self._names = [(self._name_pattern(source), source) for source in self.sources]
+
+    @staticmethod
+    def _name_pattern(source: str):
+        """
+        Matches a file name as users type it: "matlab_oop.pdf", "matlab_oop" or "matlab oop".
+        The bare stem only counts for multi-word names ("visualize" or "1" are ordinary words
+        in a question); other files must be named with their extension.
+        """
+        stem, extension = os.path.splitext(source)
+        name = re.escape(stem).replace(r"_", r"[_ ]")
+        if len(stem) >= MIN_NAME_LENGTH and "_" in stem and not stem.replace("_", "").isdigit():
+            return re.compile(r"\b" + name + r"(\.\w+)?\b", re.IGNORECASE)
+        return re.compile(r"(?<![\w.])" + name + re.escape(extension) + r"\b", re.IGNORECASE)
+
+    def route(self, query: str) -> Optional[List[str]]:
+        """
+        Selects source partitions for a query.
+        Args:
+            query (str): User question.
+        Returns:
+            Optional[List[str]]: Source files to search, or None to search everything.
+        """
+        named = [source for pattern, source in self._names if pattern.search(query)]
+        if named:
+            return named
+
+        selected: List[str] = []
+        for pattern, manuals in self.rules:
+            if pattern.search(query):
+                selected.extend(source for source in manuals if source not in selected)
+        if not selected or len(selected) > self.max_sources:
+            return None
+        return selected + [source for source in self.reference_sources if source not in selected]
+
+def indexed_sources(output_dir: str) -> Optional[List[str]]:
+    """
+    Lists the source files of an ingestion output directory.
+    Args:
+        output_dir (str): Directory holding chunk_store or manifest.json.
+    Returns:
+        Optional[List[str]]: Source file names, or None if the index records none.
+    """
+    store = open_chunk_store(os.path.join(output_dir, "chunk_store"))
+    if store is not None:
+        return store.sources
+    manifest_path = os.path.join(output_dir, "manifest.json")
+    if os.path.exists(manifest_path):
+        with open(manifest_path, "r", encoding="utf-8") as f:
+            return sorted(json.load(f)["files"])
+    return None
+
+def load_source_router(output_dir: str, max_sources: int = 3) -> Optional[SourceRouter]:
+    """
+    Builds the router for an ingestion output directory.
+    Args:
+        output_dir (str): Ingestion output directory.
+        max_sources (int): Most manuals a routed query may be scoped to.
+    Returns:
+        Optional[SourceRouter]: Router, or None when the indexed sources are unknown.
+    """
+    sources = indexed_sources(output_dir)
+    return SourceRouter(sources, max_sources=max_sources) if sources else None
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Show which manuals questions are routed to.")
+    parser.add_argument("output_dir", help="Ingestion output directory")
+    parser.add_argument("questions", nargs="+")
+    args = parser.parse_args()
+
+    router = load_source_router(args.output_dir)
+    if router is None:
+        raise SystemExit(f"No chunk store or manifest in {args.output_dir}")
+    for question in args.questions:
+        print(f"🧭 {question!r} -> {router.route(question) or 'all sources'}")
@@ -0,0 +1,123 @@
+import os
+import threading
+from typing import Optional
+
+import torch
+
+DRAFT_MODEL = os.getenv("MATBOT_DRAFT_MODEL")  # Unset: speculative decoding is off
+NUM_ASSISTANT_TOKENS = int(os.getenv("MATBOT_ASSISTANT_TOKENS", "5"))
+
+class SpeculativeDecoder:
+    """
+    Runs generate() with a small draft model proposing tokens for the target model.
+
+    Each step the draft greedily proposes `num_assistant_tokens` tokens and the
+    target scores all of them in one forward pass, keeping the longest prefix it
+    agrees with plus one token of its own. With greedy settings the output is
+    identical to plain decoding; with sampling, the accepted tokens follow the
+    target's distribution. Both models must share the tokenizer. Assisted
+    generation takes one prompt at a time.
+
+    Forward passes are counted on the generating thread only, so other
+    generations sharing the target model do not skew the statistics.
+    """
+
+    def __init__(self, model, draft_model, num_assistant_tokens: int = NUM_ASSISTANT_TOKENS):
+        self.model = model
+        self.draft_model = draft_model
+        self.num_assistant_tokens = num_assistant_tokens
+        draft_model.generation_config.num_assistant_tokens = num_assistant_tokens
+        draft_model.generation_config.num_assistant_tokens_schedule = "constant"
+        self.generations = 0
+        self.tokens = 0
+        self.target_steps = 0
+        self.drafted = 0
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        model.register_forward_hook(self._count("target_steps"))
+        draft_model.register_forward_hook(self._count("drafted"))  # One proposed token per draft forward
+
+    def _count(self, counter: str):
+        def hook(module, inputs, output):
+            counts = getattr(self._local, "counts", None)
+            if counts is not None:
+                counts[counter] += 1
+        return hook
+
+    def generate(self, input_ids: torch.Tensor, **generation_kwargs) -> torch.Tensor:
+        """
+        Generates with the draft model assisting.
+        Args:
+            input_ids (torch.Tensor): Token ids of one prompt, shape (1, n).
+            **generation_kwargs: Passed to the target model's generate().
+        Returns:
+            torch.Tensor: Prompt and generated token ids.
+        """
+        self._local.counts = {"target_steps": 0, "drafted": 0}
+        try:
+            output = self.model.generate(input_ids=input_ids, assistant_model=self.draft_model, **generation_kwargs)
+        finally:
+            counts, self._local.counts = self._local.counts, None
+        with self._lock:
+            self.generations += 1
+            self.tokens += output.shape[1] - input_ids.shape[1]
+            self.target_steps += counts["target_steps"]
+            self.drafted += counts["drafted"]
+        return output
+
+    def stats(self) -> dict:
+        """
+        Returns acceptance statistics over all generations so far.
+        Every target step emits the accepted draft tokens plus one of its own, so
+        accepted = tokens - target steps. tokens_per_step is the speedup over plain
+        decoding when a draft forward costs nothing; the measured speedup is lower.
+        """
+        accepted = max(self.tokens - self.target_steps, 0)
+        return {"generations": self.generations, "tokens": self.tokens, "target_steps": self.target_steps,
+                "drafted": self.drafted, "accepted": accepted,
+                "acceptance_rate": accepted / self.drafted if self.drafted else 0.0,
+                "tokens_per_step": self.tokens / self.target_steps if self.target_steps else 0.0}
+
+def load_draft_model(draft_model_id: str, model, tokenizer):
+    """
+    Loads a draft model next to the target model.
+    Args:
+        draft_model_id (str): Draft model identifier (a small model with the target's tokenizer).
+        model: Target model; the draft goes on its device (fp16 on GPU, the CPU backend's mode and
+            the target's thread count on CPU).
+        tokenizer: Target tokenizer.
+    Returns:
+        The draft model in eval mode.
+    Raises:
+        ValueError: If the draft's vocabulary differs from the target's.
+    """
+    from transformers import AutoModelForCausalLM, AutoTokenizer
+
+    draft_tokenizer = AutoTokenizer.from_pretrained(draft_model_id, use_fast=True)
+    if draft_tokenizer.get_vocab() != tokenizer.get_vocab():
+        raise ValueError(f"{draft_model_id} does not share the target model's tokenizer")
+    if model.device.type == "cpu":
+        from cpu_backend import load_cpu_model
+        return load_cpu_model(draft_model_id, threads=torch.get_num_threads())[0]
+    draft_model = AutoModelForCausalLM.from_pretrained(draft_model_id, torch_dtype=torch.float16)
+    return draft_model.to(model.device).eval()
+
+def load_speculative_decoder(model_pipeline, draft_model_id: Optional[str] = DRAFT_MODEL,
+                             num_assistant_tokens: int = NUM_ASSISTANT_TOKENS) -> Optional[SpeculativeDecoder]:
+    """
+    Sets up speculative decoding for a text generation pipeline.
+    Args:
+        model_pipeline: Text generation pipeline.
+        draft_model_id (Optional[str]): Draft model identifier (default: $MATBOT_DRAFT_MODEL).
+        num_assistant_tokens (int): Tokens the draft proposes per step (default: $MATBOT_ASSISTANT_TOKENS or 5).
+    Returns:
+        Optional[SpeculativeDecoder]: The decoder, or None when no draft model is configured or it cannot be used.
+    """
+    if not draft_model_id:
+        return None
+    try:
+        draft_model = load_draft_model(draft_model_id, model_pipeline.model, model_pipeline.tokenizer)
+        return SpeculativeDecoder(model_pipeline.model, draft_model, num_assistant_tokens)
+    except (OSError, RuntimeError, ValueError) as e:
+        print(f"⚠ Speculative decoding disabled: {e}")
+        return None